@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+""" Compares HabiticaService request throughput with and without connection
+pooling, against a local stand-in Habitica server.
+
+Usage::
+
+    python benchmarks/connection_pool.py --requests 500
+
+The unpooled figures reproduce the previous behaviour of calling the
+module-level ``requests.get`` helper, which opens a new connection for every
+request. The pooled figures use a `HabiticaService`, which reuses keep-alive
+connections from its own session.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+import argparse
+import timeit
+
+import requests
+
+from scriptabit import HabiticaService, RateLimiter
+from scriptabit.tests.fake_habitica_server import FakeHabiticaServer
+
+
+def unpooled(base_url, count):
+    """ Sends `count` requests, each on a new connection. """
+    for _ in range(count):
+        response = requests.get(base_url + 'status', timeout=10)
+        response.raise_for_status()
+
+
+def pooled(base_url, count):
+    """ Sends `count` requests through a single HabiticaService. The rate
+    limiter is effectively disabled, so that only pooling is measured. """
+    hs = HabiticaService(
+        {},
+        base_url,
+        rate_limiter=RateLimiter(rate=1e9, capacity=count))
+    try:
+        for _ in range(count):
+            assert hs.is_server_up()
+    finally:
+        hs.close()
+
+
+def main():
+    """ Runs the benchmark and prints requests per second. """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--requests',
+        type=int,
+        default=500,
+        help='Number of requests per run')
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Number of runs; the best run is reported')
+    parser.add_argument(
+        '--url',
+        default=None,
+        help='''Base URL of an already running stand-in server. If omitted, a
+server is started in-process.''')
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        server = FakeHabiticaServer().start()
+        base_url = server.base_url
+
+    try:
+        print('{0} requests per run against {1}'.format(
+            args.requests, base_url))
+        results = {}
+        for name, func in (('unpooled', unpooled), ('pooled', pooled)):
+            best = min(timeit.repeat(
+                lambda: func(base_url, args.requests),
+                number=1,
+                repeat=args.repeat))
+            results[name] = args.requests / best
+            print('{0:>10}: {1:10.1f} requests/s'.format(name, results[name]))
+
+        print('{0:>10}: {1:10.2f}x'.format(
+            'speedup', results['pooled'] / results['unpooled']))
+    finally:
+        if server:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
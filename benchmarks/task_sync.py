@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+""" Measures how `TaskSync`, `TaskMap` and `HabiticaTask` scale, using
+synthetic task pairs held by in-memory task services.
+
+Usage::
+
+    python benchmarks/task_sync.py --sizes 1000 10000 100000
+    python benchmarks/task_sync.py --update-baseline
+    python benchmarks/task_sync.py --check
+
+Each size is run ``--repeat`` times, and the best figures are kept.
+Each run builds `size` mapped source/destination task pairs, then applies
+churn to them: new source tasks, updated and completed source tasks, deleted
+source tasks, and orphaned mappings (neither task exists). The remaining
+tasks are unchanged since the last sync.
+
+The time of each phase is reported, with the peak memory allocated during
+each stage the benchmark controls (setup, synchronise, map save, map load).
+The sync phases run inside one `synchronise` call, so they share its memory
+peak. Memory is measured with `tracemalloc`, and is not reported if that is
+unavailable.
+
+With ``--check``, the run fails if any time or memory figure is more than
+``--tolerance`` above the stored baseline for the same size.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from scriptabit import (
+    HabiticaTask,
+    SyncStatus,
+    TaskMap,
+    TaskService,
+    TaskSync,
+)
+from scriptabit.tests.task_implementations import MockTask
+
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'task_sync_baseline.json')
+
+# Regressions smaller than these (seconds, MiB) are treated as noise.
+NOISE_FLOOR = {'time': 0.05, 'memory': 0.5}
+
+
+class InMemoryTaskService(TaskService):
+    """ Source task service holding `MockTask` instances. """
+
+    def __init__(self, tasks):
+        super().__init__()
+        self.tasks = tasks
+
+    def get_all_tasks(self):
+        return self.tasks
+
+    def persist_tasks(self, tasks):
+        pass
+
+    def _create_task(self, src=None):
+        raise NotImplementedError
+
+
+class InMemoryHabiticaTaskService(TaskService):
+    """ Destination task service holding `HabiticaTask` instances. New tasks
+    are given sequential IDs. """
+
+    def __init__(self, tasks):
+        super().__init__()
+        self.tasks = tasks
+        self.written = 0
+        self.__next_id = 0
+
+    def get_all_tasks(self):
+        return self.tasks
+
+    def persist_tasks(self, tasks):
+        self.written = len(
+            [t for t in tasks if t.status != SyncStatus.unchanged])
+
+    def _create_task(self, src=None):
+        self.__next_id += 1
+        return HabiticaTask({'_id': 'new-{0}'.format(self.__next_id)})
+
+
+def build(size, churn, last_sync):
+    """ Builds the synthetic services and task map.
+
+    Args:
+        size (int): The number of mapped task pairs.
+        churn (dict): The fraction of `size` for each kind of churn.
+        last_sync (datetime): The last sync time.
+
+    Returns:
+        tuple: The source service, destination service, and task map.
+    """
+    old = last_sync - timedelta(days=1)
+    new = last_sync + timedelta(minutes=1)
+    counts = {k: int(size * v) for k, v in churn.items()}
+
+    src_tasks = []
+    dst_tasks = []
+    task_map = TaskMap()
+    changed = counts['updated'] + counts['completed']
+    removed = counts['deleted'] + counts['orphaned']
+    for i in range(size):
+        src = MockTask(
+            'src-{0}'.format(i),
+            name='Task {0}'.format(i),
+            description='Description of task {0}'.format(i),
+            status=SyncStatus.unchanged,
+            last_modified=new if i < changed else old)
+        dst = HabiticaTask({
+            '_id': 'dst-{0}'.format(i),
+            'text': src.name,
+            'notes': src.description,
+        })
+        dst.status = SyncStatus.unchanged
+        task_map.map(src, dst)
+
+        if i < counts['updated']:
+            src.name += ' (edited)'
+        elif i < changed:
+            src.completed = True
+
+        if i >= size - removed:
+            # deleted sources keep their destination; orphans lose both
+            if i < size - counts['orphaned']:
+                dst_tasks.append(dst)
+            continue
+
+        src_tasks.append(src)
+        dst_tasks.append(dst)
+
+    for i in range(counts['new']):
+        src_tasks.append(MockTask(
+            'src-new-{0}'.format(i),
+            name='New task {0}'.format(i),
+            status=SyncStatus.new,
+            last_modified=new))
+
+    return (
+        InMemoryTaskService(src_tasks),
+        InMemoryHabiticaTaskService(dst_tasks),
+        task_map)
+
+
+class Stage(object):
+    """ Times a stage, and measures the memory allocated during it. """
+
+    def __init__(self, results, name):
+        self.__results = results
+        self.__name = name
+        self.__start = None
+
+    def __enter__(self):
+        if tracemalloc:
+            tracemalloc.start()
+        self.__start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.__results['time'][self.__name] = time.time() - self.__start
+        if tracemalloc:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.__results['memory'][self.__name] = peak / 1024 / 1024
+
+
+def run(size, churn):
+    """ Runs the benchmark for one size.
+
+    Returns:
+        dict: The phase times (seconds), stage memory peaks (MiB), and the
+        sync stats.
+    """
+    results = {'time': {}, 'memory': {}}
+    last_sync = datetime.now(tz=pytz.utc) - timedelta(hours=1)
+
+    with Stage(results, 'setup'):
+        src_service, dst_service, task_map = build(size, churn, last_sync)
+
+    with Stage(results, 'synchronise'):
+        stats = TaskSync(
+            src_service,
+            dst_service,
+            task_map,
+            last_sync=last_sync).synchronise(clean_orphans=True)
+    for phase, seconds in stats.phases.items():
+        results['time'][phase] = seconds
+
+    fd, filename = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        with Stage(results, 'map_save'):
+            task_map.persist(filename)
+        with Stage(results, 'map_load'):
+            TaskMap(filename)
+    finally:
+        os.remove(filename)
+
+    results['stats'] = stats.as_dict()
+    results['written'] = dst_service.written
+    return results
+
+
+def best_of(size, churn, repeat):
+    """ Runs the benchmark `repeat` times, keeping the best figure for each
+    time and memory measurement.
+
+    Returns:
+        dict: The best results, as returned by `run`.
+    """
+    best = run(size, churn)
+    for _ in range(repeat - 1):
+        result = run(size, churn)
+        for metric in ('time', 'memory'):
+            for name, value in result[metric].items():
+                best[metric][name] = min(best[metric][name], value)
+    return best
+
+
+def check(results, baseline, tolerance):
+    """ Compares results with a baseline.
+
+    Returns:
+        list: Descriptions of the figures that regressed.
+    """
+    regressions = []
+    for size, result in results.items():
+        base = baseline.get(size, None)
+        if not base:
+            continue
+        for metric in ('time', 'memory'):
+            for name, value in result[metric].items():
+                expected = base.get(metric, {}).get(name, None)
+                if expected is None:
+                    continue
+                # ignore noise in tiny figures
+                limit = max(
+                    expected * (1 + tolerance),
+                    expected + NOISE_FLOOR[metric])
+                if value > limit:
+                    regressions.append(
+                        '{0} tasks: {1} {2} {3:.3f} > {4:.3f}'.format(
+                            size, name, metric, value, limit))
+    return regressions
+
+
+def report(size, result):
+    """ Prints the results for one size. """
+    stats = result['stats']
+    print('{0} task pairs: {1} created, {2} updated, {3} completed, '
+          '{4} deleted, {5} skipped, {6} written'.format(
+              size, stats['created'], stats['updated'], stats['completed'],
+              stats['deleted'], stats['skipped'], result['written']))
+    for name, seconds in result['time'].items():
+        memory = result['memory'].get(name, None)
+        print('  {0:>12}: {1:8.3f}s{2}'.format(
+            name,
+            seconds,
+            '  {0:8.1f} MiB peak'.format(memory) if memory is not None
+            else ''))
+
+
+def main():
+    """ Runs the benchmarks. """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        '--sizes',
+        type=int,
+        nargs='+',
+        default=[1000, 10000],
+        help='Numbers of task pairs to benchmark')
+    for name, default in (
+            ('new', 0.05),
+            ('updated', 0.1),
+            ('completed', 0.05),
+            ('deleted', 0.05),
+            ('orphaned', 0.01)):
+        parser.add_argument(
+            '--' + name,
+            type=float,
+            default=default,
+            help='Fraction of the tasks that are {0}'.format(name))
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Number of runs per size; the best figures are reported')
+    parser.add_argument(
+        '--baseline',
+        default=DEFAULT_BASELINE,
+        help='The baseline file')
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help='Fail if the results regress past the baseline')
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.5,
+        help='Allowed fractional regression before --check fails')
+    parser.add_argument(
+        '--update-baseline',
+        action='store_true',
+        help='Store the results as the baseline')
+    args = parser.parse_args()
+
+    churn = {
+        'new': args.new,
+        'updated': args.updated,
+        'completed': args.completed,
+        'deleted': args.deleted,
+        'orphaned': args.orphaned,
+    }
+
+    results = {}
+    for size in args.sizes:
+        results[str(size)] = best_of(size, churn, max(1, args.repeat))
+        report(size, results[str(size)])
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+        for size, result in results.items():
+            baseline[size] = {
+                'time': result['time'],
+                'memory': result['memory'],
+            }
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print('Baseline written to', args.baseline)
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print('No baseline found at', args.baseline)
+            return 1
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = check(results, baseline, args.tolerance)
+        for r in regressions:
+            print('REGRESSION:', r)
+        if regressions:
+            return 1
+        print('No regressions against', args.baseline)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,7 @@
 """
 
 from .authentication import load_habitica_authentication_credentials
+from .bulk_delete import BulkDelete
 from .configuration import (
     get_configuration,
     get_config_file,
@@ -16,6 +17,8 @@ from .habitica_service import HabiticaService, HabiticaTaskTypes
 from .habitica_task import HabiticaTask
 from .habitica_task_service import HabiticaTaskService
 from .iplugin import IPlugin
+from .latency import LatencyRecorder
+from .rate_limiter import RateLimiter
 from .scriptabit import (
     start_scriptabit,
     start_banking,
@@ -33,6 +36,9 @@ from .task import (
     ChecklistItem,
     SyncStatus
 )
+from .sqlite_task_map import SqliteTaskMap
+from .tag_usage import TagUsage
+from .sync_state import SyncState
 from .task_map import TaskMap
 from .task_service import TaskService
 from .task_sync import TaskSync
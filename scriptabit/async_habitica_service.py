@@ -0,0 +1,609 @@
+# -*- coding: utf-8 -*-
+""" Asyncio Habitica API service interface.
+
+An asyncio counterpart to `scriptabit.HabiticaService`, with the same method
+surface implemented as coroutines on top of `aiohttp`. Many requests can be in
+flight at once, while a shared `RateLimiter` keeps the total request rate
+within the Habitica limits::
+
+    async with AsyncHabiticaService(headers, base_url) as ahs:
+        await asyncio.gather(*[ahs.score_task(t) for t in tasks])
+
+Pass ``rate_limiter=hs.rate_limiter`` to share the quota with a synchronous
+`HabiticaService` in the same process.
+
+This module requires Python 3.5 or later and the optional ``aiohttp``
+dependency (``pip install scriptabit[async]``), so it is not imported by the
+`scriptabit` package itself.
+"""
+
+import asyncio
+import logging
+
+import requests
+
+from .errors import ArgumentOutOfRangeError
+from .habitica_service import HabiticaTaskTypes
+from .rate_limiter import RateLimiter
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+class AsyncHabiticaService(object):
+    """ Asyncio Habitica API service interface.
+
+    The underlying `aiohttp.ClientSession` is created on first use, inside the
+    running event loop, and must be released with `close` (or by using the
+    service as an async context manager).
+    """
+    def __init__(
+            self,
+            headers,
+            base_url,
+            timeout=10,
+            limit=10,
+            limit_per_host=10,
+            rate_limiter=None,
+            max_retries=3):
+        """
+        Args:
+            headers (dict): HTTP headers.
+            base_url (str): The base URL for requests.
+            timeout (float): Seconds to wait for the server before timing out
+                API calls.
+            limit (int): The maximum number of simultaneous connections.
+            limit_per_host (int): The maximum number of simultaneous
+                connections to one host.
+            rate_limiter (RateLimiter): The rate limiter applied to every
+                request. A default `RateLimiter` is created if not supplied.
+            max_retries (int): The number of times a request is retried after
+                a 429 (Too Many Requests) response.
+
+        Raises:
+            ImportError: aiohttp is not installed.
+        """
+        if aiohttp is None:
+            raise ImportError(
+                'AsyncHabiticaService requires aiohttp. '
+                'Install it with: pip install scriptabit[async]')
+
+        self.__headers = headers
+        self.__base_url = base_url
+        self.__timeout = timeout
+        self.__limit = limit
+        self.__limit_per_host = limit_per_host
+        self.__rate_limiter = rate_limiter or RateLimiter()
+        self.__max_retries = max_retries
+        self.__session = None
+
+    @property
+    def rate_limiter(self):
+        """ The rate limiter shared by all requests from this service. """
+        return self.__rate_limiter
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """ Closes the pooled connections held by the service. """
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    def __get_session(self):
+        """ Gets the client session, creating it on first use. """
+        if self.__session is None:
+            self.__session = aiohttp.ClientSession(
+                headers=self.__headers,
+                timeout=aiohttp.ClientTimeout(total=self.__timeout),
+                connector=aiohttp.TCPConnector(
+                    limit=self.__limit,
+                    limit_per_host=self.__limit_per_host))
+        return self.__session
+
+    async def __request(self, method, command, **kwargs):
+        """Utility wrapper around a rate limited HTTP request.
+
+        The response body is read before the connection is released, so the
+        returned response can be inspected and decoded afterwards."""
+        url = self.__base_url + command
+        attempt = 0
+        while True:
+            wait = self.__rate_limiter.reserve()
+            if wait > 0:
+                logging.getLogger(__name__).debug(
+                    'Rate limited: waiting %.2f seconds', wait)
+                await asyncio.sleep(wait)
+
+            logging.getLogger(__name__).debug('%s %s', method, url)
+            try:
+                async with self.__get_session().request(
+                        method,
+                        url,
+                        **kwargs) as response:
+                    await response.read()
+            except Exception:
+                self.__rate_limiter.update({})
+                raise
+
+            self.__rate_limiter.update(response.headers)
+
+            if response.status != requests.codes.too_many_requests or \
+                    attempt >= self.__max_retries:
+                return response
+
+            attempt += 1
+            pause = self.__rate_limiter.back_off(response.headers)
+            logging.getLogger(__name__).warning(
+                '%s %s: too many requests, retrying in %.1f seconds',
+                method,
+                url,
+                pause)
+
+    async def __delete(self, command, params=None):
+        """Utility wrapper around a HTTP DELETE"""
+        return await self.__request('DELETE', command, params=params)
+
+    async def __get(self, command, params=None):
+        """Utility wrapper around a HTTP GET"""
+        return await self.__request('GET', command, params=params)
+
+    async def __put(self, command, data):
+        """Utility wrapper around a HTTP PUT"""
+        return await self.__request('PUT', command, data=data)
+
+    async def __post(self, command, data=None):
+        """Utility wrapper around a HTTP POST"""
+        return await self.__request('POST', command, json=data)
+
+    @staticmethod
+    async def __data(response):
+        """ Raises for error responses, then returns the response data. """
+        response.raise_for_status()
+        return (await response.json())['data']
+
+    @staticmethod
+    def __get_key(task):
+        """ Gets the key from the task ID or alias.
+        Preference is given to the ID.
+
+        Args:
+            task (dict): The task.
+
+        Returns:
+            str: The key
+
+        Raises:
+            ValueError: ID or alias not present in task.
+        """
+        key = task.get('_id', None)
+        if not key:
+            key = task.get('alias', None)
+        if not key:
+            raise ValueError('The task must specify an id or alias')
+        return key
+
+    async def is_server_up(self):
+        """Check that the Habitica API is reachable and up
+
+        Returns:
+            bool: `True` if the server is reachable, otherwise `False`.
+        """
+        response = await self.__get('status')
+        if response.status == requests.codes.ok:
+            return (await response.json())['data']['status'] == 'up'
+        return False
+
+    async def get_user(self, fields=None):
+        """Gets the authenticated user data.
+
+        Args:
+            fields (list): Optional dotted user field paths, sent as the
+                Habitica ``userFields`` projection.
+
+        Returns:
+            dict: The user data.
+        """
+        params = {'userFields': ','.join(fields)} if fields else None
+        return await self.__data(await self.__get('user', params))
+
+    async def get_stats(self):
+        """Gets the authenticated user stats.
+
+        Returns:
+            dict: The stats.
+        """
+        return (await self.get_user(fields=['stats']))['stats']
+
+    async def get_tasks(self, task_type=None):
+        """Gets all tasks for the current user.
+
+        Args:
+            task_type (HabiticaTaskTypes): The type of task to get.
+                Default is all tasks apart from completed todos.
+
+        Returns:
+            dict: The tasks.
+        """
+        params = {'type': task_type.value} if task_type else {}
+        return await self.__data(await self.__get('tasks/user', params))
+
+    async def create_task(self, task, task_type=HabiticaTaskTypes.todos):
+        """ Creates a task.
+
+        Args:
+            task (dict): The task.
+            task_type (HabiticaTaskTypes): The type of task to create.
+                Default is to create a new todo. Only used if the task['type']
+                is empty or not present.
+
+        Returns:
+            dict: The new task as returned from the server.
+        """
+        if not task.get('type', None):
+            _type = 'todo'
+            if task_type == HabiticaTaskTypes.dailies:
+                _type = 'daily'
+            elif task_type == HabiticaTaskTypes.habits:
+                _type = 'habit'
+            elif task_type == HabiticaTaskTypes.rewards:
+                _type = 'reward'
+            task['type'] = _type
+
+        return await self.__data(await self.__post('tasks/user', task))
+
+    async def create_tasks(self, tasks):
+        """ Creates multiple tasks.
+
+        Note that unlike create_task, this method **does not** check that the
+        task type is valid.
+
+        Args:
+            task (list): The list of tasks.
+
+        Returns:
+            list: The new tasks as returned from the server.
+        """
+        return await self.__data(await self.__post('tasks/user', tasks))
+
+    async def get_task(self, _id='', alias=''):
+        """ Gets a task.
+
+        If both task ID and alias are specified, then the ID is used.
+
+        Args:
+            _id (str): The task ID.
+            alias (str): The task alias.
+
+        Returns:
+            dict: The task, or None if the task is not found.
+
+        Raises:
+            ValueError
+        """
+        key = _id if _id else alias
+        if not key:
+            raise ValueError('Neither ID or alias specified')
+
+        response = await self.__get('tasks/{key}'.format(key=key))
+        if response.status == requests.codes.ok:
+            return (await response.json())['data']
+        return None
+
+    async def delete_task(self, task):
+        """ Delete a task.
+
+        Args:
+            task (dict): The task.
+        """
+        response = await self.__delete('tasks/{0}'.format(task['_id']))
+        response.raise_for_status()
+
+    async def update_task(self, task):
+        """ Updates an existing task.
+
+        Args:
+            task (dict): The task.
+
+        Returns:
+            dict: The new task as returned from the server.
+
+        Raises:
+            ValueError: if neither an ID or alias are present in task.
+        """
+        key = self.__get_key(task)
+        return await self.__data(
+            await self.__put('tasks/{0}'.format(key), task))
+
+    async def score_task(self, task, direction='up'):
+        """ Score a task.
+
+        Args:
+            task (dict): the task to score.
+            direction (str): 'up' or 'down'
+
+        Returns:
+            dict: Habitica API response data.
+
+        Raises:
+            ValueError: missing ID or alias.
+        """
+        key = self.__get_key(task)
+        return await self.__data(await self.__post(
+            'tasks/{0}/score/{1}'.format(key, direction)))
+
+    async def upsert_task(self, task, task_type=HabiticaTaskTypes.todos):
+        """Upserts a task.
+
+        Existing tasks will be updated, otherwise a new task will be created.
+
+        Args:
+            task (dict): The task.
+            task_type (HabiticaTaskTypes): The type of task to create if a new
+                task is required. Can be overriden by an existing task['type']
+                value.
+
+        Returns:
+            dict: The new task as returned from the server.
+
+        Raises:
+            ValueError
+        """
+        key = self.__get_key(task)
+        if await self.get_task(key):
+            logging.getLogger(__name__).debug('task %s exists, updating', key)
+            return await self.__data(
+                await self.__put('tasks/{0}'.format(key), task))
+
+        logging.getLogger(__name__).debug('task %s not found, creating', key)
+        return await self.create_task(task, task_type)
+
+    async def __set_user_stat(self, name, value):
+        """ PUTs a single stat and returns the new value. """
+        data = await self.__data(
+            await self.__put('user', {'stats.' + name: value}))
+        return data['stats'][name]
+
+    async def set_hp(self, hp):
+        """ Sets the user's HP.
+
+        Args:
+            hp (float): The new HP value.
+
+        Returns:
+            float: The new HP value, extracted from the JSON response data.
+        """
+        if hp > 50:
+            raise ArgumentOutOfRangeError("hp > 50")
+        if hp < 0:
+            raise ArgumentOutOfRangeError("hp < 0")
+        return await self.__set_user_stat('hp', hp)
+
+    async def set_mp(self, mp):
+        """ Sets the user's MP (mana points).
+
+        Args:
+            mp (float): The new MP value.
+
+        Returns:
+            float: The new MP value, extracted from the JSON response data.
+        """
+        if mp < 0:
+            raise ArgumentOutOfRangeError("mp < 0")
+        return await self.__set_user_stat('mp', mp)
+
+    async def set_exp(self, exp):
+        """ Sets the user's XP (experience points).
+
+        Args:
+            exp (float): The new XP value.
+
+        Returns:
+            float: The new XP value, extracted from the JSON response data.
+        """
+        if exp < 0:
+            raise ArgumentOutOfRangeError("exp < 0")
+        return await self.__set_user_stat('exp', exp)
+
+    async def set_lvl(self, lvl):
+        """ Sets the user's character level.
+        Note that XP will be reset to 0.
+
+        Args:
+            lvl (int): The new level.
+
+        Returns:
+            lvl: The new character level, extracted from the JSON response data.
+        """
+        if lvl < 0:
+            raise ArgumentOutOfRangeError("lvl < 0")
+        data = await self.__data(
+            await self.__put('user', {'stats.lvl': lvl, 'stats.exp': 0}))
+        return data['stats']['lvl']
+
+    async def set_gp(self, gp):
+        """ Sets the user's gold (gp).
+
+        Args:
+            gp (float): The new gold value.
+
+        Returns:
+            float: The new gold value, extracted from the response data.
+        """
+        if gp < 0:
+            raise ArgumentOutOfRangeError("gp < 0")
+        return await self.__set_user_stat('gp', gp)
+
+    async def get_tags(self):
+        """ Get the current user's tags.
+
+        Returns:
+            list: The tags.
+        """
+        return await self.__data(await self.__get('tags'))
+
+    async def create_tag(self, name):
+        """ Create a tag.
+
+        Args:
+            name (str): the tag name.
+
+        Returns:
+            dict: The new tag.
+        """
+        return await self.__data(
+            await self.__post('tags', data={'name': name}))
+
+    async def create_tags(self, tags):
+        """ Create the tags. Existing tags are ignored.
+
+        Missing tags are created concurrently.
+
+        Args:
+            tags (list): The list of tag names.
+
+        Returns:
+            list: The list of Habitica Tag objects corresponding to
+            the tags argument.
+        """
+        current_tags = await self.get_tags()
+        current_tag_names = [t['name'] for t in current_tags]
+        return_tags = [t for t in current_tags if t['name'] in tags]
+        missing = [t for t in tags if t not in current_tag_names]
+        return_tags.extend(await asyncio.gather(
+            *[self.create_tag(t) for t in missing]))
+        return return_tags
+
+    async def delete_tags(self, tags):
+        """ Delete a list of tag objects concurrently.
+
+        Args:
+            tags (list): The list of tag objects.
+        """
+        responses = await asyncio.gather(
+            *[self.__delete('tags/{0}'.format(t['id'])) for t in tags])
+        for response in responses:
+            response.raise_for_status()
+
+    async def delete_checklist_item(self, task_id, item_id):
+        """ Delete a checklist item.
+
+        Args:
+            task_id (str): The task ID.
+            item_id (str): The checklist item ID.
+        """
+        response = await self.__delete(
+            'tasks/{0}/checklist/{1}'.format(task_id, item_id))
+        response.raise_for_status()
+
+    async def create_checklist_item(self, task_id, item):
+        """ Add a checklist item to the task.
+
+        Args:
+            task_id (str): The task ID.
+            item (dict): The new checklist item.
+        """
+        response = await self.__post(
+            'tasks/{0}/checklist'.format(task_id),
+            data=item)
+        response.raise_for_status()
+
+    async def update_checklist_item(self, task_id, item_id, item):
+        """ Update a checklist item.
+
+        Args:
+            task_id (str): The task ID.
+            item_id (str): The checklist item ID.
+            item (dict): The checklist item fields to change.
+        """
+        response = await self.__put(
+            'tasks/{0}/checklist/{1}'.format(task_id, item_id),
+            item)
+        response.raise_for_status()
+
+    async def score_checklist_item(self, task_id, item_id):
+        """ Score a checklist item, toggling its completed state.
+
+        Args:
+            task_id (str): The task ID.
+            item_id (str): The checklist item ID.
+        """
+        response = await self.__post(
+            'tasks/{0}/checklist/{1}/score'.format(task_id, item_id))
+        response.raise_for_status()
+
+    async def feed_pet(self, pet, food):
+        """ Feed a pet.
+
+        Args:
+            pet (str): The pet name.
+            food (str): The food.
+
+        Returns:
+            dict: The Habitica response data.
+        """
+        response = await self.__post('user/feed/{0}/{1}'.format(pet, food))
+        response.raise_for_status()
+        return await response.json()
+
+    async def hatch_pet(self, egg, potion):
+        """ Hatch a pet.
+
+        Args:
+            egg (str): The egg name.
+            potion (str): The potion name.
+
+        Returns:
+            dict: The Habitica response data.
+        """
+        response = await self.__post('user/hatch/{0}/{1}'.format(egg, potion))
+        response.raise_for_status()
+        return await response.json()
+
+    async def buy_armoire(self):
+        """ Buy an armoire item.
+
+        Returns:
+            dict: The Habitica response data.
+        """
+        response = await self.__post('user/buy-armoire')
+        response.raise_for_status()
+        return await response.json()
+
+    async def cast_skill_by_raw_spell_id(self, spellId, targetId=None):
+        """ Cast a skill using the raw Habitica API spell ID rather than the
+        enum.
+
+        Args:
+            spellId (str): The spell ID
+            targetId (UUID): Optional UUID of the spell target.
+                Required for targetted spells.
+
+        Returns:
+            dict: The Habitica response data.
+        """
+        request = 'user/class/cast/{0}'.format(spellId)
+        if targetId:
+            request += '?targetId={0}'.format(targetId)
+        response = await self.__post(request)
+        response.raise_for_status()
+        return await response.json()
+
+    async def cast_skill(self, spellId, targetId=None):
+        """ Cast a skill.
+
+        Args:
+            spellId (SpellIDs): The spell ID
+            targetId (UUID): Optional UUID of the spell target.
+                Required for targetted spells.
+
+        Returns:
+            dict: The Habitica response data.
+        """
+        return await self.cast_skill_by_raw_spell_id(spellId.value, targetId)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+""" Crash-safe file writes.
+"""
+# Ensure backwards compatibility with Python 2
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals)
+from builtins import *
+
+import io
+import os
+import tempfile
+
+
+def atomic_write(filename, text):
+    """ Replaces the contents of a file, so that readers see either the old
+    or the new contents but never a partial write.
+
+    The text is written to a temporary file in the same directory, flushed to
+    disk, and then renamed over the target file.
+
+    Args:
+        filename (str): The file to write.
+        text (str): The new file contents.
+    """
+    if isinstance(text, bytes):
+        text = text.decode('utf-8')
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_name = tempfile.mkstemp(
+        prefix='.' + os.path.basename(filename) + '.',
+        suffix='.tmp',
+        dir=directory)
+    try:
+        with io.open(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if hasattr(os, 'replace'):
+            os.replace(temp_name, filename)
+        else:
+            # Python 2. Only atomic on POSIX systems.
+            os.rename(temp_name, filename)
+    except:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+
+    # make the rename itself durable
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
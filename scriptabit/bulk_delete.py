@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+""" Concurrent, resumable deletion of many Habitica tasks or tags.
+"""
+# Ensure backwards compatibility with Python 2
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals)
+from builtins import *
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .atomic_file import atomic_write
+
+
+class BulkDelete(object):
+    """ Deletes Habitica tasks and tags with a bounded pool of workers.
+
+    All workers share the Habitica service rate limiter, so the deletions run
+    as fast as the server allows without exceeding its quota. Items that no
+    longer exist on the server count as deleted.
+
+    If a checkpoint file is given, the IDs of the deleted items are saved to
+    it as the deletion progresses. An interrupted run can then be resumed
+    without repeating the requests for the items already deleted. The file is
+    removed once every item has been deleted.
+    """
+
+    def __init__(
+            self,
+            hs,
+            max_workers=4,
+            checkpoint=None,
+            checkpoint_interval=25,
+            progress=None):
+        """ Initialises the bulk deletion.
+
+        Args:
+            hs (HabiticaService): The Habitica service.
+            max_workers (int): The maximum number of concurrent deletions.
+            checkpoint (str): Optional checkpoint file name.
+            checkpoint_interval (int): The number of deletions between
+                checkpoint saves.
+            progress (callable): Optional function called with the number of
+                items processed and the total after each deletion.
+        """
+        self.__hs = hs
+        self.__max_workers = max(1, max_workers)
+        self.__checkpoint = checkpoint
+        self.__checkpoint_interval = max(1, checkpoint_interval)
+        self.__progress = progress
+        self.__lock = threading.Lock()
+        self.__deleted = set()
+        self.__unsaved = 0
+        self.__done = 0
+
+    def __load_checkpoint(self):
+        """ Loads the IDs deleted by an earlier, interrupted run. """
+        if not self.__checkpoint or not os.path.exists(self.__checkpoint):
+            return set()
+        with open(self.__checkpoint, 'r') as f:
+            deleted = set(json.load(f).get('deleted', []))
+        logging.getLogger(__name__).info(
+            'Resuming from %s: %d items already deleted',
+            self.__checkpoint,
+            len(deleted))
+        return deleted
+
+    def __save_checkpoint(self):
+        """ Saves the deleted IDs. Must be called with the lock held. """
+        if self.__checkpoint:
+            atomic_write(
+                self.__checkpoint,
+                json.dumps({'deleted': sorted(self.__deleted)}))
+        self.__unsaved = 0
+
+    @staticmethod
+    def __pending(deleted, tasks, tags):
+        """ Gets the tasks and tags whose IDs are not in `deleted`. """
+        return (
+            [t for t in tasks if t['_id'] not in deleted],
+            [t for t in tags if t['id'] not in deleted])
+
+    def estimate(self, tasks=(), tags=()):
+        """ Previews a deletion without changing anything.
+
+        Args:
+            tasks (list): The tasks to delete.
+            tags (list): The tags to delete.
+
+        Returns:
+            dict: The number of pending ``tasks`` and ``tags``, the number of
+            items ``skipped`` because an earlier run deleted them, and the
+            projected duration in ``seconds`` under the current rate limit.
+        """
+        pending_tasks, pending_tags = self.__pending(
+            self.__load_checkpoint(),
+            tasks,
+            tags)
+        count = len(pending_tasks) + len(pending_tags)
+        return {
+            'tasks': len(pending_tasks),
+            'tags': len(pending_tags),
+            'skipped': len(tasks) + len(tags) - count,
+            'seconds': self.__hs.rate_limiter.estimate_duration(count),
+        }
+
+    def run(self, tasks=(), tags=()):
+        """ Deletes the tasks and tags.
+
+        Args:
+            tasks (list): The tasks to delete.
+            tags (list): The tags to delete.
+
+        Returns:
+            dict: The number of items ``deleted``, the number ``skipped``
+            because an earlier run deleted them, and a list of (item,
+            exception) tuples for the ``failed`` deletions.
+        """
+        self.__deleted = self.__load_checkpoint()
+        pending_tasks, pending_tags = self.__pending(
+            self.__deleted,
+            tasks,
+            tags)
+        work = [(t['_id'], self.__hs.delete_task, t) for t in pending_tasks]
+        work.extend((t['id'], self.__hs.delete_tag, t) for t in pending_tags)
+        skipped = len(tasks) + len(tags) - len(work)
+
+        self.__done = 0
+        failures = []
+        try:
+            if work:
+                self.__run(work, failures)
+        except BaseException:
+            # interrupted: keep what was deleted so the run can be resumed
+            with self.__lock:
+                self.__save_checkpoint()
+            raise
+
+        with self.__lock:
+            deleted = len(work) - len(failures)
+            if failures:
+                self.__save_checkpoint()
+            elif self.__checkpoint and os.path.exists(self.__checkpoint):
+                os.remove(self.__checkpoint)
+
+        return {'deleted': deleted, 'skipped': skipped, 'failed': failures}
+
+    def __run(self, work, failures):
+        """ Runs the deletions on the worker pool, appending any failures.
+        Deletions not yet started are cancelled if the caller is interrupted.
+        """
+        with ThreadPoolExecutor(
+                max_workers=min(self.__max_workers, len(work))) as pool:
+            futures = [
+                (item, pool.submit(self.__delete, _id, func, item, len(work)))
+                for _id, func, item in work]
+            try:
+                for item, future in futures:
+                    error = future.exception()
+                    if error:
+                        logging.getLogger(__name__).warning(
+                            "Error deleting '%s': %s",
+                            item.get('text', None) or item.get('name', None),
+                            error)
+                        failures.append((item, error))
+            except BaseException:
+                for _, future in futures:
+                    future.cancel()
+                raise
+
+    def __delete(self, _id, func, item, total):
+        """ Deletes a single item, recording it in the checkpoint. """
+        deleted = False
+        try:
+            func(item)
+            deleted = True
+        except requests.HTTPError as e:
+            if e.response is None or \
+                    e.response.status_code != requests.codes.not_found:
+                raise
+            logging.getLogger(__name__).debug('%s was already deleted', _id)
+            deleted = True
+        finally:
+            with self.__lock:
+                if deleted:
+                    self.__deleted.add(_id)
+                    self.__unsaved += 1
+                    if self.__unsaved >= self.__checkpoint_interval:
+                        self.__save_checkpoint()
+                self.__done += 1
+                done = self.__done
+
+            if self.__progress:
+                self.__progress(done, total)
@@ -175,6 +175,79 @@ credentials''')
         default='https://habitica.com/api/v3/',
         help='''The base Habitica API URL''')
 
+    # Habitica connection pool
+    parser.add(
+        '--habitica-timeout',
+        required=False,
+        type=float,
+        default=10,
+        help='''Seconds to wait for the Habitica API before timing out a
+request''')
+
+    parser.add(
+        '--habitica-pool-connections',
+        required=False,
+        type=int,
+        default=10,
+        help='''Number of per-host connection pools kept open to the
+Habitica API''')
+
+    parser.add(
+        '--habitica-pool-maxsize',
+        required=False,
+        type=int,
+        default=10,
+        help='''Maximum number of keep-alive connections per host''')
+
+    parser.add(
+        '--habitica-pool-block',
+        required=False,
+        action='store_true',
+        help='''Treat the pool size as a hard per-host connection limit.
+Requests wait for a free connection instead of opening extra ones.''')
+
+    # Habitica rate limiting
+    parser.add(
+        '--habitica-rate-limit',
+        required=False,
+        type=float,
+        default=30,
+        help='''Habitica API requests per minute, used until the server
+reports its own rate limit in the response headers''')
+
+    parser.add(
+        '--habitica-burst',
+        required=False,
+        type=int,
+        default=30,
+        help='''Maximum number of Habitica API requests sent without
+throttling''')
+
+    parser.add(
+        '--habitica-max-retries',
+        required=False,
+        type=int,
+        default=3,
+        help='''Number of times a rate limited (429) Habitica request is
+retried''')
+
+    parser.add(
+        '--habitica-user-cache-ttl',
+        required=False,
+        type=float,
+        default=30,
+        help='''Seconds to reuse a downloaded Habitica user document for.
+The cache is dropped after any change to the user. 0 disables caching''')
+
+    parser.add(
+        '--habitica-tag-cache-ttl',
+        required=False,
+        type=float,
+        default=300,
+        help='''Seconds to reuse the downloaded Habitica tag list for when
+looking up tags by name. Unknown tag names always refresh the list.
+0 disables caching''')
+
     # plugins
     parser.add(
         '-r',
@@ -10,12 +10,17 @@ from __future__ import (
     unicode_literals)
 from builtins import *
 
+import copy
 import logging
+import time
 from enum import Enum
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from .errors import *
+from .latency import LatencyRecorder
+from .rate_limiter import RateLimiter
 
 
 class HabiticaTaskTypes(Enum):
@@ -70,57 +75,184 @@ class SpellIDs(Enum):
     blessing = 'healAll'
 
 
+# The stats that `HabiticaService.set_stats` can write, with their (lower,
+# upper) bounds. None means unbounded.
+STAT_LIMITS = {
+    'hp': (0, 50),
+    'mp': (0, None),
+    'exp': (0, None),
+    'lvl': (0, None),
+    'gp': (0, None),
+}
+
+
 class HabiticaService(object):
-    """ Habitica API service interface. """
-    def __init__(self, headers, base_url):
+    """ Habitica API service interface.
+
+    All requests are sent through a single `requests.Session`, owned by the
+    service instance. The session keeps connections to the API server alive
+    between calls, so the TCP and TLS handshakes are only paid once per pooled
+    connection rather than once per request. Create one `HabiticaService` per
+    process and share it between the utility functions and plugins.
+
+    Requests are also throttled by a shared `RateLimiter`, which follows the
+    rate limit headers sent by Habitica. Callers should not add their own
+    delays between requests.
+
+    The user document can be cached for a short time, so that the plugins and
+    utility functions reading it in one update cycle share a single download.
+    The cache is dropped after every request that may change the user.
+    Similarly, `create_tags` resolves tag names against a cached tag list,
+    which is kept up to date as tags are created and deleted.
+    """
+    def __init__(
+            self,
+            headers,
+            base_url,
+            timeout=10,
+            pool_connections=10,
+            pool_maxsize=10,
+            pool_block=False,
+            rate_limiter=None,
+            max_retries=3,
+            user_cache_ttl=0,
+            tag_cache_ttl=0):
         """
         Args:
             headers (dict): HTTP headers.
             base_url (str): The base URL for requests.
+            timeout (float): Seconds to wait for the server before timing out
+                API calls.
+            pool_connections (int): The number of per-host connection pools to
+                keep.
+            pool_maxsize (int): The maximum number of connections kept alive
+                for each host.
+            pool_block (bool): If True, callers wait for a free connection
+                once `pool_maxsize` connections to a host are in use, which
+                enforces a hard per-host connection limit. Otherwise extra
+                connections are opened and discarded after use.
+            rate_limiter (RateLimiter): The rate limiter applied to every
+                request. A default `RateLimiter` is created if not supplied.
+            max_retries (int): The number of times a request is retried after
+                a 429 (Too Many Requests) response.
+            user_cache_ttl (float): Seconds to reuse a downloaded user
+                document for. Zero disables the cache.
+            tag_cache_ttl (float): Seconds to reuse the downloaded tag list
+                for when resolving tag names in `create_tags`. Zero disables
+                the cache.
             """
-        self.__headers = headers
         self.__base_url = base_url
-        self.__timeout = 10  # allow 10 seconds before timing out API calls
+        self.__timeout = timeout
+        self.__rate_limiter = rate_limiter or RateLimiter()
+        self.__max_retries = max_retries
+        self.__user_cache_ttl = user_cache_ttl
+        self.__user_cache = {}
+        self.__tag_cache_ttl = tag_cache_ttl
+        self.__tags = None
+        self.__tags_expiry = 0
+        self.__task_ids = {}
+        self.__latencies = LatencyRecorder()
+
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block)
+        self.__session = requests.Session()
+        self.__session.headers.update(headers)
+        self.__session.mount('https://', adapter)
+        self.__session.mount('http://', adapter)
+
+    @property
+    def rate_limiter(self):
+        """ The rate limiter shared by all requests from this service. """
+        return self.__rate_limiter
+
+    @property
+    def latencies(self):
+        """ The latencies of the HTTP requests made by this service. """
+        return self.__latencies
+
+    def close(self):
+        """ Closes the pooled connections held by the service. """
+        self.__session.close()
+
+    def invalidate_user_cache(self):
+        """ Drops the cached user document, so the next `get_user` call
+        downloads a fresh copy.
+
+        This happens automatically after any request other than a GET, so it
+        is only needed if the user has been changed by another client.
+        """
+        self.__user_cache = {}
+
+    def invalidate_tag_cache(self):
+        """ Drops the cached tag list, so the next `create_tags` call
+        downloads a fresh copy.
+
+        The cache is kept up to date by `create_tag` and `delete_tags`, and a
+        tag name that is not in the cache always causes a refresh, so this is
+        only needed if tags have been deleted by another client.
+        """
+        self.__tags = None
+
+    def __request(self, method, command, **kwargs):
+        """Utility wrapper around a rate limited HTTP request on the pooled
+        session. Requests rejected with a 429 are retried once the server's
+        Retry-After period has passed."""
+        url = self.__base_url + command
+        attempt = 0
+        while True:
+            wait = self.__rate_limiter.acquire()
+            if wait > 0:
+                logging.getLogger(__name__).debug(
+                    'Rate limited: waited %.2f seconds', wait)
+
+            logging.getLogger(__name__).debug('%s %s', method, url)
+            start = time.time()
+            try:
+                response = self.__session.request(
+                    method,
+                    url,
+                    timeout=self.__timeout,
+                    **kwargs)
+                self.__latencies.record(time.time() - start)
+            except Exception:
+                self.__rate_limiter.update({})
+                raise
+            finally:
+                if method != 'GET':
+                    # the user document may have changed (stats, items, ...)
+                    self.invalidate_user_cache()
+
+            self.__rate_limiter.update(response.headers)
+
+            if response.status_code != requests.codes.too_many_requests or \
+                    attempt >= self.__max_retries:
+                return response
+
+            attempt += 1
+            pause = self.__rate_limiter.back_off(response.headers)
+            logging.getLogger(__name__).warning(
+                '%s %s: too many requests, retrying in %.1f seconds',
+                method,
+                url,
+                pause)
 
     def __delete(self, command, params=None):
         """Utility wrapper around a HTTP DELETE"""
-        url = self.__base_url + command
-        logging.getLogger(__name__).debug('DELETE %s', url)
-        return requests.delete(
-            url,
-            params=params,
-            headers=self.__headers,
-            timeout=self.__timeout)
+        return self.__request('DELETE', command, params=params)
 
     def __get(self, command, params=None):
         """Utility wrapper around a HTTP GET"""
-        url = self.__base_url + command
-        logging.getLogger(__name__).debug('GET %s', url)
-        return requests.get(
-            url,
-            params=params,
-            headers=self.__headers,
-            timeout=self.__timeout)
+        return self.__request('GET', command, params=params)
 
     def __put(self, command, data):
         """Utility wrapper around a HTTP PUT"""
-        url = self.__base_url + command
-        logging.getLogger(__name__).debug('PUT %s', url)
-        return requests.put(
-            url,
-            headers=self.__headers,
-            data=data,
-            timeout=self.__timeout)
+        return self.__request('PUT', command, data=data)
 
     def __post(self, command, data=None):
         """Utility wrapper around a HTTP POST"""
-        url = self.__base_url + command
-        logging.getLogger(__name__).debug('PUT %s', url)
-        return requests.post(
-            url,
-            headers=self.__headers,
-            json=data,
-            timeout=self.__timeout)
+        return self.__request('POST', command, json=data)
 
     @staticmethod
     def __get_key(task):
@@ -143,6 +275,12 @@ class HabiticaService(object):
             raise ValueError('The task must specify an id or alias')
         return key
 
+    def __remember_task_id(self, task):
+        """ Records the alias to ID mapping of a task returned by the server.
+        """
+        if isinstance(task, dict) and task.get('alias') and task.get('_id'):
+            self.__task_ids[task['alias']] = task['_id']
+
     def is_server_up(self):
         """Check that the Habitica API is reachable and up
 
@@ -154,23 +292,110 @@ class HabiticaService(object):
             return response.json()['data']['status'] == 'up'
         return False
 
-    def get_user(self):
+    @staticmethod
+    def __normalise_fields(fields):
+        """ Converts a userFields projection into a canonical string.
+
+        Args:
+            fields (list or str): Dotted user field paths, or a comma
+                separated string of paths. None for the whole document.
+
+        Returns:
+            str: The sorted, comma separated paths, or None.
+        """
+        if not fields:
+            return None
+        if not isinstance(fields, (list, tuple, set)):
+            fields = fields.split(',')
+        return ','.join(sorted(set(f.strip() for f in fields if f.strip())))
+
+    @staticmethod
+    def __project(user, fields):
+        """ Extracts a userFields projection from a full user document.
+
+        Args:
+            user (dict): The full user document.
+            fields (str): The normalised projection.
+
+        Returns:
+            dict: The projected user document.
+        """
+        projected = {'_id': user.get('_id')}
+        for path in fields.split(','):
+            source = user
+            target = projected
+            keys = path.split('.')
+            for key in keys[:-1]:
+                if not isinstance(source, dict) or key not in source:
+                    break
+                source = source[key]
+                target = target.setdefault(key, {})
+            else:
+                if isinstance(source, dict) and keys[-1] in source:
+                    target[keys[-1]] = source[keys[-1]]
+        return projected
+
+    def __get_cached_user(self, fields):
+        """ Gets a live cached user document that can answer the projection.
+
+        Args:
+            fields (str): The normalised projection, or None.
+
+        Returns:
+            dict: The cached document, or None.
+        """
+        now = time.time()
+        entry = self.__user_cache.get(fields)
+        if entry and now < entry[1]:
+            return copy.deepcopy(entry[0])
+        entry = self.__user_cache.get(None)
+        if fields and entry and now < entry[1]:
+            return copy.deepcopy(self.__project(entry[0], fields))
+        return None
+
+    def get_user(self, fields=None):
         """Gets the authenticated user data.
 
+        A cached copy is returned if one was downloaded within the last
+        `user_cache_ttl` seconds. A cached full document also answers
+        projected requests.
+
+        Args:
+            fields (list or str): Optional projection, sent as the Habitica
+                ``userFields`` parameter. Each entry is a dotted path into the
+                user document (e.g. ``'stats'`` or ``'items.pets'``), and only
+                those parts of the document are downloaded.
+
         Returns:
             dict: The user data.
         """
-        response = self.__get('user')
+        fields = self.__normalise_fields(fields)
+        if self.__user_cache_ttl > 0:
+            user = self.__get_cached_user(fields)
+            if user is not None:
+                logging.getLogger(__name__).debug('using cached user data')
+                return user
+
+        params = {'userFields': fields} if fields else None
+        response = self.__get('user', params)
         response.raise_for_status()
-        return response.json()['data']
+        user = response.json()['data']
+        if self.__user_cache_ttl > 0:
+            self.__user_cache[fields] = (
+                user,
+                time.time() + self.__user_cache_ttl)
+            return copy.deepcopy(user)
+        return user
 
     def get_stats(self):
         """Gets the authenticated user stats.
 
+        Only the stats are downloaded, not the whole user document.
+
         Returns:
             dict: The stats.
         """
-        return self.get_user()['stats']
+        return self.get_user(fields=['stats'])['stats']
 
     def get_tasks(self, task_type=None):
         """Gets all tasks for the current user.
@@ -211,7 +436,9 @@ class HabiticaService(object):
 
         response = self.__post('tasks/user', task)
         response.raise_for_status()
-        return response.json()['data']
+        data = response.json()['data']
+        self.__remember_task_id(data)
+        return data
 
     def create_tasks(self, tasks):
         """ Creates multiple tasks.
@@ -250,7 +477,9 @@ class HabiticaService(object):
 
         response = self.__get('tasks/{key}'.format(key=key))
         if response.status_code == requests.codes.ok:
-            return response.json()['data']
+            data = response.json()['data']
+            self.__remember_task_id(data)
+            return data
         else:
             return None
 
@@ -261,6 +490,12 @@ class HabiticaService(object):
             task (dict): The task.
         """
         response = self.__delete('tasks/{0}'.format(task['_id']))
+        if response.ok or response.status_code == requests.codes.not_found:
+            # a missing task is gone either way, so forget its aliases
+            for alias in [
+                    k for k, v in list(self.__task_ids.items())
+                    if v == task['_id']]:
+                self.__task_ids.pop(alias, None)
         response.raise_for_status()
 
     def update_task(self, task):
@@ -305,6 +540,10 @@ class HabiticaService(object):
         """Upserts a task.
 
         Existing tasks will be updated, otherwise a new task will be created.
+        The update is sent first, and the task is only created if the update
+        fails with a 404 (Not Found), so updating an existing task costs a
+        single request. Tasks known only by alias are updated by ID once the
+        ID has been seen.
 
         Args:
             task (dict): The task.
@@ -320,44 +559,62 @@ class HabiticaService(object):
         """
         key = task.get('_id', None)
         if not key:
-            key = task.get('alias', None)
+            alias = task.get('alias', None)
+            key = self.__task_ids.get(alias, alias)
         if not key:
             raise ValueError('The task must specify an id or alias')
 
-        # Does the task already exist?
-        if self.get_task(key):
-            logging.getLogger(__name__).debug('task %s exists, updating', key)
-            response = self.__put('tasks/{0}'.format(key), task)
-            response.raise_for_status()
-            return response.json()['data']
-        else:
+        response = self.__put('tasks/{0}'.format(key), task)
+        if response.status_code == requests.codes.not_found:
             logging.getLogger(__name__).debug(
                 'task %s not found, creating', key)
+            self.__task_ids.pop(task.get('alias', None), None)
             return self.create_task(task, task_type)
 
-    # I don't think the API lets me set partial user objects in this way.
-    # So I could get the entire user structure, swap the stats for the argument
-    # version, and then PUT that back. Or I can wait to see if I even need this
-    # method at all.
-    # def set_stats(self, stats):
-    # """Sets the authenticated user stats.
-    # ** Not implemented **
-    # Note that unlike the fine-grained set_[hp|mp|xp] methods,
-    # this method performs no sanity checking of values.
-
-        # Args:
-        # stats (dict): The stats to set. This can be a
-        # partial set of values.
-
-        # Returns: dictionary: The new stats, as returned by the server.
-
-        # Raises: NotImplementedError
-        # """
-        # raise NotImplementedError
-        # response = self.__put('user', {'stats': stats})
-        # if response.status_code == requests.codes.ok:
-        # return response.json()['data']['stats']
-        # return None
+        response.raise_for_status()
+        data = response.json()['data']
+        self.__remember_task_id(data)
+        return data
+
+    def set_stats(self, stats):
+        """ Sets any number of the user's stats with a single request.
+
+        Setting the level without the experience resets the experience to 0,
+        as `set_lvl` does.
+
+        Args:
+            stats (dict): The new values, keyed by stat name (hp, mp, exp, lvl,
+                or gp).
+
+        Returns:
+            dict: The new stats, extracted from the JSON response data. Empty
+            if `stats` is empty, in which case no request is made.
+
+        Raises:
+            ArgumentOutOfRangeError: A value is out of range.
+            ValueError: An unknown stat was given.
+        """
+        changes = {}
+        for name, value in stats.items():
+            if name not in STAT_LIMITS:
+                raise ValueError('Unknown stat {0}'.format(name))
+            lower, upper = STAT_LIMITS[name]
+            if upper is not None and value > upper:
+                raise ArgumentOutOfRangeError(
+                    '{0} > {1}'.format(name, upper))
+            if value < lower:
+                raise ArgumentOutOfRangeError(
+                    '{0} < {1}'.format(name, lower))
+            changes['stats.' + name] = value
+
+        if not changes:
+            return {}
+        if 'lvl' in stats and 'exp' not in stats:
+            changes['stats.exp'] = 0
+
+        response = self.__put('user', changes)
+        response.raise_for_status()
+        return response.json()['data']['stats']
 
     def set_hp(self, hp):
         """ Sets the user's HP.
@@ -368,14 +625,7 @@ class HabiticaService(object):
         Returns:
             float: The new HP value, extracted from the JSON response data.
         """
-        if hp > 50:
-            raise ArgumentOutOfRangeError("hp > 50")
-        if hp < 0:
-            raise ArgumentOutOfRangeError("hp < 0")
-
-        response = self.__put('user', {'stats.hp': hp})
-        response.raise_for_status()
-        return response.json()['data']['stats']['hp']
+        return self.set_stats({'hp': hp})['hp']
 
     def set_mp(self, mp):
         """ Sets the user's MP (mana points).
@@ -386,15 +636,7 @@ class HabiticaService(object):
         Returns:
             float: The new MP value, extracted from the JSON response data.
         """
-        # max_mp = self.get_user()['stats']['maxMP']
-        # if mp > max_mp:
-            # raise ArgumentOutOfRangeError("mp > {0}".format(max_mp))
-        if mp < 0:
-            raise ArgumentOutOfRangeError("mp < 0")
-
-        response = self.__put('user', {'stats.mp': mp})
-        response.raise_for_status()
-        return response.json()['data']['stats']['mp']
+        return self.set_stats({'mp': mp})['mp']
 
     def set_exp(self, exp):
         """ Sets the user's XP (experience points).
@@ -405,12 +647,7 @@ class HabiticaService(object):
         Returns:
             float: The new XP value, extracted from the JSON response data.
         """
-        if exp < 0:
-            raise ArgumentOutOfRangeError("exp < 0")
-
-        response = self.__put('user', {'stats.exp': exp})
-        response.raise_for_status()
-        return response.json()['data']['stats']['exp']
+        return self.set_stats({'exp': exp})['exp']
 
     def set_lvl(self, lvl):
         """ Sets the user's character level.
@@ -422,12 +659,7 @@ class HabiticaService(object):
         Returns:
             lvl: The new character level, extracted from the JSON response data.
         """
-        if lvl < 0:
-            raise ArgumentOutOfRangeError("lvl < 0")
-
-        response = self.__put('user', {'stats.lvl': lvl, 'stats.exp': 0})
-        response.raise_for_status()
-        return response.json()['data']['stats']['lvl']
+        return self.set_stats({'lvl': lvl})['lvl']
 
     def set_gp(self, gp):
         """ Sets the user's gold (gp).
@@ -438,22 +670,27 @@ class HabiticaService(object):
         Returns:
             float: The new gold value, extracted from the response data.
         """
-        if gp < 0:
-            raise ArgumentOutOfRangeError("gp < 0")
-
-        response = self.__put('user', {'stats.gp': gp})
-        response.raise_for_status()
-        return response.json()['data']['stats']['gp']
+        return self.set_stats({'gp': gp})['gp']
 
     def get_tags(self):
-        """ Get the current user's tags.
+        """ Get the current user's tags. The tags are always downloaded, and
+        replace the cached tag list.
 
         Returns:
             list: The tags.
         """
         response = self.__get('tags')
         response.raise_for_status()
-        return response.json()['data']
+        tags = response.json()['data']
+        self.__tags = [dict(t) for t in tags]
+        self.__tags_expiry = time.time() + self.__tag_cache_ttl
+        return tags
+
+    def __get_cached_tags(self):
+        """ Gets the cached tag list, or None if it has expired. """
+        if self.__tags is None or time.time() >= self.__tags_expiry:
+            return None
+        return [dict(t) for t in self.__tags]
 
     def create_tag(self, name):
         """ Create a tag.
@@ -466,11 +703,18 @@ class HabiticaService(object):
         """
         response = self.__post('tags', data={'name': name})
         response.raise_for_status()
-        return response.json()['data']
+        tag = response.json()['data']
+        if self.__tags is not None:
+            self.__tags.append(dict(tag))
+        return tag
 
     def create_tags(self, tags):
         """ Create the tags. Existing tags are ignored.
 
+        The existing tags are looked up in the tag list cached for
+        `tag_cache_ttl` seconds. The list is downloaded again if it has
+        expired, or if any name is missing from it.
+
         Args:
             tags (list): The list of tag names.
 
@@ -478,7 +722,11 @@ class HabiticaService(object):
             list: The list of Habitica Tag objects corresponding to
             the tags argument.
         """
-        current_tags = self.get_tags()
+        current_tags = self.__get_cached_tags()
+        if current_tags is None or \
+                not set(tags) <= set(t['name'] for t in current_tags):
+            current_tags = self.get_tags()
+
         current_tag_names = [t['name'] for t in current_tags]
         return_tags = [t for t in current_tags if t['name'] in tags]
         for required in tags:
@@ -487,6 +735,26 @@ class HabiticaService(object):
 
         return return_tags
 
+    def delete_tag(self, tag):
+        """ Delete a tag.
+
+        Args:
+            tag (dict): The tag object.
+        """
+        response = self.__delete('tags/{0}'.format(tag['id']))
+        cached = self.__tags
+        if cached is not None and (
+                response.ok or
+                response.status_code == requests.codes.not_found):
+            # A missing tag is gone either way. Removed in place, as tags may
+            # be deleted by several threads.
+            for c in [c for c in cached if c['id'] == tag['id']]:
+                try:
+                    cached.remove(c)
+                except ValueError:
+                    pass
+        response.raise_for_status()
+
     def delete_tags(self, tags):
         """ Delete a list of tag objects.
 
@@ -494,8 +762,7 @@ class HabiticaService(object):
             tags (list): The list of tag objects.
         """
         for t in tags:
-            response = self.__delete('tags/{0}'.format(t['id']))
-            response.raise_for_status()
+            self.delete_tag(t)
 
     def delete_checklist_item(self, task_id, item_id):
         """ Delete a checklist item.
@@ -520,6 +787,30 @@ class HabiticaService(object):
             data=item)
         response.raise_for_status()
 
+    def update_checklist_item(self, task_id, item_id, item):
+        """ Update a checklist item.
+
+        Args:
+            task_id (str): The task ID.
+            item_id (str): The checklist item ID.
+            item (dict): The checklist item fields to change.
+        """
+        response = self.__put(
+            'tasks/{0}/checklist/{1}'.format(task_id, item_id),
+            item)
+        response.raise_for_status()
+
+    def score_checklist_item(self, task_id, item_id):
+        """ Score a checklist item, toggling its completed state.
+
+        Args:
+            task_id (str): The task ID.
+            item_id (str): The checklist item ID.
+        """
+        response = self.__post(
+            'tasks/{0}/checklist/{1}/score'.format(task_id, item_id))
+        response.raise_for_status()
+
     def feed_pet(self, pet, food):
         """ Feed a pet.
 
@@ -8,7 +8,9 @@ from __future__ import (
     print_function,
     unicode_literals)
 from builtins import *
+import logging
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 from .habitica_service import HabiticaTaskTypes
 from .habitica_task import HabiticaTask
@@ -19,17 +21,20 @@ from .task_service import TaskService
 class HabiticaTaskService(TaskService):
     """ Implements the Habitica synchronisation task service.
     """
-    def __init__(self, hs, dry_run=False, tags=None):
+    def __init__(self, hs, dry_run=False, tags=None, max_workers=4):
         """ Initialises the Habitica synchronisation task service.
 
         Args:
             hs (HabiticaService): The Habitica Service.
             dry_run (bool): Indicates a dry run.
             tags (list): The list of tags to be applied to synchronised tasks.
+            max_workers (int): The maximum number of tasks persisted at the
+                same time. All workers share the Habitica service rate limiter.
         """
         super().__init__()
         self.__hs = hs
         self.__dry_run = dry_run
+        self.__max_workers = max(1, max_workers)
         self.__task_tags = self.__hs.create_tags(tags) if tags else None
 
     @property
@@ -37,6 +42,11 @@ class HabiticaTaskService(TaskService):
         """ Returns the dry run status. """
         return self.__dry_run
 
+    @property
+    def latencies(self):
+        """ The latencies of the Habitica API calls. """
+        return self.__hs.latencies
+
     def get_all_tasks(self):
         """ Get all tasks.
 
@@ -50,29 +60,67 @@ class HabiticaTaskService(TaskService):
         return tasks
 
     def persist_tasks(self, tasks):
-        """ Task factory method.
+        """ Persists the tasks to Habitica.
 
-        Allows subclasses to create the appropriate Task type.
+        Independent tasks are persisted concurrently by a bounded pool of
+        workers. The calls for each task are made in order by one worker, and a
+        failure only affects the task concerned.
+
+        Args:
+            tasks (list): The tasks to persist.
 
         Returns:
-            Task: The new task
+            list: (task, exception) tuples for the tasks that failed.
         """
-        if not self.dry_run:
-            for task in tasks:
-                td = task.task_dict
-                if task.completed:
-                    # We need to update the task first, as scoring a todo
-                    # does not update the data, and the task may have
-                    # changed upstream in ways that affect the Habitica
-                    # score for completing it.
-                    self.__update_task(task)
-                    self.__hs.score_task(td)
-                elif task.status in (SyncStatus.updated, SyncStatus.new):
-                    # new tasks have already been created in _create_task,
-                    # so we just need an update.
-                    self.__update_task(task)
-                elif task.status == SyncStatus.deleted:
-                    self.__hs.delete_task(td)
+        if self.dry_run:
+            return []
+
+        pending = [
+            t for t in tasks
+            if t.completed or t.status in (
+                SyncStatus.updated,
+                SyncStatus.new,
+                SyncStatus.deleted)]
+
+        failures = []
+        if not pending:
+            return failures
+
+        with ThreadPoolExecutor(
+                max_workers=min(self.__max_workers, len(pending))) as pool:
+            futures = [
+                (t, pool.submit(self.__persist_task, t)) for t in pending]
+            for task, future in futures:
+                error = future.exception()
+                if error:
+                    logging.getLogger(__name__).warning(
+                        "Error persisting task '%s': %s",
+                        task.name,
+                        error)
+                    failures.append((task, error))
+
+        return failures
+
+    def __persist_task(self, task):
+        """ Persists a single task.
+
+        Args:
+            task (scriptabit.HabiticaTask): The task to persist.
+        """
+        td = task.task_dict
+        if task.completed:
+            # We need to update the task first, as scoring a todo
+            # does not update the data, and the task may have
+            # changed upstream in ways that affect the Habitica
+            # score for completing it.
+            self.__update_task(task)
+            self.__hs.score_task(td)
+        elif task.status in (SyncStatus.updated, SyncStatus.new):
+            # new tasks have already been created in _create_task,
+            # so we just need an update.
+            self.__update_task(task)
+        elif task.status == SyncStatus.deleted:
+            self.__hs.delete_task(td)
 
     def __update_task(self, task):
         """ Updates a task. This is required as checklists require tedious
@@ -84,18 +132,77 @@ class HabiticaTaskService(TaskService):
         assert not self.dry_run
         td = task.task_dict
 
-        # delete existing checklist items
-        for i in task.existing_checklist_items:
-            self.__hs.delete_checklist_item(td['_id'], i['id'])
+        changes = self.diff_checklist(
+            task.existing_checklist_items,
+            task.new_checklist_items)
 
-        # recreate the new set of checklist items
-        for i in task.new_checklist_items:
-            self.__hs.create_checklist_item(td['_id'], i)
-            # do I need to score checked items separately?
+        for action, item_id, item in changes:
+            if action == 'delete':
+                self.__hs.delete_checklist_item(td['_id'], item_id)
+            elif action == 'update':
+                self.__hs.update_checklist_item(td['_id'], item_id, item)
+            elif action == 'score':
+                self.__hs.score_checklist_item(td['_id'], item_id)
+            elif action == 'create':
+                self.__hs.create_checklist_item(td['_id'], item)
 
         # update the rest of the task
         self.__hs.update_task(td)
 
+    @staticmethod
+    def diff_checklist(existing, new):
+        """ Works out the API calls that turn one checklist into another.
+
+        Existing items are matched to new items by text first, preferring the
+        same position when the text is repeated. The remaining items are then
+        paired up by position and renamed. Only the items left over after that
+        are deleted or created, so an unchanged checklist needs no calls at
+        all. Habitica appends created items, so the relative order of renamed
+        and created items is not preserved.
+
+        Args:
+            existing (list): The checklist item dicts currently on the task,
+                each with 'id', 'text' and 'completed' keys.
+            new (list): The required checklist item dicts, each with 'text'
+                and 'completed' keys.
+
+        Returns:
+            list: (action, item_id, item) tuples, where action is one of
+            'delete', 'update', 'score' or 'create'. item_id is None for
+            creations, and item is None for deletions and scores.
+        """
+        matches = [None] * len(new)
+        unmatched = list(range(len(existing)))
+
+        # exact text matches, preferring the same position
+        for n, item in enumerate(new):
+            candidates = [
+                e for e in unmatched if existing[e]['text'] == item['text']]
+            if candidates:
+                best = n if n in candidates else candidates[0]
+                matches[n] = best
+                unmatched.remove(best)
+
+        # pair the rest up by position
+        for n in range(len(new)):
+            if matches[n] is None and unmatched:
+                matches[n] = unmatched.pop(0)
+
+        changes = [('delete', existing[e]['id'], None) for e in unmatched]
+        for n, item in enumerate(new):
+            if matches[n] is None:
+                changes.append(('create', None, item))
+                continue
+
+            current = existing[matches[n]]
+            if current['text'] != item['text']:
+                changes.append(
+                    ('update', current['id'], {'text': item['text']}))
+            if bool(current.get('completed')) != bool(item.get('completed')):
+                changes.append(('score', current['id'], None))
+
+        return changes
+
     def _create_task(self, src=None):
         """ Task factory method.
 
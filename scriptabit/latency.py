@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+""" Recording of API call latencies.
+"""
+# Ensure backwards compatibility with Python 2
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals)
+from builtins import *
+import math
+import random
+import threading
+
+
+class LatencyRecorder(object):
+    """ Thread-safe record of API call latencies, in seconds.
+
+    The call count, total and maximum are exact. The percentiles are taken
+    from a uniform reservoir sample of at most `capacity` latencies, so the
+    memory used by a long-running service stays bounded.
+    """
+
+    def __init__(self, capacity=10000, rng=None):
+        """ Initialises an empty recorder.
+
+        Args:
+            capacity (int): The maximum number of latencies kept for the
+                percentiles.
+            rng (random.Random): Optional random number generator used to
+                sample the latencies.
+        """
+        self.__lock = threading.Lock()
+        self.__capacity = max(1, capacity)
+        self.__rng = rng or random.Random()
+        self.__latencies = []
+        self.__count = 0
+        self.__total = 0
+        self.__max = None
+
+    def __len__(self):
+        with self.__lock:
+            return self.__count
+
+    def record(self, seconds):
+        """ Records the latency of one call.
+
+        Args:
+            seconds (float): The call latency.
+        """
+        with self.__lock:
+            self.__count += 1
+            self.__total += seconds
+            if self.__max is None or seconds > self.__max:
+                self.__max = seconds
+            if len(self.__latencies) < self.__capacity:
+                self.__latencies.append(seconds)
+            else:
+                # reservoir sampling: keep each call with equal probability
+                i = self.__rng.randrange(self.__count)
+                if i < self.__capacity:
+                    self.__latencies[i] = seconds
+
+    def reset(self):
+        """ Discards the recorded latencies. """
+        with self.__lock:
+            self.__latencies = []
+            self.__count = 0
+            self.__total = 0
+            self.__max = None
+
+    def percentile(self, percent):
+        """ Gets a latency percentile, using the nearest-rank method.
+
+        Args:
+            percent (float): The percentile, from 0 to 100.
+
+        Returns:
+            float: The latency, or None if no calls have been recorded.
+        """
+        with self.__lock:
+            latencies = sorted(self.__latencies)
+        return self.__nearest_rank(latencies, percent)
+
+    @staticmethod
+    def __nearest_rank(latencies, percent):
+        """ Gets a percentile from sorted latencies. """
+        if not latencies:
+            return None
+        rank = int(math.ceil(percent / 100 * len(latencies)))
+        return latencies[min(max(rank, 1), len(latencies)) - 1]
+
+    def summary(self):
+        """ Summarises the recorded latencies.
+
+        Returns:
+            dict: The call count, total seconds, and the 50th, 90th and 99th
+            percentile and maximum latencies. The latencies are None if no
+            calls have been recorded.
+        """
+        with self.__lock:
+            latencies = sorted(self.__latencies)
+            count, total, maximum = self.__count, self.__total, self.__max
+        return {
+            'count': count,
+            'total': total,
+            'p50': self.__nearest_rank(latencies, 50),
+            'p90': self.__nearest_rank(latencies, 90),
+            'p99': self.__nearest_rank(latencies, 99),
+            'max': maximum,
+        }
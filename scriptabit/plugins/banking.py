@@ -229,7 +229,8 @@ amount.''')
         # subtract from user balance
         user_amount = min(self.__user_balance, tax)
         if not self.dry_run:
-            self._hs.set_gp(max(0, self.__user_balance - user_amount))
+            self._hs.set_stats(
+                {'gp': max(0, self.__user_balance - user_amount)})
         total_paid = user_amount
 
         # tax still owing?
@@ -259,12 +260,9 @@ amount.''')
 
         # subtract from user balance
         if not self.dry_run:
-            if self._config.bank_type == 'mana':
-                self._hs.set_mp(max(0, self.__user_balance - gross_amount))
-            elif self._config.bank_type == 'health':
-                self._hs.set_hp(max(0, self.__user_balance - gross_amount))
-            else:
-                self._hs.set_gp(max(0, self.__user_balance - gross_amount))
+            self._hs.set_stats({
+                self.__bank_traits['stat']:
+                    max(0, self.__user_balance - gross_amount)})
 
         message = '{2} Deposit: {0}, Fee: {1}'.format(
             nett_amount,
@@ -295,12 +293,9 @@ amount.''')
 
         # add to user balance
         if not self.dry_run:
-            if self._config.bank_type == 'mana':
-                self._hs.set_mp(self.__user_balance + nett_amount)
-            elif self._config.bank_type == 'health':
-                self._hs.set_hp(self.__user_balance + nett_amount)
-            else:
-                self._hs.set_gp(self.__user_balance + nett_amount)
+            self._hs.set_stats({
+                self.__bank_traits['stat']:
+                    self.__user_balance + nett_amount})
 
         message = '{2} Withdrew: {0}, Fee: {1}'.format(
             nett_amount,
@@ -10,12 +10,134 @@ from __future__ import (
     unicode_literals)
 from builtins import *
 import csv
+import hashlib
+import io
+import json
 import logging
+import os
 from pprint import pprint
 
+import requests
+
 import scriptabit
 from scriptabit import CharacterAttribute, Difficulty
 
+
+class ImportCheckpoint(object):
+    """ Append-only record of the chunks committed by a CSV import.
+
+    The first line describes the CSV file. Each committed chunk then appends
+    a JSON line holding the last row number of the chunk and the IDs of the
+    tasks created from it. The file is flushed to disk after every line, and
+    a line torn by a crash is discarded when the checkpoint is loaded.
+    Appending keeps the cost of each commit constant, however large the
+    import.
+    """
+
+    # The number of bytes at the start of the CSV file included in its hash
+    HASH_BYTES = 64 * 1024
+
+    def __init__(self, filename):
+        """ Initialises the checkpoint. Nothing is read or written.
+
+        Args:
+            filename (str): The checkpoint file name.
+        """
+        self.filename = filename
+        self.source = None
+        self.row = 0
+        self.created = 0
+
+    @staticmethod
+    def describe(csv_file):
+        """ Describes a CSV file, so a checkpoint isn't resumed against a
+        different or changed file.
+
+        Args:
+            csv_file (str): The CSV file name.
+
+        Returns:
+            dict: The file path, size and modification time, and a hash of
+            the header and first rows.
+        """
+        with io.open(csv_file, 'rb') as f:
+            head = f.read(ImportCheckpoint.HASH_BYTES)
+        return {
+            'file': os.path.abspath(csv_file),
+            'size': os.path.getsize(csv_file),
+            'mtime': os.path.getmtime(csv_file),
+            'sha1': hashlib.sha1(head).hexdigest(),
+        }
+
+    def load(self):
+        """ Loads the checkpoint, discarding any torn final line.
+
+        Returns:
+            bool: True if a checkpoint was loaded.
+        """
+        if not os.path.exists(self.filename):
+            return False
+
+        valid = 0
+        with io.open(self.filename, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+                if 'source' in entry:
+                    self.source = entry['source']
+                else:
+                    self.row = entry['row']
+                    self.created += len(entry['created'])
+                valid += len(line)
+
+        if self.source is None:
+            return False
+        if valid < os.path.getsize(self.filename):
+            with io.open(self.filename, 'r+b') as f:
+                f.truncate(valid)
+        return True
+
+    def start(self, source):
+        """ Starts a new checkpoint, replacing any existing one.
+
+        Args:
+            source (dict): The CSV file description from `describe`.
+        """
+        self.source = source
+        self.row = 0
+        self.created = 0
+        with io.open(self.filename, 'wb') as f:
+            self.__write(f, {'source': source})
+
+    def commit(self, row, created):
+        """ Records a committed chunk.
+
+        Args:
+            row (int): The number of the last row in the chunk.
+            created (list): The IDs of the tasks created from the chunk.
+        """
+        with io.open(self.filename, 'ab') as f:
+            self.__write(f, {'row': row, 'created': created})
+        self.row = row
+        self.created += len(created)
+
+    def remove(self):
+        """ Removes the checkpoint file. """
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    @staticmethod
+    def __write(f, entry):
+        """ Writes one line, and flushes it to disk. """
+        f.write((json.dumps(entry) + '\n').encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+
+
 class CsvTasks(scriptabit.IPlugin):
     """ Scriptabit batch CSV task importer for Habitica
     """
@@ -24,8 +146,8 @@ class CsvTasks(scriptabit.IPlugin):
         Generally nothing to do here other than initialise any class attributes.
         """
         super().__init__()
-        self.tasks = []
-        self.tag_names = []
+        self.task_count = 0
+        self.tag_names = set()
 
     @staticmethod
     def supports_dry_runs():
@@ -54,6 +176,27 @@ class CsvTasks(scriptabit.IPlugin):
             metavar='FILE',
             help='CSV file for bulk task import')
 
+        parser.add(
+            '--csv-chunk-size',
+            required=False,
+            type=int,
+            default=100,
+            help='Number of tasks created by each upload request')
+
+        parser.add(
+            '--csv-checkpoint',
+            required=False,
+            metavar='FILE',
+            help='''File recording the progress of the import, so that a
+failed import can be resumed. Relative paths are in the data directory.
+Defaults to the CSV file name with a .checkpoint suffix''')
+
+        parser.add(
+            '--csv-restart',
+            required=False,
+            action='store_true',
+            help='Ignore any checkpoint and import the whole CSV file')
+
         self.print_help = parser.print_help
 
         return parser
@@ -88,6 +231,11 @@ class CsvTasks(scriptabit.IPlugin):
         If a plugin implements a single-shot function, then update should
         return `False`.
 
+        The CSV rows are read lazily and uploaded in chunks of
+        ``--csv-chunk-size`` tasks. After each chunk, the last uploaded row is
+        recorded in a checkpoint file, so a failed import resumes after that
+        row when it is run again.
+
         Returns: bool: True if further updates are required; False if the plugin
         is finished and the application should shut down.
         """
@@ -100,95 +248,193 @@ class CsvTasks(scriptabit.IPlugin):
             'Importing tasks from %s',
             self._config.csv_file)
 
-        row_count = 0
+        checkpoint = None
+        start_row = 0
+        if not self.dry_run:
+            checkpoint = ImportCheckpoint(self.__get_checkpoint_file())
+            source = ImportCheckpoint.describe(self._config.csv_file)
+            if self._config.csv_restart or not checkpoint.load():
+                checkpoint.start(source)
+            elif checkpoint.source != source:
+                logging.getLogger(__name__).error(
+                    'The checkpoint %s is for a different CSV file. Use '
+                    '--csv-restart to start a new import.',
+                    checkpoint.filename)
+                return False
+            else:
+                start_row = checkpoint.row
+                logging.getLogger(__name__).info(
+                    'Resuming after row %d (%d tasks already created)',
+                    start_row,
+                    checkpoint.created)
+
+        row_count = start_row
+        chunk = []
+        try:
+            with open(self._config.csv_file) as f:
+                for row_count, task in self.__read_tasks(f, start_row):
+                    if task:
+                        chunk.append(task)
+                    if len(chunk) >= self._config.csv_chunk_size:
+                        self.__upload(chunk, row_count, checkpoint)
+                        chunk = []
+            self.__upload(chunk, row_count, checkpoint)
+        except requests.RequestException as ex:
+            logging.getLogger(__name__).error(
+                'Import failed after row %d: %s. Run the import again to '
+                'resume.',
+                checkpoint.row,
+                ex)
+            return False
+
+        if self.dry_run and self.tag_names:
+            print()
+            pprint(sorted(self.tag_names))
 
-        with open(self._config.csv_file) as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                try:
-                    row_count += 1  # OK to do this first, as we skip the header
-                    task = {
-                        'text': row['name'],
-                        'type': row['type'],
-                    }
-                    # TODO: due_date
-
-                    if 'description' in row.keys():
-                        task['notes'] = row['description']
-
-                    # We need to handle priority or difficulty in the input
-                    # header row
-                    if 'priority' in row.keys():
-                        task['priority'] = self.__parse_enum(
-                            Difficulty,
-                            row['priority'])
-                    elif 'difficulty' in row.keys():
-                        task['priority'] = self.__parse_enum(
-                            Difficulty,
-                            row['difficulty'])
-
-                    if 'attribute' in row.keys():
-                        task['attribute'] = self.__parse_enum(
-                            CharacterAttribute,
-                            row['attribute'])
-
-                    if task['type'] == 'habit':
-                        task['up'] = self.__parse_bool(row['up'])
-                        task['down'] = self.__parse_bool(row['down'])
-
-                    if task['type'] == 'reward' and 'value' in row.keys():
-                        task['value'] = max(0, int(row['value']))
-
-                    if 'tags' in row.keys():
-                        if row['tags']:
-                            tags = row['tags'].split(',')
-                            self.tag_names += tags
-                            task['tags'] = tags  # placeholder, filled in later
-
-                    if task['type'] in ['habit', 'daily', 'todo', 'reward']:
-                        self.tasks.append(task)
-                    else:
-                        logging.getLogger(__name__).warning(
-                            'Skipping task on row %d: invalid task type',
-                            row_count)
-
-                except ValueError as ex:
-                    logging.getLogger(__name__).error(ex, exc_info=True)
-                except KeyError as ex:
-                    logging.getLogger(__name__).error(ex, exc_info=True)
-                except Exception as ex:
-                    logging.getLogger(__name__).error(ex, exc_info=True)
-
-        self.__fill_tag_placeholders()
-
-        if not self.tasks:
+        if checkpoint:
+            checkpoint.remove()
+
+        if not self.task_count and not (checkpoint and checkpoint.created):
             logging.getLogger(__name__).warning(
                 'No tasks created. Check your CSV file format')
             return False
 
-        if not self.dry_run and self.tasks:
-            self._hs.create_tasks(self.tasks)
-
         self.notify('Uploaded {0} rows from CSV'.format(row_count))
 
         # return False if finished, and True to be updated again.
         return False
 
-    def __fill_tag_placeholders(self):
-        """Replace tag name placeholders with tag IDs"""
-        if self.tag_names:
-            self.tag_names = list(set(self.tag_names))  # remove duplicates
+    def __get_checkpoint_file(self):
+        """ Gets the checkpoint file name. Relative names are in the data
+        directory. """
+        name = self._config.csv_checkpoint
+        if not name:
+            name = os.path.basename(self._config.csv_file) + '.checkpoint'
+        return os.path.join(self._data_dir or '', name)
 
-            if self._config.dry_run:
-                print()
-                pprint(self.tag_names)
-            else:
-                tags = self._hs.create_tags(self.tag_names)
-                for task in self.tasks:
-                    # replace the placeholder names with tag IDs
-                    n = task.get('tags', None)
-                    if n:
-                        task['tags'] = [t['id'] for t in tags if t['name'] in n]
+    def __read_tasks(self, f, start_row=0):
+        """ Lazily parses the CSV rows into Habitica tasks.
+
+        Args:
+            f (file): The open CSV file.
+            start_row (int): The rows up to and including this row number
+                are skipped.
+
+        Yields:
+            tuple: The row number, and the task or None if the row was invalid.
+        """
+        reader = csv.DictReader(f)
+        for row_number, row in enumerate(reader, start=1):
+            if row_number > start_row:
+                yield row_number, self.__parse_row(row, row_number)
+
+    def __parse_row(self, row, row_number):
+        """ Parses one CSV row.
+
+        Args:
+            row (dict): The CSV row.
+            row_number (int): The row number, not counting the header.
+
+        Returns:
+            dict: The task, or None if the row is invalid.
+        """
+        try:
+            task = {
+                'text': row['name'],
+                'type': row['type'],
+            }
+            # TODO: due_date
+
+            if 'description' in row.keys():
+                task['notes'] = row['description']
+
+            # We need to handle priority or difficulty in the input
+            # header row
+            if 'priority' in row.keys():
+                task['priority'] = self.__parse_enum(
+                    Difficulty,
+                    row['priority'])
+            elif 'difficulty' in row.keys():
+                task['priority'] = self.__parse_enum(
+                    Difficulty,
+                    row['difficulty'])
+
+            if 'attribute' in row.keys():
+                task['attribute'] = self.__parse_enum(
+                    CharacterAttribute,
+                    row['attribute'])
+
+            if task['type'] == 'habit':
+                task['up'] = self.__parse_bool(row['up'])
+                task['down'] = self.__parse_bool(row['down'])
+
+            if task['type'] == 'reward' and 'value' in row.keys():
+                task['value'] = max(0, int(row['value']))
+
+            if 'tags' in row.keys():
+                if row['tags']:
+                    tags = row['tags'].split(',')
+                    self.tag_names.update(tags)
+                    task['tags'] = tags  # placeholder, filled in later
+
+            if task['type'] in ['habit', 'daily', 'todo', 'reward']:
+                return task
+
+            logging.getLogger(__name__).warning(
+                'Skipping task on row %d: invalid task type',
+                row_number)
+
+        except ValueError as ex:
+            logging.getLogger(__name__).error(ex, exc_info=True)
+        except KeyError as ex:
+            logging.getLogger(__name__).error(ex, exc_info=True)
+        except Exception as ex:
+            logging.getLogger(__name__).error(ex, exc_info=True)
+
+        return None
+
+    def __upload(self, chunk, row_number, checkpoint):
+        """ Creates a chunk of tasks, and records it in the checkpoint.
+
+        Args:
+            chunk (list): The tasks.
+            row_number (int): The number of the last row read for the chunk.
+            checkpoint (ImportCheckpoint): The checkpoint, or None on a dry
+                run.
+        """
+        self.task_count += len(chunk)
+        if self.dry_run:
+            return
+
+        created = []
+        if chunk:
+            self.__fill_tag_placeholders(chunk)
+            created = self._hs.create_tasks(chunk)
+            if isinstance(created, dict):
+                created = [created]
+            logging.getLogger(__name__).info(
+                'Created %d tasks, up to row %d',
+                len(created),
+                row_number)
+        checkpoint.commit(row_number, [t.get('_id') for t in created])
+
+    def __fill_tag_placeholders(self, tasks):
+        """Replace tag name placeholders with tag IDs
+
+        Args:
+            tasks (list): The tasks to update.
+        """
+        names = set()
+        for task in tasks:
+            names.update(task.get('tags', None) or [])
+
+        if names:
+            tags = self._hs.create_tags(sorted(names))
+            for task in tasks:
+                # replace the placeholder names with tag IDs
+                n = task.get('tags', None)
+                if n:
+                    task['tags'] = [t['id'] for t in tags if t['name'] in n]
 
     @staticmethod
     def __parse_bool(csv_value):
@@ -122,7 +122,7 @@ class HealthEffects(scriptabit.IPlugin):
             new_hp = max(0, old_hp - delta)
 
         if not self.dry_run:
-            self._hs.set_hp(new_hp)
+            self._hs.set_stats({'hp': new_hp})
 
         return delta if up else -delta
 
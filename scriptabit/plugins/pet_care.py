@@ -13,7 +13,6 @@ from builtins import *
 import logging
 import random
 from pprint import pprint
-from time import sleep
 
 import scriptabit
 
@@ -161,7 +160,12 @@ class PetCare(scriptabit.IPlugin):
         logging.getLogger(__name__).info('Scriptabit Pet Care Services: looking'
                                          ' after your pets since yesterday')
 
-        self.__items = self._hs.get_user()['items']
+        self.__items = self._hs.get_user(fields=[
+            'items.pets',
+            'items.food',
+            'items.eggs',
+            'items.hatchingPotions',
+            'items.mounts'])['items']
         self.__any_food = self._config.any_pet_food
 
     @staticmethod
@@ -361,9 +365,7 @@ class PetCare(scriptabit.IPlugin):
                 break
             try:
                 food = self.get_food_for_pet(pet)
-                fed_something = False
                 while food:
-                    fed_something = True
                     if self.dry_run:
                         response = {'data': -1, 'message': 'dry run'}
                     else:
@@ -385,9 +387,6 @@ class PetCare(scriptabit.IPlugin):
                         # pet became a mount
                         mounts_raised += 1
                         break
-
-                if fed_something and not self.dry_run:
-                    sleep(2)  # sleep for a bit so we don't pound the server
             except Exception as e:
                 logging.getLogger(__name__).warning(e)
 
@@ -9,7 +9,6 @@ from __future__ import (
     print_function,
     unicode_literals)
 from builtins import *
-from time import sleep
 import logging
 
 import scriptabit
@@ -147,7 +146,6 @@ This can be combined with Blessing to heal the party but not the user.''')
                             target)
                         if not result['success']:
                             break
-                        sleep(1)
                     except:
                         break
 
@@ -170,4 +168,4 @@ This can be combined with Blessing to heal the party but not the user.''')
         if self._config.preserve_user_hp:
             logging.getLogger(__name__).info('Restoring HP: %f', self.current_hp)
             if not self._config.dry_run:
-                self._hs.set_hp(self.current_hp)
+                self._hs.set_stats({'hp': self.current_hp})
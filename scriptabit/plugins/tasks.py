@@ -9,9 +9,10 @@ from __future__ import (
     print_function,
     unicode_literals)
 from builtins import *
-from time import sleep
+from datetime import timedelta
 from pprint import pprint
 import logging
+import os
 
 # from .dates import parse_date_local
 # from .habitica_service import HabiticaTaskTypes, SpellIDs
@@ -73,12 +74,35 @@ class Tasks(sb.IPlugin):
             action='store_true',
             help='''List unused tags.''')
 
+        parser.add(
+            '--tag-usage',
+            required=False,
+            action='store_true',
+            help='''Report the number of tasks using each tag, and when
+each tag was last used.''')
+
         parser.add(
             '--delete-unused-tags',
             required=False,
             action='store_true',
             help='''Delete unused tags.''')
 
+        parser.add(
+            '--delete-workers',
+            required=False,
+            default=4,
+            type=int,
+            help='''Number of tasks or tags deleted at the same time. All
+deletions share the Habitica rate limit.''')
+
+        parser.add(
+            '--delete-checkpoint',
+            required=False,
+            help='''File recording the progress of --delete-tasks and
+--delete-unused-tags, so that an interrupted deletion can be resumed. Relative
+paths are in the data directory. Defaults to a file named for the deletion
+and task type, such as tasks_delete_habits.json''')
+
         parser.add(
             '--task-type',
             required=False,
@@ -148,13 +172,10 @@ class Tasks(sb.IPlugin):
             self.list_tags()
         elif self._config.list_unused_tags:
             self.list_unused_tags()
+        elif self._config.tag_usage:
+            self.tag_usage_report()
         elif self._config.delete_unused_tags:
-            if self._config.dry_run:
-                logging.getLogger(__name__).debug(
-                    "Dry run, falling back to listing unused tags")
-                self.list_unused_tags()
-            else:
-                self.delete_unused_tags()
+            self.delete_unused_tags()
         else:
             print()
             self.print_help()
@@ -162,17 +183,70 @@ class Tasks(sb.IPlugin):
         # return False if finished, and True to be updated again.
         return False
 
+    def __get_bulk_delete(self, operation):
+        """ Creates the bulk deletion engine.
+
+        Args:
+            operation (str): Names the deletion, so that each kind of deletion
+                has its own default checkpoint file.
+
+        Returns:
+            scriptabit.BulkDelete: The engine.
+        """
+        checkpoint = self._config.delete_checkpoint or \
+            'tasks_delete_{0}.json'.format(operation)
+        return sb.BulkDelete(
+            self._hs,
+            max_workers=self._config.delete_workers,
+            checkpoint=os.path.join(self._data_dir or '', checkpoint),
+            progress=self.__print_progress)
+
+    @staticmethod
+    def __print_progress(done, total):
+        """ Prints the deletion progress about every 10%. """
+        step = max(1, total // 10)
+        if done % step == 0 or done == total:
+            print('Deleted {0}/{1} ({2:.0%})'.format(done, total, done / total))
+
+    def __bulk_delete(self, operation, tasks=(), tags=()):
+        """ Deletes tasks and tags concurrently, or previews the deletion
+        on a dry run.
+
+        Args:
+            operation (str): Names the deletion.
+            tasks (list): The tasks to delete.
+            tags (list): The tags to delete.
+        """
+        engine = self.__get_bulk_delete(operation)
+        estimate = engine.estimate(tasks, tags)
+        if estimate['skipped']:
+            print('Resuming: {0} already deleted'.format(estimate['skipped']))
+
+        if self.dry_run:
+            for t in tasks:
+                print('Would delete {0}'.format(t['text']))
+            for t in tags:
+                print('Would delete tag {0}'.format(t['name']))
+            print('{0} tasks and {1} tags to delete, taking about {2} at '
+                  'the current rate limit'.format(
+                      estimate['tasks'],
+                      estimate['tags'],
+                      timedelta(seconds=int(estimate['seconds']))))
+            return
+
+        result = engine.run(tasks, tags)
+        print('Deleted {0}, {1} failed'.format(
+            result['deleted'],
+            len(result['failed'])))
+
     def delete_tasks(self):
         """Deletes all user tasks"""
         logging.getLogger(__name__).debug(
             'Deleting all %s', self.task_type_name)
 
-        tasks = self._hs.get_tasks(task_type=self.task_type)
-        for t in tasks:
-            print('Deleting {0}'.format(t['text']))
-            if not self.dry_run:
-                self._hs.delete_task(t)
-                sleep(1)
+        self.__bulk_delete(
+            self._config.task_type,
+            tasks=self._hs.get_tasks(task_type=self.task_type))
 
     def list_tasks(self):
         """Dumps all tasks"""
@@ -204,30 +278,41 @@ class Tasks(sb.IPlugin):
         """Deletes unused tags"""
         print('*** Deleting unused tags ***')
         print()
-        self._hs.delete_tags(self.__get_unused_tags().values())
+        self.__bulk_delete(
+            'unused_tags',
+            tags=list(self.__get_unused_tags().values()))
 
-    def __get_unused_tags(self):
-        """gets the dictionary of unused tags"""
+    def __get_tag_usage(self):
+        """ Indexes the tasks using each tag, across all task types
+        including completed todos.
+
+        Returns:
+            scriptabit.TagUsage: The tag usage index.
+        """
         tags = self._hs.get_tags()
         tasks = self._hs.get_tasks()
+        tasks.extend(self._hs.get_tasks(
+            task_type=sb.HabiticaTaskTypes.completed_todos))
+        return sb.TagUsage(tags, tasks)
 
-        # simple m*n first implementation. No need to do something fancier
-        # unless this is too slow
-
-        # first, assume that all tags are unused
-        unused_tags = {t['id']:t for t in tags}
-
-        # Then, try to disprove that assumption by finding at least one task
-        # that uses the tag
-        for tag in tags:
-            for task in tasks:
-                if tag['id'] in task['tags']:
-                    logging.getLogger(__name__).debug(
-                        'tag %s is used', tag['name'])
-                    del unused_tags[tag['id']]
-                    break
+    def __get_unused_tags(self):
+        """gets the dictionary of unused tags"""
+        return self.__get_tag_usage().unused()
 
-        return unused_tags
+    def tag_usage_report(self):
+        """Prints the number of tasks using each tag, and when a task using
+        the tag was last updated or completed."""
+        print('*** Tag usage ***')
+        print()
+        report = self.__get_tag_usage().report()
+        if not report:
+            print("No tags")
+        for row in report:
+            last_used = row['last_used']
+            print('{0:>6}  {1:<10}  {2}'.format(
+                row['count'],
+                last_used.strftime('%Y-%m-%d') if last_used else 'never',
+                row['name']))
 
     def __print_tags(self, tags):
         """ print the supplied list of tags.
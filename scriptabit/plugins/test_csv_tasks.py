@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+""" Unit tests for the CSV tasks plugin """
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+import argparse
+import io
+import json
+import os
+
+import pytest
+import requests
+
+from scriptabit import HabiticaService, RateLimiter
+from scriptabit.tests.fake_habitica_server import FakeHabiticaServer
+
+from .csv_tasks import CsvTasks, ImportCheckpoint
+
+
+@pytest.fixture
+def server():
+    server = FakeHabiticaServer().start()
+    yield server
+    server.stop()
+
+
+def write_csv(tmpdir, rows):
+    filename = str(tmpdir.join('tasks.csv'))
+    with io.open(filename, 'w', encoding='utf-8') as f:
+        f.write('name,type,tags\n')
+        for i in range(rows):
+            f.write('Task {0},todo,"a,b"\n'.format(i))
+        f.write('Bad,nonsense,\n')
+    return filename
+
+
+def run_import(server, tmpdir, csv_file, dry_run=False, fail_after=None,
+               **kwargs):
+    hs = HabiticaService(
+        {},
+        server.base_url,
+        rate_limiter=RateLimiter(rate=1000, capacity=1000))
+    if fail_after is not None:
+        create_tasks = hs.create_tasks
+        calls = []
+
+        def failing_create_tasks(tasks):
+            calls.append(tasks)
+            if len(calls) > fail_after:
+                raise requests.ConnectionError('connection lost')
+            return create_tasks(tasks)
+
+        hs.create_tasks = failing_create_tasks
+
+    config = argparse.Namespace(
+        csv_file=csv_file,
+        csv_chunk_size=4,
+        csv_checkpoint=None,
+        csv_restart=False,
+        dry_run=dry_run,
+        use_notification_panel=False,
+        tags=[])
+    for k, v in kwargs.items():
+        setattr(config, k, v)
+    plugin = CsvTasks()
+    plugin.initialise(config, hs, str(tmpdir))
+    plugin.update()
+    return plugin
+
+
+def test_imports_in_chunks(server, tmpdir):
+    csv_file = write_csv(tmpdir, 10)
+    plugin = run_import(server, tmpdir, csv_file)
+
+    assert plugin.task_count == 10
+    assert sorted(t['text'] for t in server.state.tasks.values()) == \
+        sorted('Task {0}'.format(i) for i in range(10))
+    assert server.requests[('POST', 'tasks/user')] == 3
+    tag_ids = set(t['id'] for t in server.state.tags)
+    assert all(
+        set(t['tags']) == tag_ids for t in server.state.tasks.values())
+    assert not os.path.exists(csv_file + '.checkpoint')
+
+
+def test_dry_run_creates_nothing(server, tmpdir):
+    csv_file = write_csv(tmpdir, 5)
+    plugin = run_import(server, tmpdir, csv_file, dry_run=True)
+    assert plugin.task_count == 5
+    assert plugin.tag_names == {'a', 'b'}
+    assert server.state.tasks == {}
+    assert server.requests[('POST', 'tasks/user')] == 0
+
+
+def test_failed_import_resumes(server, tmpdir):
+    csv_file = write_csv(tmpdir, 10)
+    checkpoint_file = str(tmpdir.join('tasks.csv.checkpoint'))
+
+    run_import(server, tmpdir, csv_file, fail_after=1)
+
+    checkpoint = ImportCheckpoint(checkpoint_file)
+    assert checkpoint.load()
+    assert checkpoint.row == 4
+    assert checkpoint.created == len(server.state.tasks) == 4
+
+    # simulate a crash while a commit was being written
+    with io.open(checkpoint_file, 'ab') as f:
+        f.write(b'{"row": 9')
+
+    run_import(server, tmpdir, csv_file)
+    assert server.requests[('POST', 'tasks/user')] == 3
+    assert sorted(t['text'] for t in server.state.tasks.values()) == \
+        sorted('Task {0}'.format(i) for i in range(10))
+    assert not os.path.exists(checkpoint_file)
+
+
+def test_checkpoint_for_another_file_is_not_resumed(server, tmpdir):
+    csv_file = write_csv(tmpdir, 3)
+    checkpoint = ImportCheckpoint(str(tmpdir.join('tasks.csv.checkpoint')))
+    checkpoint.start({'file': 'other.csv', 'size': 1})
+    checkpoint.commit(2, ['x', 'y'])
+
+    run_import(server, tmpdir, csv_file)
+    assert server.state.tasks == {}
+
+    run_import(server, tmpdir, csv_file, csv_restart=True)
+    assert len(server.state.tasks) == 3
+
+
+def test_edited_file_is_not_resumed(tmpdir):
+    csv_file = write_csv(tmpdir, 3)
+    source = ImportCheckpoint.describe(csv_file)
+
+    # same size, different content
+    with io.open(csv_file, 'r+b') as f:
+        f.seek(len('name,type,tags\n'))
+        f.write(b'X')
+    os.utime(csv_file, (source['mtime'], source['mtime']))
+
+    assert ImportCheckpoint.describe(csv_file)['size'] == source['size']
+    assert ImportCheckpoint.describe(csv_file) != source
+
+
+def test_checkpoint_discards_torn_lines(tmpdir):
+    filename = str(tmpdir.join('checkpoint'))
+    checkpoint = ImportCheckpoint(filename)
+    checkpoint.start({'file': 'a.csv', 'size': 10})
+    checkpoint.commit(4, ['1', '2'])
+    with io.open(filename, 'ab') as f:
+        f.write(b'{"row": 8, "crea')
+
+    checkpoint = ImportCheckpoint(filename)
+    assert checkpoint.load()
+    assert (checkpoint.row, checkpoint.created) == (4, 2)
+
+    checkpoint.commit(8, ['3'])
+    with io.open(filename, 'rb') as f:
+        lines = [json.loads(l.decode('utf-8')) for l in f]
+    assert lines[-1] == {'row': 8, 'created': ['3']}
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+""" Cached Trello board and list metadata.
+"""
+# Ensure backwards compatibility with Python 2
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals)
+from builtins import *
+
+import logging
+from datetime import datetime
+
+import pytz
+from scriptabit import parse_date_utc
+from trello import Board, List
+
+# Trello actions that change the boards, lists or labels, rather than cards.
+METADATA_ACTIONS = frozenset([
+    'createBoard',
+    'updateBoard',
+    'createList',
+    'updateList',
+    'moveListFromBoard',
+    'moveListToBoard',
+    'createLabel',
+    'updateLabel',
+    'deleteLabel',
+])
+
+
+class BoardMetadata(object):
+    """ The open Trello boards and their open lists.
+
+    Boards and lists rarely change, so they are loaded with a single request
+    and reused until they expire, or until a change is seen in the board
+    actions (see `METADATA_ACTIONS`).
+
+    Attributes:
+        boards (list): The board JSON objects, each with its open lists.
+        fetched (datetime): When the metadata was loaded (UTC).
+        labelled (set): The IDs of the boards known to have the labels used by
+            the Trello plugin.
+    """
+
+    def __init__(self, boards, fetched=None, labelled=None):
+        """ Initialises the metadata.
+
+        Args:
+            boards (list): The board JSON objects, each with its open lists.
+            fetched (datetime): When the metadata was loaded (UTC). Defaults
+                to now.
+            labelled (iterable): The IDs of the boards known to have the
+                required labels.
+        """
+        self.boards = boards
+        self.fetched = fetched or datetime.now(tz=pytz.utc)
+        self.labelled = set(labelled or [])
+
+    @staticmethod
+    def fetch(trello_client):
+        """ Loads the open boards and lists in a single request.
+
+        Args:
+            trello_client (trello.TrelloClient): The Trello client.
+
+        Returns:
+            BoardMetadata: The metadata.
+        """
+        logging.getLogger(__name__).debug('Fetching Trello board metadata')
+        boards = trello_client.fetch_json(
+            '/members/me/boards',
+            query_params={
+                'filter': 'open',
+                'fields': 'name,closed,url',
+                'lists': 'open',
+                'list_fields': 'name,closed,pos',
+            })
+        return BoardMetadata(boards)
+
+    def expired(self, ttl):
+        """ Checks whether the metadata is older than the TTL.
+
+        Args:
+            ttl (timedelta): The time to live.
+
+        Returns:
+            bool: True if the metadata has expired.
+        """
+        return datetime.now(tz=pytz.utc) - self.fetched >= ttl
+
+    def get_lists(self, trello_client, board_names):
+        """ Gets the boards and their open lists.
+
+        Args:
+            trello_client (trello.TrelloClient): The Trello client.
+            board_names (iterable): The names of the boards to get.
+
+        Returns:
+            list: (`trello.Board`, list of `trello.List`) pairs, in Trello
+            order. The lists are sorted by position.
+        """
+        result = []
+        for board_json in self.boards:
+            if board_json['name'] not in board_names:
+                continue
+            board = Board.from_json(trello_client, json_obj=board_json)
+            lists = sorted(
+                board_json.get('lists', []),
+                key=lambda l: l.get('pos', 0))
+            result.append(
+                (board, [List.from_json(board, l) for l in lists]))
+        return result
+
+    def as_dict(self):
+        """ Gets the metadata as a JSON serialisable dictionary. """
+        return {
+            'boards': self.boards,
+            'fetched': self.fetched.isoformat(),
+            'labelled': sorted(self.labelled),
+        }
+
+    @staticmethod
+    def from_dict(data):
+        """ Creates metadata from a dictionary saved by `as_dict`.
+
+        Args:
+            data (dict): The saved metadata, or None.
+
+        Returns:
+            BoardMetadata: The metadata, or None if there is none.
+        """
+        if not data:
+            return None
+        return BoardMetadata(
+            data['boards'],
+            fetched=parse_date_utc(data['fetched']),
+            labelled=data.get('labelled', []))
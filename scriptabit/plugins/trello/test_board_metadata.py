@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+""" Unit tests for the Trello board metadata cache """
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+
+import json
+from datetime import datetime, timedelta
+
+import pytz
+import requests_mock
+from trello import TrelloClient
+
+from .board_metadata import BoardMetadata
+
+API = 'https://api.trello.com/1/'
+
+BOARDS = [
+    {'id': 'b1', 'name': 'work', 'closed': False, 'url': '', 'lists': [
+        {'id': 'l2', 'name': 'done', 'closed': False, 'pos': 2},
+        {'id': 'l1', 'name': 'todo', 'closed': False, 'pos': 1}]},
+    {'id': 'b2', 'name': 'home', 'closed': False, 'url': '', 'lists': []},
+]
+
+
+def test_fetch_is_one_request():
+    client = TrelloClient(api_key='key', token='token')
+    with requests_mock.mock() as m:
+        m.get(API + 'members/me/boards', text=json.dumps(BOARDS))
+        metadata = BoardMetadata.fetch(client)
+        assert m.call_count == 1
+        assert m.last_request.qs['lists'] == ['open']
+
+        board_lists = metadata.get_lists(client, ['work'])
+        assert m.call_count == 1
+
+    assert len(board_lists) == 1
+    board, lists = board_lists[0]
+    assert board.id == 'b1'
+    assert [(l.id, l.board.id) for l in lists] == [('l1', 'b1'), ('l2', 'b1')]
+
+
+def test_expiry():
+    metadata = BoardMetadata(BOARDS)
+    assert not metadata.expired(timedelta(minutes=1))
+    assert metadata.expired(timedelta(0))
+
+    metadata.fetched = datetime.now(tz=pytz.utc) - timedelta(minutes=2)
+    assert metadata.expired(timedelta(minutes=1))
+
+
+def test_round_trip():
+    metadata = BoardMetadata(BOARDS, labelled=['b1'])
+    loaded = BoardMetadata.from_dict(
+        json.loads(json.dumps(metadata.as_dict())))
+
+    assert loaded.boards == BOARDS
+    assert loaded.fetched == metadata.fetched
+    assert loaded.labelled == set(['b1'])
+    assert BoardMetadata.from_dict(None) is None
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+""" Unit tests for the trello task service """
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+
+import json
+import pytest
+import pytz
+from datetime import datetime
+import requests_mock
+from trello import Board, List, TrelloClient
+
+from scriptabit import Difficulty
+from .board_config import BoardConfig
+from .trello_task_service import TrelloTaskService
+
+API = 'https://api.trello.com/1/'
+
+ME = {
+    'id': 'me',
+    'email': '',
+    'status': '',
+    'username': 'me',
+    'fullName': 'Me',
+    'initials': 'M',
+    'avatarUrl': '',
+}
+
+
+def card_json(_id, list_id, members=None, labels=None, checklists=None):
+    return {
+        'id': _id,
+        'name': 'card ' + _id,
+        'desc': '',
+        'due': None,
+        'dueComplete': False,
+        'closed': False,
+        'url': '',
+        'pos': 1,
+        'shortUrl': '',
+        'idMembers': members or [],
+        'idLabels': [],
+        'idBoard': 'b1',
+        'idList': list_id,
+        'idShort': 1,
+        'badges': {'checkItems': 0},
+        'idChecklists': [c['id'] for c in checklists or []],
+        'labels': [
+            {'id': n, 'name': n, 'color': None} for n in labels or []],
+        'checklists': checklists or [],
+        'dateLastActivity': '2016-08-15T10:30:00.000Z',
+    }
+
+
+@pytest.fixture
+def client():
+    return TrelloClient(api_key='key', token='token')
+
+
+@pytest.fixture
+def board(client):
+    return Board(client, board_id='b1', name='my board')
+
+
+def get_tasks(client, board, cards, board_config='my board'):
+    todo = List(board, 'l1', name='todo')
+    done = List(board, 'l2', name='done')
+    config = BoardConfig(board_config)
+    with requests_mock.mock() as m:
+        m.get(API + 'members/me', text=json.dumps(ME))
+        m.get(API + 'boards/b1/cards/open', text=json.dumps(cards))
+        service = TrelloTaskService(client, [todo], [done], {
+            config.name: config})
+        tasks = service.get_all_tasks()
+        requests = [r.path for r in m.request_history]
+    return tasks, requests
+
+
+def test_one_request_per_board(client, board):
+    cards = [card_json(str(i), 'l1' if i % 2 else 'l2') for i in range(10)]
+    tasks, requests = get_tasks(client, board, cards)
+
+    assert len(tasks) == 10
+    assert len([t for t in tasks if t.completed]) == 5
+    assert requests == ['/1/members/me', '/1/boards/b1/cards/open']
+
+
+def test_unselected_lists_and_no_sync_cards_are_skipped(client, board):
+    cards = [
+        card_json('1', 'l1'),
+        card_json('2', 'other'),
+        card_json('3', 'l1', labels=['no sync', 'hard']),
+        card_json('4', 'l1', labels=['hard'])]
+    tasks, _ = get_tasks(client, board, cards)
+
+    assert [t.id for t in tasks] == ['1', '4']
+    assert tasks[1].difficulty == Difficulty.hard
+
+
+def test_member_cards(client, board):
+    cards = [
+        card_json('1', 'l1', members=['me']),
+        card_json('2', 'l1', members=['someone']),
+        card_json('3', 'l1')]
+    tasks, requests = get_tasks(client, board, cards, 'my board|||user')
+
+    assert [t.id for t in tasks] == ['1']
+    assert len(requests) == 2
+
+
+def test_checklists_are_loaded_with_cards(client, board):
+    checklists = [
+        {'id': 'c2', 'name': 'second', 'pos': 2, 'checkItems': [
+            {'name': 'c', 'state': 'incomplete', 'pos': 1}]},
+        {'id': 'c1', 'name': 'first', 'pos': 1, 'checkItems': [
+            {'name': 'b', 'state': 'incomplete', 'pos': 2},
+            {'name': 'a', 'state': 'complete', 'pos': 1}]}]
+    tasks, _ = get_tasks(
+        client, board, [card_json('1', 'l1', checklists=checklists)])
+
+    # no further requests are made for the checklist
+    with requests_mock.mock() as m:
+        checklist = tasks[0].checklist
+        assert not m.called
+
+    assert [(i.name, i.checked) for i in checklist] == [
+        ('a', True), ('b', False), ('c', False)]
+
+
+def test_incremental_fetches_changed_cards(client, board):
+    todo = List(board, 'l1', name='todo')
+    done = List(board, 'l2', name='done')
+    config = BoardConfig('my board')
+    since = datetime(2016, 8, 15, tzinfo=pytz.utc)
+
+    archived = card_json('3', 'l1')
+    archived['closed'] = True
+    actions = [
+        {'data': {'card': {'id': '1'}}},
+        {'data': {'card': {'id': '1'}}},
+        {'data': {'card': {'id': '2'}}},
+        {'data': {'card': {'id': '3'}}},
+        {'data': {'card': {'id': '4'}}},
+        {'data': {'card': {'id': '5'}}},
+        {'data': {'board': {'id': 'b1'}}}]
+
+    with requests_mock.mock() as m:
+        m.get(API + 'members/me', text=json.dumps(ME))
+        m.get(API + 'boards/b1/actions', text=json.dumps(actions))
+        m.get(API + 'cards/1', text=json.dumps(card_json('1', 'l1')))
+        m.get(API + 'cards/2', text=json.dumps(card_json('2', 'l2')))
+        m.get(API + 'cards/3', text=json.dumps(archived))
+        m.get(API + 'cards/4', text=json.dumps(card_json('4', 'other')))
+        m.get(API + 'cards/5', status_code=404, text='not found')
+        service = TrelloTaskService(
+            client, [todo], [done], {config.name: config}, since=since)
+        tasks = service.get_all_tasks()
+
+        assert m.request_history[1].qs['since'] == [since.isoformat().lower()]
+        assert not [r for r in m.request_history if 'cards/open' in r.path]
+
+    assert service.partial
+    assert [(t.id, t.completed) for t in tasks] == [
+        ('1', False), ('2', True)]
+    assert service.get_removed_task_ids() == ['3', '4', '5']
+    assert not service.metadata_changed
+
+
+def test_incremental_detects_metadata_changes(client, board):
+    todo = List(board, 'l1', name='todo')
+    config = BoardConfig('my board')
+    actions = [{'type': 'createList', 'data': {'list': {'id': 'l3'}}}]
+
+    with requests_mock.mock() as m:
+        m.get(API + 'members/me', text=json.dumps(ME))
+        m.get(API + 'boards/b1/actions', text=json.dumps(actions))
+        service = TrelloTaskService(
+            client, [todo], [], {config.name: config},
+            since=datetime(2016, 8, 15, tzinfo=pytz.utc))
+        assert service.get_all_tasks() == []
+
+    assert service.metadata_changed
+
+
+def test_incremental_falls_back_to_full_scan(client, board):
+    todo = List(board, 'l1', name='todo')
+    config = BoardConfig('my board')
+    actions = [{'data': {}}] * TrelloTaskService.ACTION_LIMIT
+
+    with requests_mock.mock() as m:
+        m.get(API + 'members/me', text=json.dumps(ME))
+        m.get(API + 'boards/b1/actions', text=json.dumps(actions))
+        m.get(API + 'boards/b1/cards/open', text=json.dumps(
+            [card_json('1', 'l1')]))
+        service = TrelloTaskService(
+            client, [todo], [], {config.name: config},
+            since=datetime(2016, 8, 15, tzinfo=pytz.utc))
+        tasks = service.get_all_tasks()
+
+    assert not service.partial
+    assert [t.id for t in tasks] == ['1']
+
+
+def test_incremental_fetches_cards_to_retry(client, board):
+    todo = List(board, 'l1', name='todo')
+    config = BoardConfig('my board')
+    actions = [{'data': {'card': {'id': '1'}}}]
+
+    with requests_mock.mock() as m:
+        m.get(API + 'members/me', text=json.dumps(ME))
+        m.get(API + 'boards/b1/actions', text=json.dumps(actions))
+        m.get(API + 'cards/1', text=json.dumps(card_json('1', 'l1')))
+        m.get(API + 'cards/2', text=json.dumps(card_json('2', 'l1')))
+        service = TrelloTaskService(
+            client, [todo], [], {config.name: config},
+            since=datetime(2016, 8, 15, tzinfo=pytz.utc),
+            retry_ids=['2'])
+        tasks = service.get_all_tasks()
+
+    assert service.partial
+    assert sorted(t.id for t in tasks) == ['1', '2']
+
+
+def test_targeted_fetches_only_given_cards(client, board):
+    todo = List(board, 'l1', name='todo')
+    config = BoardConfig('my board')
+
+    with requests_mock.mock() as m:
+        m.get(API + 'members/me', text=json.dumps(ME))
+        m.get(API + 'cards/1', text=json.dumps(card_json('1', 'l1')))
+        m.get(API + 'cards/2', status_code=404, text='not found')
+        service = TrelloTaskService(
+            client, [todo], [], {config.name: config},
+            since=datetime(2016, 8, 15, tzinfo=pytz.utc),
+            card_ids=['2', '1'])
+        tasks = service.get_all_tasks()
+        requests = [r.path for r in m.request_history]
+
+    assert service.partial
+    assert [t.id for t in tasks] == ['1']
+    assert service.get_removed_task_ids() == ['2']
+    # the cards are fetched concurrently, so the requests may arrive in any
+    # order
+    assert requests[0] == '/1/members/me'
+    assert sorted(requests[1:]) == ['/1/cards/1', '/1/cards/2']
+
+
+def test_boards_are_fetched_concurrently_in_a_stable_order(client):
+    boards = [Board(client, board_id=b, name=b) for b in ['b1', 'b2', 'b3']]
+    todo = [List(b, b.id + 'todo', name='todo') for b in boards]
+    done = [List(b, b.id + 'done', name='done') for b in boards]
+    config = {b.name: BoardConfig(b.name) for b in boards}
+
+    def cards(board_id):
+        todo_cards = [card_json(board_id + str(i), board_id + 'todo')
+                      for i in range(3)]
+        for i, c in enumerate(todo_cards):
+            c['pos'] = 3 - i
+        return todo_cards + [card_json(board_id + 'd', board_id + 'done')]
+
+    with requests_mock.mock() as m:
+        m.get(API + 'members/me', text=json.dumps(ME))
+        for b in boards:
+            m.get(
+                API + 'boards/{0}/cards/open'.format(b.id),
+                text=json.dumps(cards(b.id)))
+        service = TrelloTaskService(
+            client, todo, done, config, max_workers=3)
+        tasks = service.get_all_tasks()
+
+    assert [t.id for t in tasks] == [
+        'b12', 'b11', 'b10', 'b22', 'b21', 'b20', 'b32', 'b31', 'b30',
+        'b1d', 'b2d', 'b3d']
+    assert sorted(service.fetch_timings) == ['b1', 'b2', 'b3']
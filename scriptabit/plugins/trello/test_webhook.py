@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+""" Unit tests for the Trello webhook listener """
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+
+import base64
+import hashlib
+import hmac
+import json
+import time
+import pytest
+import requests
+
+from .webhook import WebhookListener
+
+
+@pytest.fixture
+def listener(request):
+    listener = WebhookListener(host='127.0.0.1', debounce=0.1, max_delay=1)
+    listener.start()
+    request.addfinalizer(listener.stop)
+    return listener
+
+
+def url(listener):
+    return 'http://127.0.0.1:{0}/'.format(listener.port)
+
+
+def event(card_id, action_type='updateCard'):
+    return json.dumps({
+        'action': {'type': action_type, 'data': {'card': {'id': card_id}}},
+        'model': {'id': 'b1'}})
+
+
+def test_head_for_webhook_creation(listener):
+    assert requests.head(url(listener)).status_code == 200
+
+
+def test_burst_is_debounced(listener):
+    for card_id in ['1', '2', '1', '3']:
+        assert requests.post(url(listener), data=event(card_id)).ok
+
+    start = time.time()
+    assert listener.wait(timeout=5) == set(['1', '2', '3'])
+    assert time.time() - start < 1
+
+    # the batch has been handed out
+    assert listener.wait(timeout=0.2) == set()
+
+
+def test_wait_times_out(listener):
+    start = time.time()
+    assert listener.wait(timeout=0.2) == set()
+    assert time.time() - start >= 0.2
+
+
+def test_continuous_events_are_released_after_max_delay():
+    listener = WebhookListener(debounce=0.2, max_delay=0.5)
+    start = time.time()
+    card_ids = set()
+    while not card_ids:
+        listener.add('1')
+        card_ids = listener.wait(timeout=0.05)
+    assert card_ids == set(['1'])
+    assert 0.5 <= time.time() - start < 1
+
+
+def test_non_card_actions_are_ignored(listener):
+    body = json.dumps({'action': {'type': 'updateBoard', 'data': {}}})
+    assert requests.post(url(listener), data=body).ok
+    assert requests.post(url(listener), data='junk').status_code == 400
+    assert listener.wait(timeout=0.3) == set()
+
+
+def test_signature():
+    callback = 'https://example.com/trello'
+    listener = WebhookListener(secret='secret', callback_url=callback)
+    body = event('1').encode('utf-8')
+    signature = base64.b64encode(hmac.new(
+        b'secret',
+        body + callback.encode('utf-8'),
+        hashlib.sha1).digest()).decode('ascii')
+
+    assert listener.receive(body, 'bad') == 401
+    assert listener.receive(body, signature) == 200
+
+
+def test_metadata_changes(listener):
+    body = json.dumps({'action': {'type': 'updateList', 'data': {}}})
+    assert requests.post(url(listener), data=body).ok
+    assert listener.pop_metadata_changed()
+    assert not listener.pop_metadata_changed()
+
+
+def test_unsigned_listener_is_local_and_warns(caplog):
+    listener = WebhookListener()
+    listener.start()
+    try:
+        assert listener.host == '127.0.0.1'
+    finally:
+        listener.stop()
+    assert 'signatures are not checked' in caplog.text
@@ -14,6 +14,7 @@ import logging
 import os
 import sys
 import json
+import time
 from configparser import ConfigParser, NoOptionError
 from datetime import datetime, timedelta
 import pytz
@@ -22,7 +23,8 @@ from scriptabit import (
     CharacterAttribute,
     Difficulty,
     HabiticaTaskService,
-    TaskMap,
+    parse_date_utc,
+    SyncState,
     TaskSync,
     )
 
@@ -30,7 +32,9 @@ from trello import TrelloClient
 from trello.util import create_oauth_token
 
 from .board_config import BoardConfig
+from .board_metadata import BoardMetadata
 from .trello_task_service import TrelloTaskService
+from .webhook import WebhookListener
 
 class Trello(scriptabit.IPlugin):
     """ Trello card synchronisation.
@@ -38,13 +42,21 @@ class Trello(scriptabit.IPlugin):
     Attributes:
         __tc: TrelloClient instance
         __habitica_task_service: The HabiticaTaskService instance
-        __task_map_file: = Task mapping data file
-        __data_file: Sync data file name
-        __data (Trello.PersistentData): Persistent sync data
+        __task_map_file: Task mapping data file written by earlier versions
+        __data_file: Sync data file written by earlier versions
+        __state_file: Sync state file (task map and last sync time)
+        __state: The sync state, loaded once and kept between syncs
+        __webhook: The webhook listener, or None if webhooks are disabled
+        __next_full_sync: When the next full sync is due, in webhook mode
+        __metadata: The cached board and list metadata
+        __hooked_boards: IDs of the boards known to have a webhook
+        __current_user: The cached Trello user
     """
 
     class PersistentData(object):
-        """ Data that needs to be persisted. """
+        """ Sync data written by earlier versions. Now only read, to import the
+        last sync time into the sync state.
+        """
 
         # The persistent time format string. Relying on locale default format
         # is problematic when the file is shared between systems as they may
@@ -67,21 +79,6 @@ class Trello(scriptabit.IPlugin):
                 # for catching new & completed tasks
                 self.last_sync = datetime.now(tz=pytz.utc) - timedelta(days=2)
 
-        def save(self, filename):
-            """ Saves the persistent data """
-            with open(filename, 'w') as f:
-                if sys.version_info < (3, 0):
-                    x = json.dumps(
-                        self.last_sync.strftime(self.TIME_FORMAT),
-                        encoding='UTF-8',
-                        ensure_ascii=False)
-                else:
-                    x = json.dumps(
-                        self.last_sync.strftime(self.TIME_FORMAT),
-                        ensure_ascii=False)
-
-                f.write(x)
-
     def __init__(self):
         """ Initialises the plugin.
         Generally nothing to do here other than initialise any class attributes.
@@ -91,8 +88,14 @@ class Trello(scriptabit.IPlugin):
         self.__habitica_task_service = None
         self.__task_map_file = None
         self.__data_file = None
-        self.__data = None
+        self.__state_file = None
+        self.__state = None
         self.__boards = None
+        self.__webhook = None
+        self.__next_full_sync = None
+        self.__metadata = None
+        self.__hooked_boards = set()
+        self.__current_user = None
 
     @staticmethod
     def supports_dry_runs():
@@ -155,6 +158,15 @@ If empty, then cards are only marked done when archived.''')
             default='trello_habitica_sync_data',
             help='''Filename to use for storing the synchronisation data.''')
 
+        parser.add(
+            '--trello-task-map',
+            required=False,
+            choices=['json', 'sqlite'],
+            default='json',
+            help='''Storage for the sync state (task mappings and last sync
+time). sqlite writes only the changed mappings, in one transaction. The
+files written by earlier versions are imported on first use.''')
+
         parser.add(
             '--trello-sync-description',
             required=False,
@@ -162,6 +174,100 @@ If empty, then cards are only marked done when archived.''')
             help='''Synchronises task description/extra text field.
 The default is to only synchronise the task names.''')
 
+        parser.add(
+            '--trello-fetch-timeout',
+            required=False,
+            type=float,
+            default=None,
+            help='''Seconds to wait for Trello and Habitica to return their
+tasks before abandoning the sync. The abandoned fetch can't be cancelled, and
+runs on in the background. Waits indefinitely if not set''')
+
+        parser.add(
+            '--trello-incremental',
+            required=False,
+            action='store_true',
+            help='''Only fetch the cards changed since the last sync, as
+reported by the board actions feed. A full scan is still made periodically
+(see --trello-full-sync-hours).''')
+
+        parser.add(
+            '--trello-full-sync-hours',
+            required=False,
+            type=float,
+            default=24,
+            help='''Hours between full scans of all cards when
+--trello-incremental is set''')
+
+        parser.add(
+            '--trello-stats-history',
+            required=False,
+            type=str,
+            default='',
+            help='''If set, the stats of each sync (phase timings, API
+latencies and task counts) are appended to this JSON lines file, in the data
+directory unless an absolute path is given''')
+
+        parser.add(
+            '--trello-fetch-workers',
+            required=False,
+            type=int,
+            default=4,
+            help='''Maximum number of Trello boards fetched at the same
+time''')
+
+        parser.add(
+            '--trello-persist-workers',
+            required=False,
+            type=int,
+            default=4,
+            help='''Maximum number of Habitica tasks written at the same time.
+All writes share the Habitica rate limit''')
+
+        parser.add(
+            '--trello-metadata-ttl',
+            required=False,
+            type=float,
+            default=60,
+            help='''Minutes to reuse the Trello board and list names before
+loading them again. Changes seen in the board actions reload them sooner.''')
+
+        parser.add(
+            '--trello-webhook-port',
+            required=False,
+            type=int,
+            default=0,
+            help='''If set, listen on this port for Trello webhook callbacks,
+and sync the changed cards as they arrive. The full sync still runs on the
+normal update interval.''')
+
+        parser.add(
+            '--trello-webhook-host',
+            required=False,
+            type=str,
+            default='127.0.0.1',
+            help='''The interface the webhook listener binds to. Defaults to
+the loopback interface, for use behind a reverse proxy or tunnel. Use an empty
+value for all interfaces''')
+
+        parser.add(
+            '--trello-webhook-url',
+            required=False,
+            type=str,
+            default='',
+            help='''The public URL that reaches the webhook listener. If set,
+webhooks are registered for the synchronised boards, and callbacks without a
+valid Trello signature are rejected. Without it, any request to the listener
+can trigger a sync.''')
+
+        parser.add(
+            '--trello-webhook-debounce',
+            required=False,
+            type=float,
+            default=5,
+            help='''Seconds to wait for a burst of webhook events to finish
+before syncing the changed cards''')
+
         self.print_help = parser.print_help
         return parser
 
@@ -207,36 +313,85 @@ The default is to only synchronise the task names.''')
         self.__habitica_task_service = HabiticaTaskService(
             habitica_service,
             dry_run=self.dry_run,
-            tags=['Trello', 'scriptabit'])
+            tags=['Trello', 'scriptabit'],
+            max_workers=self._config.trello_persist_workers)
 
+        # The task map and sync data files written by earlier versions. They
+        # are only read when no sync state has been saved yet.
         self.__task_map_file = os.path.join(
             self._data_dir,
             self._config.trello_data_file)
-        logging.getLogger(__name__).debug(
-            'TaskMap file: %s', self.__task_map_file)
-
         self.__data_file = os.path.join(
             self._data_dir,
             self._config.trello_data_file+'_extra')
+
+        self.__state_file = os.path.join(
+            self._data_dir,
+            self._config.trello_data_file + (
+                '.db' if self._config.trello_task_map == 'sqlite'
+                else '.state'))
         logging.getLogger(__name__).debug(
-            'Sync data file: %s', self.__data_file)
+            'Sync state file: %s', self.__state_file)
+        self.__state = self.__load_sync_state()
+
+        if self._config.trello_webhook_port:
+            self.__webhook = WebhookListener(
+                host=self._config.trello_webhook_host,
+                port=self._config.trello_webhook_port,
+                debounce=self._config.trello_webhook_debounce,
+                secret=credentials['apisecret'],
+                callback_url=self._config.trello_webhook_url or None)
+            self.__webhook.start()
+
+    def deactivate(self):
+        """ Stops the webhook listener, and releases the sync state. """
+        if self.__webhook:
+            self.__webhook.stop()
+            self.__webhook = None
+        self.__discard_sync_state()
+        super().deactivate()
 
-        self.__load_persistent_data()
+    def __load_sync_state(self):
+        """ Loads the sync state, importing the files written by earlier
+        versions if there is no saved state.
 
-    def __load_persistent_data(self):
-        """ Loads the persistent data """
-        self.__data = Trello.PersistentData(filename=self.__data_file)
+        Returns:
+            SyncState: The sync state.
+        """
+        logging.getLogger(__name__).debug('Loading sync state')
+        state = SyncState.load(
+            self.__state_file,
+            backend=self._config.trello_task_map,
+            legacy_task_map_file=self.__task_map_file)
+        if state.last_sync is None:
+            state.last_sync = Trello.PersistentData(
+                filename=self.__data_file
+                if os.path.exists(self.__data_file) else None).last_sync
+        return state
+
+    def __discard_sync_state(self):
+        """ Closes the sync state. Any changes that have not been saved are
+        lost, and the next sync loads the saved state again.
+        """
+        if self.__state:
+            self.__state.close()
+            self.__state = None
 
-    def __save_persistent_data(self):
-        """ Saves the persistent data """
-        self.__data.save(self.__data_file)
+    def __full_sync_interval_minutes(self):
+        """ Gets the interval between full syncs in minutes. """
+        return max(20, self._config.update_frequency)
 
     def update_interval_minutes(self):
         """ Indicates the required update interval in minutes.
 
+        When the webhook listener is running, `update` waits for webhook
+        events itself, so no further delay is required.
+
         Returns: float: The required update interval in minutes.
         """
-        return max(20, self._config.update_frequency)
+        if self.__webhook:
+            return 0
+        return self.__full_sync_interval_minutes()
 
     def update(self):
         """ This update method will be called once on every update cycle,
@@ -246,59 +401,183 @@ The default is to only synchronise the task names.''')
         If a plugin implements a single-shot function, then update should
         return `False`.
 
+        When the webhook listener is running, each update waits for a batch
+        of changed cards and syncs only those, until the next full sync is
+        due.
+
         Returns: bool: True if further updates are required; False if the plugin
         is finished and the application should shut down.
         """
+        card_ids = None
+        if self.__webhook and self.__next_full_sync:
+            timeout = (
+                self.__next_full_sync - datetime.now(tz=pytz.utc)
+            ).total_seconds()
+            if timeout > 0:
+                card_ids = self.__webhook.wait(timeout) or None
+
+        if card_ids is None:
+            self.__next_full_sync = datetime.now(tz=pytz.utc) + timedelta(
+                minutes=self.__full_sync_interval_minutes())
+        else:
+            logging.getLogger(__name__).info(
+                'Webhook sync of %d cards', len(card_ids))
+
+        self.__sync(card_ids)
+
+        # return False if finished, and True to be updated again.
+        return True
+
+    def __sync(self, card_ids=None):
+        """ Synchronises the Trello cards with Habitica.
+
+        Args:
+            card_ids (set): If set, only these cards are synchronised.
+        """
+        if not self.__state:
+            self.__state = self.__load_sync_state()
+
+        try:
+            self.__sync_state(self.__state, card_ids)
+        except BaseException:
+            # Don't carry a half-updated state into the next sync
+            self.__discard_sync_state()
+            raise
+
+    def __sync_state(self, state, card_ids):
+        """ Synchronises the Trello cards with Habitica, and saves the sync
+        state.
+
+        Args:
+            state (SyncState): The sync state.
+            card_ids (set): If set, only these cards are synchronised.
+        """
         # retrieve the boards to sync
-        boards = self.__tc.list_boards(board_filter='open')
-        sync_boards = [
-            b for b in boards if b.name in self.__boards]
+        metadata = self.__get_board_metadata(state)
+        board_lists = metadata.get_lists(self.__tc, self.__boards)
+        sync_boards = [b for b, _ in board_lists]
 
-        self.__ensure_labels_exist(sync_boards)
+        self.__ensure_labels_exist(sync_boards, metadata)
+        self.__ensure_webhooks_exist(sync_boards)
 
         # Build a list of sync lists by matching the sync
         # list names in each board
         sync_lists = []
         done_lists = []
-        for b in sync_boards:
-            for l in b.open_lists():
+        for _, lists in board_lists:
+            for l in lists:
                 if l.name in self._config.trello_lists:
                     sync_lists.append(l)
                 elif l.name in self._config.trello_done_lists:
                     done_lists.append(l)
 
-        # Load the task map from disk
-        logging.getLogger(__name__).debug('Loading task map')
-        task_map = TaskMap(self.__task_map_file)
+        # Any card changed after this point is picked up by the next
+        # incremental sync
+        watermark = datetime.now(tz=pytz.utc)
 
         # Create the services
         source_service = TrelloTaskService(
             self.__tc,
             sync_lists,
             done_lists,
-            self.__boards)
+            self.__boards,
+            since=self.__get_incremental_since(state, watermark),
+            card_ids=card_ids,
+            retry_ids=state.metadata.get('retry_ids', None),
+            current_user=self.__current_user,
+            max_workers=self._config.trello_fetch_workers)
+        self.__current_user = source_service.current_user
 
         # synchronise
         sync = TaskSync(
             source_service,
             self.__habitica_task_service,
-            task_map,
-            last_sync=self.__data.last_sync,
-            sync_description=self._config.trello_sync_description)
+            state.task_map,
+            last_sync=state.last_sync,
+            sync_description=self._config.trello_sync_description,
+            fetch_timeout=self._config.trello_fetch_timeout,
+            retry_ids=state.metadata.get('retry_ids', None))
 
         stats = sync.synchronise(clean_orphans=False)
+        if sync.retry_ids:
+            state.metadata['retry_ids'] = sync.retry_ids
+        else:
+            state.metadata.pop('retry_ids', None)
+
+        # Checkpoint the task map and sync data together. A targeted sync
+        # only saw some of the cards, so it doesn't move the watermarks.
+        if card_ids is None:
+            state.last_sync = sync.last_sync
+            state.metadata['action_watermark'] = watermark.isoformat()
+            if not source_service.partial:
+                state.metadata['last_full_sync'] = watermark.isoformat()
+        if source_service.metadata_changed:
+            logging.getLogger(__name__).info('Trello board metadata changed')
+            self.__metadata = None
+            state.metadata.pop('board_metadata', None)
+        else:
+            state.metadata['board_metadata'] = metadata.as_dict()
+        if not self.dry_run:
+            logging.getLogger(__name__).debug('Saving sync state')
+            save_start = time.time()
+            state.save(self.__state_file)
+            stats.phases['state_save'] = time.time() - save_start
 
+        # report once the state is saved, so the stats include the save time
         self.__notify(stats)
 
-        # Checkpoint the sync data
-        self.__data.last_sync = sync.last_sync
-        if not self.dry_run:
-            logging.getLogger(__name__).debug('Saving task map')
-            task_map.persist(self.__task_map_file)
-            self.__save_persistent_data()
+        if self._config.trello_stats_history:
+            stats.append_to_history(os.path.join(
+                self._data_dir,
+                self._config.trello_stats_history))
 
-        # return False if finished, and True to be updated again.
-        return True
+    def __get_board_metadata(self, state):
+        """ Gets the board and list metadata, from the cache if it is still
+        valid.
+
+        Args:
+            state (SyncState): The sync state, which holds the metadata saved
+                by the last run.
+
+        Returns:
+            BoardMetadata: The metadata.
+        """
+        metadata = self.__metadata or BoardMetadata.from_dict(
+            state.metadata.get('board_metadata', None))
+        changed = self.__webhook and self.__webhook.pop_metadata_changed()
+        ttl = timedelta(minutes=self._config.trello_metadata_ttl)
+        if not metadata or changed or metadata.expired(ttl):
+            metadata = BoardMetadata.fetch(self.__tc)
+        self.__metadata = metadata
+        return metadata
+
+    def __get_incremental_since(self, state, now):
+        """ Gets the watermark for an incremental sync.
+
+        Args:
+            state (SyncState): The sync state.
+            now (datetime): The current time (UTC).
+
+        Returns:
+            datetime: The time to fetch changed cards since, or None if a full
+            scan is required.
+        """
+        if not self._config.trello_incremental:
+            return None
+
+        watermark = state.metadata.get('action_watermark', None)
+        last_full_sync = state.metadata.get('last_full_sync', None)
+        if not watermark or not last_full_sync:
+            logging.getLogger(__name__).info('No watermark: full sync')
+            return None
+
+        full_sync_interval = timedelta(
+            hours=self._config.trello_full_sync_hours)
+        if now - parse_date_utc(last_full_sync) >= full_sync_interval:
+            logging.getLogger(__name__).info('Scheduled full sync')
+            return None
+
+        return parse_date_utc(watermark)
 
     def __notify(self, sync_stats):
         """ notify the user about the sync stats.
@@ -398,12 +677,40 @@ The default is to only synchronise the task names.''')
 
         return credentials
 
-    def __ensure_labels_exist(self, boards):
+    def __ensure_webhooks_exist(self, boards):
+        """ Ensures that a webhook is registered for each board, if a
+        webhook callback URL is configured.
+
+        Args:
+            boards (list): The list of boards that are being synchronised.
+        """
+        url = self._config.trello_webhook_url
+        if self.dry_run or not self.__webhook or not url:
+            return
+
+        if all(b.id in self.__hooked_boards for b in boards):
+            return
+
+        self.__hooked_boards = set(
+            h.id_model for h in self.__tc.list_hooks()
+            if h.callback_url == url)
+        for b in boards:
+            if b.id not in self.__hooked_boards:
+                logging.getLogger(__name__).info(
+                    'Board "%s": registering webhook', b.name)
+                self.__tc.create_hook(url, b.id, desc='scriptabit')
+                self.__hooked_boards.add(b.id)
+
+    def __ensure_labels_exist(self, boards, metadata):
         """ Ensures that the Trello labels used to mark task difficulty and
         Habitica character attributes exist.
 
+        Boards that have already been checked are recorded in the metadata,
+        and are not checked again until the metadata is reloaded.
+
         Args:
             boards (list): The list of boards that are being synchronised.
+            metadata (BoardMetadata): The board metadata.
         """
         if self.dry_run:
             return
@@ -414,11 +721,14 @@ The default is to only synchronise the task names.''')
         required_labels.append('no sync')
 
         for b in boards:
+            if b.id in metadata.labelled:
+                continue
+            labels = set(x.name for x in b.get_labels(limit=1000))
             for rl in required_labels:
-                found = [x for x in b.get_labels() if x.name == rl]
-                if not found:
+                if rl not in labels:
                     logging.getLogger(__name__).info(
                         'Board "%s": Label "%s" not found, creating',
                         b.name,
                         rl)
                     b.add_label(rl, color=None)
+            metadata.labelled.add(b.id)
@@ -22,7 +22,8 @@ class TrelloTask(Task):
             card,
             default_difficulty=Difficulty.default,
             default_attribute=CharacterAttribute.default,
-            force_completed=False):
+            force_completed=False,
+            checklist=None):
         """ Initialise the Trello task.
 
         Args:
@@ -33,12 +34,16 @@ class TrelloTask(Task):
                 to use if the card does not have an attribute label applied.
             force_completed (bool): If True, the task will report as completed
                 even if card.closed is False.
+            checklist (list): The merged card checklists, as a list of
+                `ChecklistItem`, if they have already been loaded. If None,
+                they are fetched from Trello when first needed.
         """
         super().__init__()
         self.__card = card
         self.__default_difficulty = default_difficulty
         self.__default_attribute = default_attribute
         self.__force_completed = force_completed
+        self.__checklist = checklist
 
     @property
     def id(self):
@@ -132,19 +137,23 @@ class TrelloTask(Task):
     @property
     def checklist(self):
         """ The checklist, or None if there is no checklist."""
-        # merge all trello checklists into a single list
-        checklist = []
+        if self.__checklist is None:
+            # merge all trello checklists into a single list
+            checklist = []
 
-        # unfortunately the py-trello lazy checklist load only works if all
-        # card data is fetched first.
-        self.__card.fetch()
+            # unfortunately the py-trello lazy checklist load only works if
+            # all card data is fetched first.
+            self.__card.fetch()
 
-        if self.__card.checklists:
-            for cl in self.__card.checklists:
-                for i in cl.items:
-                    checklist.append(ChecklistItem(i['name'], i['checked']))
+            if self.__card.checklists:
+                for cl in self.__card.checklists:
+                    for i in cl.items:
+                        checklist.append(
+                            ChecklistItem(i['name'], i['checked']))
 
-        return checklist
+            self.__checklist = checklist
+
+        return self.__checklist
 
     @checklist.setter
     def checklist(self, checklist):
@@ -8,21 +8,47 @@ from __future__ import (
     print_function,
     unicode_literals)
 from builtins import *
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from scriptabit import TaskService
+from scriptabit import ChecklistItem, LatencyRecorder, TaskService
+from trello import Card, ResourceUnavailable
 
+from .board_metadata import METADATA_ACTIONS
 from .trello_task import TrelloTask
 
 # TODO: Implement dry run support if I implement task writing
 class TrelloTaskService(TaskService):
     """ Implements the Trello synchronisation task service.
+
+    In incremental mode, the board actions feed is read to find the cards
+    changed since a watermark, and only those cards are fetched. If a board
+    has more actions than can be read in one request, the service falls back
+    to a full scan.
+
+    In targeted mode, only the given cards are fetched, for example those
+    reported by a webhook.
+
+    Boards, and the cards in incremental and targeted modes, are fetched
+    concurrently by a bounded pool of workers. The tasks are always returned
+    in the same order: by list, in the order given, then by card position.
     """
+
+    # The maximum number of actions Trello returns in one request
+    ACTION_LIMIT = 1000
+
     def __init__(
             self,
             trello_client,
             lists,
             done_lists,
-            board_config):
+            board_config,
+            since=None,
+            card_ids=None,
+            retry_ids=None,
+            current_user=None,
+            max_workers=4):
         """ Initialises the Trello synchronisation task service.
 
         Args:
@@ -31,20 +57,204 @@ class TrelloTaskService(TaskService):
             done_lists (list): The list of Trello boards containing
                 completed tasks.
             board_config (dict): The dictionary of board configuration data.
+            since (datetime): If set, only cards changed since this time are
+                fetched (incremental mode). Otherwise all cards are fetched.
+            card_ids (iterable): If set, only these cards are fetched
+                (targeted mode). Takes precedence over `since`.
+            retry_ids (iterable): The IDs of cards that an earlier sync failed
+                to write. In incremental and targeted modes, these cards are
+                fetched along with the changed cards.
+            current_user (trello.Member): The Trello user. Fetched if not
+                given.
+            max_workers (int): The maximum number of concurrent requests.
         """
         super().__init__()
         self.__tc = trello_client
         self.__lists = lists
         self.__done_lists = done_lists
         self.__board_config = board_config
-        self.__current_user = trello_client.get_member('me')
+        self.__current_user = current_user or trello_client.get_member('me')
+        self.__since = since
+        self.__card_ids = card_ids
+        self.__retry_ids = set(retry_ids or ())
+        self.__partial = False
+        self.__removed_ids = []
+        self.__metadata_changed = False
+        self.__max_workers = max(1, max_workers)
+        self.__fetch_timings = {}
+        self.__latencies = LatencyRecorder()
+
+    @property
+    def partial(self):
+        """ True if the last `get_all_tasks` call was incremental. """
+        return self.__partial
+
+    @property
+    def current_user(self):
+        """ The Trello user. """
+        return self.__current_user
+
+    @property
+    def fetch_timings(self):
+        """ Seconds spent fetching each board in the last `get_all_tasks`
+        call, keyed by board name. """
+        return self.__fetch_timings
+
+    @property
+    def latencies(self):
+        """ The latencies of the Trello API calls. """
+        return self.__latencies
+
+    @property
+    def metadata_changed(self):
+        """ True if the last incremental `get_all_tasks` call saw changes
+        to the boards, lists or labels. """
+        return self.__metadata_changed
+
+    def get_removed_task_ids(self):
+        """ Gets the IDs of changed cards that are no longer synchronised,
+        because they were deleted, archived, moved to another list, or are
+        otherwise excluded.
+
+        Returns:
+            list: The card IDs.
+        """
+        return self.__removed_ids
+
+    def __fetch_json(self, url, query_params):
+        """ Makes a Trello API call, recording its latency. """
+        start = time.time()
+        try:
+            return self.__tc.fetch_json(url, query_params=query_params)
+        finally:
+            self.__latencies.record(time.time() - start)
+
+    def __map(self, func, items):
+        """ Calls a function on each item, using the worker pool.
+
+        Args:
+            func (callable): The function.
+            items (list): The items.
+
+        Returns:
+            list: The results, in the same order as the items.
+        """
+        if len(items) < 2 or self.__max_workers == 1:
+            return [func(i) for i in items]
+        with ThreadPoolExecutor(
+                max_workers=min(self.__max_workers, len(items))) as executor:
+            return list(executor.map(func, items))
 
-    def __get_tasks_from_lists(self, lists, force_completed):
+    def __timed_board_fetch(self, func, boards):
+        """ Calls a fetch function on each board, using the worker pool,
+        and records the time taken by each board.
+
+        Args:
+            func (callable): The fetch function, taking a board.
+            boards (dict): The boards, keyed by board ID.
+
+        Returns:
+            dict: The fetch results, keyed by board ID.
+        """
+        def timed(board):
+            start = time.time()
+            result = func(board)
+            return board, result, time.time() - start
+
+        results = {}
+        for board, result, duration in self.__map(
+                timed,
+                list(boards.values())):
+            results[board.id] = result
+            self.__fetch_timings[board.name] = \
+                self.__fetch_timings.get(board.name, 0) + duration
+        return results
+
+    def __fetch_board_cards(self, board):
+        """ Fetches all open cards on a board, with their checklists, in a
+        single request.
+
+        Args:
+            board (trello.Board): The board.
+
+        Returns:
+            list: The card JSON objects.
+        """
+        logging.getLogger(__name__).debug(
+            'Fetching cards on board %s', board.name)
+        return self.__fetch_json(
+            '/boards/{0}/cards/open'.format(board.id),
+            query_params={
+                'fields': 'all',
+                'checklists': 'all',
+            })
+
+    @staticmethod
+    def __get_checklist(card_json):
+        """ Merges the checklists in a card JSON object into a single list.
+
+        Args:
+            card_json (dict): The card JSON, including its checklists.
+
+        Returns:
+            list: The list of `ChecklistItem`.
+        """
+        checklist = []
+        checklists = sorted(
+            card_json.get('checklists', []),
+            key=lambda cl: cl.get('pos', 0))
+        for cl in checklists:
+            items = sorted(
+                cl.get('checkItems', []),
+                key=lambda i: i.get('pos', 0))
+            for i in items:
+                checklist.append(
+                    ChecklistItem(i['name'], i['state'] == 'complete'))
+        return checklist
+
+    def __create_task(self, trello_list, force_completed, card_json):
+        """ Creates a task from a card, if the card should be synchronised.
+
+        Args:
+            trello_list (trello.List): The list containing the card.
+            force_completed (bool): The completion status override.
+            card_json (dict): The card JSON, including its checklists.
+
+        Returns:
+            TrelloTask: The task, or None if the card is not synchronised.
+        """
+        board_defaults = self.__board_config[trello_list.board.name]
+
+        # Check whether we can use this card or not based on the board
+        # settings: all cards or only those assigned to the current user
+        use_card = False
+
+        labels = [x['name'] for x in card_json.get('labels', [])]
+        if 'no sync' in labels:
+            use_card = False
+        elif board_defaults.all_cards:
+            use_card = True
+        else:
+            use_card = self.__current_user.id in card_json['idMembers']
+
+        if not use_card:
+            return None
+
+        return TrelloTask(
+            Card.from_json(trello_list, card_json),
+            default_difficulty=board_defaults.difficulty,
+            default_attribute=board_defaults.attribute,
+            force_completed=force_completed,
+            checklist=self.__get_checklist(card_json))
+
+    def __get_tasks_from_lists(self, lists, force_completed, board_cards):
         """ Gets all tasks from a list of Trello lists.
 
         Args:
             lists (list): The Trello lists.
             force_completed (bool): The completion status override.
+            board_cards (dict): The open card JSON objects for each board,
+                keyed by board ID.
 
         Returns:
             list: The list of TrelloTask instances.
@@ -52,43 +262,159 @@ class TrelloTaskService(TaskService):
         tasks = []
 
         for l in lists:
-            board_defaults = self.__board_config[l.board.name]
-            for card in l.list_cards(card_filter='open'):
-
-                # Check whether we can use this card or not based on the board
-                # settings: all cards or only those assigned to the current user
-                use_card = False
-
-                if 'no sync' in [l.name for l in card.labels]:
-                    use_card = False
-                elif board_defaults.all_cards:
-                    use_card = True
-                else:
-                    card.fetch()  # we need the fetch to get the user ID
-                    use_card = self.__current_user.id in card.member_id
-
-                if use_card:
-                    task = TrelloTask(
-                        card,
-                        default_difficulty=board_defaults.difficulty,
-                        default_attribute=board_defaults.attribute,
-                        force_completed=force_completed)
+            cards = sorted(
+                (c for c in board_cards[l.board.id] if c['idList'] == l.id),
+                key=lambda c: c.get('pos', 0))
+            for card_json in cards:
+                task = self.__create_task(l, force_completed, card_json)
+                if task:
                     tasks.append(task)
         return tasks
 
+    def __get_boards(self):
+        """ Gets the boards containing the sync and done lists.
+
+        Returns:
+            dict: The boards, keyed by board ID.
+        """
+        boards = {}
+        for l in self.__lists + self.__done_lists:
+            boards[l.board.id] = l.board
+        return boards
+
+    def __get_changed_card_ids(self, boards):
+        """ Gets the IDs of the cards changed since the watermark.
+
+        Args:
+            boards (dict): The boards to check, keyed by board ID.
+
+        Returns:
+            set: The card IDs, or None if there were too many actions to read
+            in one request.
+        """
+        since = self.__since.isoformat()
+
+        def fetch_actions(board):
+            return self.__fetch_json(
+                '/boards/{0}/actions'.format(board.id),
+                query_params={
+                    'filter': 'all',
+                    'limit': self.ACTION_LIMIT,
+                    'since': since,
+                })
+
+        board_actions = self.__timed_board_fetch(fetch_actions, boards)
+
+        card_ids = set()
+        for board_id, actions in board_actions.items():
+            if len(actions) >= self.ACTION_LIMIT:
+                logging.getLogger(__name__).info(
+                    'Too many actions on board %s for an incremental sync',
+                    boards[board_id].name)
+                return None
+            for action in actions:
+                if action.get('type') in METADATA_ACTIONS:
+                    self.__metadata_changed = True
+                card = action.get('data', {}).get('card', None)
+                if card and 'id' in card:
+                    card_ids.add(card['id'])
+        return card_ids
+
+    def __get_changed_tasks(self, card_ids):
+        """ Fetches the changed cards, and records the removed cards.
+
+        Args:
+            card_ids (set): The IDs of the changed cards.
+
+        Returns:
+            list: The tasks for the changed cards that are still synchronised.
+        """
+        lists = {l.id: (l, False) for l in self.__lists}
+        lists.update({l.id: (l, True) for l in self.__done_lists})
+        list_order = [l.id for l in self.__lists + self.__done_lists]
+
+        def fetch_card(card_id):
+            try:
+                return card_id, self.__fetch_json(
+                    '/cards/{0}'.format(card_id),
+                    query_params={
+                        'fields': 'all',
+                        'checklists': 'all',
+                    })
+            except ResourceUnavailable:
+                # deleted, or moved to a board we can't see
+                return card_id, None
+
+        cards = []
+        self.__removed_ids = []
+        for card_id, card_json in self.__map(fetch_card, sorted(card_ids)):
+            if card_json and not card_json['closed'] and \
+                    card_json['idList'] in lists:
+                cards.append(card_json)
+            else:
+                self.__removed_ids.append(card_id)
+
+        cards.sort(key=lambda c: (
+            list_order.index(c['idList']), c.get('pos', 0)))
+
+        tasks = []
+        for card_json in cards:
+            trello_list, force_completed = lists[card_json['idList']]
+            task = self.__create_task(
+                trello_list,
+                force_completed,
+                card_json)
+            if task:
+                tasks.append(task)
+            else:
+                self.__removed_ids.append(card_json['id'])
+
+        self.__removed_ids.sort()
+        return tasks
+
     def get_all_tasks(self):
         """ Get all tasks.
 
+        In a full scan, the open cards on each board are loaded with one
+        request, and the tasks are built from that snapshot. In incremental
+        and targeted modes, only the changed cards are returned (see
+        `partial`).
+
         Returns:
             list: The list of tasks
         """
+        self.__fetch_timings = {}
+
+        if self.__card_ids is not None:
+            self.__partial = True
+            return self.__get_changed_tasks(
+                set(self.__card_ids) | self.__retry_ids)
+
+        boards = self.__get_boards()
+
+        if self.__since:
+            card_ids = self.__get_changed_card_ids(boards)
+            if card_ids is not None:
+                self.__partial = True
+                logging.getLogger(__name__).debug(
+                    '%d cards changed since %s', len(card_ids), self.__since)
+                return self.__get_changed_tasks(card_ids | self.__retry_ids)
+
+        self.__partial = False
+        self.__removed_ids = []
+        board_cards = self.__timed_board_fetch(
+            self.__fetch_board_cards,
+            boards)
+
         tasks = self.__get_tasks_from_lists(
             self.__lists,
-            force_completed=False)
+            force_completed=False,
+            board_cards=board_cards)
 
         tasks.extend(self.__get_tasks_from_lists(
             self.__done_lists,
-            force_completed=True))
+            force_completed=True,
+            board_cards=board_cards))
 
         return tasks
 
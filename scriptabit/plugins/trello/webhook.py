@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+""" An embedded HTTP listener for Trello webhook callbacks.
+
+Trello posts an action to the webhook callback URL whenever something changes
+on a watched board. The listener collects the IDs of the changed cards, and
+hands them out in debounced batches, so that a burst of edits to a card
+becomes a single targeted sync.
+"""
+# Ensure backwards compatibility with Python 2
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals)
+from builtins import *
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from .board_metadata import METADATA_ACTIONS
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    """ Threaded HTTP server carrying a reference to its listener. """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, listener):
+        HTTPServer.__init__(self, address, _Handler)
+        self.listener = listener
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """ Handles the Trello webhook requests. """
+
+    def __reply(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_HEAD(self):
+        """ Trello checks that the callback URL exists with a HEAD request
+        when the webhook is created. """
+        self.__reply(200)
+
+    def do_GET(self):
+        """ Allows the listener to be checked from a browser. """
+        self.__reply(200)
+
+    def do_POST(self):
+        """ Receives a webhook action. """
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        signature = self.headers.get('X-Trello-Webhook', '')
+        self.__reply(self.server.listener.receive(body, signature))
+
+    def log_message(self, format, *args):
+        logging.getLogger(__name__).debug(
+            'Webhook %s: %s', self.address_string(), format % args)
+
+
+class WebhookListener(object):
+    """ Receives Trello webhook callbacks, and queues the changed card IDs.
+
+    The IDs are released by `wait` once no new event has arrived for the
+    debounce interval, or once the oldest queued event is `max_delay` seconds
+    old, so that a constant stream of events can't delay a sync forever.
+    """
+
+    def __init__(
+            self,
+            host='127.0.0.1',
+            port=0,
+            debounce=5,
+            max_delay=60,
+            secret=None,
+            callback_url=None):
+        """ Initialises the listener. The listener is not started.
+
+        Args:
+            host (str): The interface to listen on. Empty for all interfaces.
+                Defaults to the loopback interface.
+            port (int): The port to listen on. 0 picks a free port.
+            debounce (float): Seconds without events before the queued card
+                IDs are released.
+            max_delay (float): Maximum seconds a queued card ID is held.
+            secret (str): The Trello API secret. If set with `callback_url`,
+                requests without a valid Trello signature are rejected.
+                Otherwise every request is accepted.
+            callback_url (str): The callback URL registered with Trello.
+        """
+        self.__address = (host, port)
+        self.__debounce = debounce
+        self.__max_delay = max_delay
+        self.__secret = secret
+        self.__callback_url = callback_url
+        self.__server = None
+        self.__thread = None
+        self.__condition = threading.Condition()
+        self.__card_ids = set()
+        self.__first_event = None
+        self.__last_event = None
+        self.__metadata_changed = False
+
+    @property
+    def host(self):
+        """ The interface the listener is bound to, or None if not started.
+        """
+        return self.__server.server_address[0] if self.__server else None
+
+    @property
+    def port(self):
+        """ The port the listener is bound to, or None if not started. """
+        return self.__server.server_address[1] if self.__server else None
+
+    def start(self):
+        """ Starts listening, on a background thread. """
+        self.__server = _Server(self.__address, self)
+        self.__thread = threading.Thread(
+            target=self.__server.serve_forever,
+            name='trello-webhook')
+        self.__thread.daemon = True
+        self.__thread.start()
+        logging.getLogger(__name__).info(
+            'Listening for Trello webhooks on port %d', self.port)
+        if not (self.__secret and self.__callback_url):
+            logging.getLogger(__name__).warning(
+                'No webhook callback URL is set, so Trello signatures are not '
+                'checked and any request to port %d can trigger a sync',
+                self.port)
+
+    def stop(self):
+        """ Stops listening. """
+        if self.__server:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__thread.join()
+            self.__server = None
+            self.__thread = None
+
+    def __verify(self, body, signature):
+        """ Checks the Trello signature of a request body.
+
+        Trello signs the body followed by the callback URL with HMAC-SHA1,
+        keyed by the API secret.
+        """
+        if not (self.__secret and self.__callback_url):
+            return True
+        digest = hmac.new(
+            self.__secret.encode('utf-8'),
+            body + self.__callback_url.encode('utf-8'),
+            hashlib.sha1).digest()
+        expected = base64.b64encode(digest).decode('ascii')
+        return hmac.compare_digest(expected, signature)
+
+    def receive(self, body, signature=''):
+        """ Handles the body of a webhook request.
+
+        Args:
+            body (bytes): The request body.
+            signature (str): The X-Trello-Webhook header value.
+
+        Returns:
+            int: The HTTP status for the response.
+        """
+        if not self.__verify(body, signature):
+            logging.getLogger(__name__).warning(
+                'Rejected webhook request with an invalid signature')
+            return 401
+
+        try:
+            action = json.loads(body.decode('utf-8'))['action']
+        except (ValueError, KeyError, TypeError):
+            return 400
+
+        if action.get('type') in METADATA_ACTIONS:
+            with self.__condition:
+                self.__metadata_changed = True
+
+        card = action.get('data', {}).get('card', None)
+        if card and 'id' in card:
+            logging.getLogger(__name__).debug(
+                'Webhook %s: card %s', action.get('type'), card['id'])
+            self.add(card['id'])
+        return 200
+
+    def pop_metadata_changed(self):
+        """ Checks for, and clears, changes to the boards, lists or labels
+        since the last call.
+
+        Returns:
+            bool: True if the metadata changed.
+        """
+        with self.__condition:
+            changed = self.__metadata_changed
+            self.__metadata_changed = False
+            return changed
+
+    def add(self, card_id):
+        """ Queues a changed card ID.
+
+        Args:
+            card_id (str): The card ID.
+        """
+        with self.__condition:
+            now = time.time()
+            if not self.__card_ids:
+                self.__first_event = now
+            self.__last_event = now
+            self.__card_ids.add(card_id)
+            self.__condition.notify_all()
+
+    def __release_time(self):
+        """ Gets the time the queued card IDs are due, or None if none are
+        queued. """
+        if not self.__card_ids:
+            return None
+        return min(
+            self.__last_event + self.__debounce,
+            self.__first_event + self.__max_delay)
+
+    def wait(self, timeout=None):
+        """ Waits for a debounced batch of changed card IDs.
+
+        Args:
+            timeout (float): The maximum seconds to wait. None waits
+                indefinitely.
+
+        Returns:
+            set: The changed card IDs. Empty if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.__condition:
+            while True:
+                now = time.time()
+                due = self.__release_time()
+                if due is not None and due <= now:
+                    card_ids = self.__card_ids
+                    self.__card_ids = set()
+                    return card_ids
+
+                if deadline is not None and deadline <= now:
+                    return set()
+
+                wake = [t for t in (due, deadline) if t is not None]
+                self.__condition.wait(min(wake) - now if wake else None)
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+""" Token bucket rate limiting for Habitica API calls.
+
+The bucket refills at a configured rate until the server tells us otherwise.
+Habitica reports its own view of the quota with every response, using the
+``X-RateLimit-Limit``, ``X-RateLimit-Remaining`` and ``X-RateLimit-Reset``
+headers, and sends ``Retry-After`` with a 429 (Too Many Requests) response.
+When those headers are present they replace the local estimate, so bulk
+operations run as fast as the server allows and pause only when the quota is
+exhausted.
+"""
+
+# Ensure backwards compatibility with Python 2
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals)
+from builtins import *
+import calendar
+import re
+import threading
+import time
+from datetime import datetime
+from email.utils import mktime_tz, parsedate_tz
+
+
+def parse_reset_time(value, now):
+    """ Parses a rate limit reset or retry header into an epoch time.
+
+    Servers use several formats for these headers, so this accepts:
+
+        - a delay in seconds (``Retry-After: 30``)
+        - an epoch time in seconds or milliseconds
+        - an RFC 1123 HTTP date (``Retry-After: Wed, 21 Oct 2015 07:28:00 GMT``)
+        - a JavaScript date string, as sent by Habitica
+          (``Thu Oct 19 2023 10:00:00 GMT+0000 (Coordinated Universal Time)``)
+
+    Args:
+        value (str): The header value.
+        now (float): The current epoch time in seconds.
+
+    Returns:
+        float: The epoch time in seconds, or None if the value can't be parsed.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+
+    try:
+        number = float(value)
+        if number > 1e12:
+            return number / 1000
+        if number > 1e9:
+            return number
+        return now + max(0, number)
+    except ValueError:
+        pass
+
+    match = re.match(
+        r'\w{3} (\w{3} \d{1,2} \d{4} \d{2}:\d{2}:\d{2}) GMT([+-])(\d{2})(\d{2})',
+        value)
+    if match:
+        stamp = datetime.strptime(match.group(1), '%b %d %Y %H:%M:%S')
+        offset = int(match.group(3)) * 3600 + int(match.group(4)) * 60
+        if match.group(2) == '-':
+            offset = -offset
+        return calendar.timegm(stamp.timetuple()) - offset
+
+    parsed = parsedate_tz(value)
+    if parsed:
+        return mktime_tz(parsed)
+
+    return None
+
+
+class RateLimiter(object):
+    """ Thread-safe token bucket that follows server rate limit headers.
+
+    Callers reserve a token before each request and sleep for the returned
+    delay. Reservations may drive the bucket negative, so concurrent callers
+    queue up behind each other instead of all waking at the same moment.
+    """
+    def __init__(
+            self,
+            rate=0.5,
+            capacity=30,
+            clock=time.time,
+            sleep=time.sleep):
+        """ Initialises the rate limiter.
+
+        Args:
+            rate (float): Tokens added per second while the server has not
+                reported its own quota. Habitica allows 30 requests a minute.
+            capacity (int): The maximum number of tokens, which is also the
+                largest burst allowed. Replaced by ``X-RateLimit-Limit`` when
+                the server sends it.
+            clock (callable): Returns the current epoch time in seconds.
+            sleep (callable): Sleeps for the given number of seconds.
+        """
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+
+        self.__rate = float(rate)
+        self.__capacity = float(capacity)
+        self.__tokens = float(capacity)
+        self.__clock = clock
+        self.__sleep = sleep
+        self.__last_refill = clock()
+        self.__reset_at = None
+        self.__blocked_until = 0
+        self.__in_flight = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def rate(self):
+        """ The refill rate in tokens per second. """
+        return self.__rate
+
+    @property
+    def capacity(self):
+        """ The bucket capacity. """
+        return self.__capacity
+
+    @property
+    def tokens(self):
+        """ The number of tokens currently available. May be negative. """
+        with self.__lock:
+            self.__refill(self.__clock())
+            return self.__tokens
+
+    def __refill(self, now):
+        """ Adds tokens for the time elapsed since the last refill.
+
+        While a server reset time is known, the server owns the quota: tokens
+        are not trickled in, but the bucket is filled when the window resets.
+        Must be called with the lock held.
+        """
+        if self.__reset_at is not None:
+            if now >= self.__reset_at:
+                # callers already waiting on the reset keep their claim on
+                # the new window
+                self.__tokens = min(
+                    self.__capacity,
+                    self.__tokens + self.__capacity)
+                self.__reset_at = None
+        else:
+            elapsed = max(0, now - self.__last_refill)
+            self.__tokens = min(
+                self.__capacity,
+                self.__tokens + elapsed * self.__rate)
+        self.__last_refill = now
+
+    def reserve(self):
+        """ Takes a token, without blocking.
+
+        Returns:
+            float: The number of seconds the caller must wait before sending
+            the request.
+        """
+        with self.__lock:
+            now = self.__clock()
+            self.__refill(now)
+            self.__tokens -= 1
+            self.__in_flight += 1
+
+            wait = max(0, self.__blocked_until - now)
+            if self.__tokens < 0:
+                if self.__reset_at is not None:
+                    # This window's quota is used up. Wait for the reset, plus
+                    # a full window for every further window's worth of debt.
+                    windows = (-self.__tokens - 1) // self.__capacity
+                    window_length = self.__capacity / self.__rate
+                    wait = max(
+                        wait,
+                        self.__reset_at - now + windows * window_length)
+                else:
+                    wait = max(wait, -self.__tokens / self.__rate)
+            return wait
+
+    def acquire(self):
+        """ Takes a token, sleeping until the request may be sent.
+
+        Returns:
+            float: The number of seconds spent waiting.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            self.__sleep(wait)
+        return wait
+
+    def update(self, headers):
+        """ Updates the bucket from the rate limit headers of a response.
+
+        Must be called once for every reserved token, when its request
+        completes. Pass an empty dict if the request failed without a response.
+
+        Args:
+            headers (dict): The response headers. Lookups must be
+                case-insensitive, as with `requests` responses.
+        """
+        limit = headers.get('X-RateLimit-Limit')
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+
+        with self.__lock:
+            now = self.__clock()
+            self.__refill(now)
+
+            try:
+                if limit is not None:
+                    self.__capacity = max(1.0, float(limit))
+            except ValueError:
+                pass
+
+            self.__in_flight = max(0, self.__in_flight - 1)
+            try:
+                if remaining is not None:
+                    # The server has not yet counted the requests still in
+                    # flight, so take those off its figure.
+                    self.__tokens = float(remaining) - self.__in_flight
+            except ValueError:
+                pass
+
+            reset_at = parse_reset_time(reset, now)
+            if reset_at is not None and reset_at > now:
+                self.__reset_at = reset_at
+
+    def back_off(self, headers):
+        """ Pauses all callers after a 429 (Too Many Requests) response.
+
+        Args:
+            headers (dict): The response headers.
+
+        Returns:
+            float: The number of seconds callers will be paused for.
+        """
+        with self.__lock:
+            now = self.__clock()
+            resume = parse_reset_time(headers.get('Retry-After'), now)
+            if resume is None:
+                resume = parse_reset_time(
+                    headers.get('X-RateLimit-Reset'),
+                    now)
+            if resume is None:
+                # no hint from the server, wait for one token to trickle in
+                resume = now + 1 / self.__rate
+
+            self.__blocked_until = max(self.__blocked_until, resume)
+            self.__tokens = min(self.__tokens, 0)
+            return max(0, self.__blocked_until - now)
+
+    def estimate_duration(self, count):
+        """ Estimates how long `count` requests will take to send.
+
+        Args:
+            count (int): The number of requests.
+
+        Returns:
+            float: The estimated duration in seconds, ignoring server latency.
+        """
+        with self.__lock:
+            now = self.__clock()
+            self.__refill(now)
+            pending = max(0, self.__blocked_until - now)
+            deficit = count - max(0, self.__tokens)
+            if deficit <= 0:
+                return pending
+            return pending + deficit / self.__rate
@@ -27,6 +27,7 @@ from .configuration import (
 from .errors import ServerUnreachableError, PluginError
 from .habitica_service import HabiticaService
 from .metadata import __version__
+from .rate_limiter import RateLimiter
 from .utility_functions import UtilityFunctions
 
 
@@ -215,7 +216,17 @@ def run_scriptabit(plugin_name=''):
             # Habitica Service
             habitica_service = HabiticaService(
                 auth_tokens,
-                config.habitica_api_url)
+                config.habitica_api_url,
+                timeout=config.habitica_timeout,
+                pool_connections=config.habitica_pool_connections,
+                pool_maxsize=config.habitica_pool_maxsize,
+                pool_block=config.habitica_pool_block,
+                rate_limiter=RateLimiter(
+                    rate=config.habitica_rate_limit / 60,
+                    capacity=config.habitica_burst),
+                max_retries=config.habitica_max_retries,
+                user_cache_ttl=config.habitica_user_cache_ttl,
+                tag_cache_ttl=config.habitica_tag_cache_ttl)
 
             # Test for server availability
             if not habitica_service.is_server_up():
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+""" Defines persistent 1-1 task mappings, stored in an SQLite database.
+"""
+# Ensure backwards compatibility with Python 2
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals)
+from builtins import *
+
+import logging
+import os
+import sqlite3
+
+from bidict import (
+    KeyDuplicationError,
+    ValueDuplicationError,
+    KeyAndValueDuplicationError)
+
+from .task_map import TaskMap
+
+
+class SqliteTaskMap(object):
+    """ Persistent 1-1 task mapping, stored in an SQLite database.
+
+    A drop-in alternative to `TaskMap`. Both directions of the mapping are
+    indexed by the database, and changes made by `map`, `unmap` and `set_hash`
+    are held in a single transaction until `persist` commits them, so only the
+    changed mappings are written and an interrupted sync leaves the previous
+    state intact. Other sync state can be stored in the same transaction with
+    `set_meta`.
+
+    Task IDs must be strings.
+    """
+    def __init__(self, filename=':memory:', json_filename=None):
+        """ Initialise the SqliteTaskMap instance.
+
+        Args:
+            filename (str): The database file name. The database is created
+                if it does not exist.
+            json_filename (str): Optional `TaskMap` JSON file. The mappings in
+                this file are imported once, into a new database.
+        """
+        super().__init__()
+        self.__db = sqlite3.connect(filename)
+        self.__db.executescript('''
+            CREATE TABLE IF NOT EXISTS mappings (
+                src TEXT PRIMARY KEY,
+                dst TEXT NOT NULL UNIQUE,
+                hash TEXT);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT);
+            ''')
+        self.__db.commit()
+
+        if json_filename and os.path.exists(json_filename) and \
+                not self.__scalar('SELECT COUNT(*) FROM mappings') and \
+                not self.__scalar(
+                    'SELECT value FROM meta WHERE key = ?',
+                    ('migrated_from',)):
+            self.__migrate(json_filename)
+
+    def __scalar(self, sql, parameters=()):
+        """ Runs a query, returning the first column of the first row.
+
+        Returns:
+            The value, or None if there are no rows.
+        """
+        row = self.__db.execute(sql, parameters).fetchone()
+        return row[0] if row else None
+
+    def __migrate(self, json_filename):
+        """ Imports the mappings from a `TaskMap` JSON file.
+
+        Args:
+            json_filename (str): The JSON file name.
+        """
+        old = TaskMap(json_filename)
+        rows = [
+            (src, old.get_dst_id(src), old.get_hash(src))
+            for src in old.get_all_src_keys()]
+        with self.__db:
+            self.__db.executemany(
+                'INSERT INTO mappings (src, dst, hash) VALUES (?, ?, ?)',
+                rows)
+            self.__db.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                ('migrated_from', json_filename))
+        logging.getLogger(__name__).info(
+            'Imported %d task mappings from %s',
+            len(rows),
+            json_filename)
+
+    def close(self):
+        """ Closes the database, discarding any changes not persisted. """
+        self.__db.close()
+
+    def persist(self, filename=None):
+        """ Commits the changes made since the last call.
+
+        Args:
+            filename (str): Ignored. The mappings are always stored in the
+                database given to the constructor. Accepted for compatibility
+                with `TaskMap.persist`.
+        """
+        self.__db.commit()
+
+    def get_meta(self, key):
+        """ Get a value stored alongside the mappings.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            str: The value, or None if the key is not set.
+        """
+        return self.__scalar('SELECT value FROM meta WHERE key = ?', (key,))
+
+    def set_meta(self, key, value):
+        """ Store a value alongside the mappings. Like mapping changes, the
+        value is written by the next call to `persist`.
+
+        Args:
+            key (str): The key.
+            value (str): The value.
+        """
+        self.__db.execute(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            (key, value))
+
+    def map(self, src, dst):
+        """ Create a mapping between a source and destination task.
+
+        Args:
+            src (Task): The source task.
+            dst (Task): The destination task.
+
+        Raises:
+            KeyDuplicationError: the source task is already mapped.
+            ValueDuplicationError: the destination task is already mapped.
+            KeyAndValueDuplicationError: both tasks are already mapped.
+        """
+        src_exists = self.try_get_dst_id(src.id) is not False
+        dst_exists = self.try_get_src_id(dst.id) is not False
+        if src_exists and dst_exists:
+            raise KeyAndValueDuplicationError(src.id, dst.id)
+        if src_exists:
+            raise KeyDuplicationError(src.id)
+        if dst_exists:
+            raise ValueDuplicationError(dst.id)
+
+        self.__db.execute(
+            'INSERT INTO mappings (src, dst) VALUES (?, ?)',
+            (src.id, dst.id))
+
+    def unmap(self, src_id):
+        """ Delete a mapping.
+
+        Args:
+            src_id: The source id to unmap.
+
+        Raises:
+            KeyError: if the source ID has no mapping.
+        """
+        cursor = self.__db.execute(
+            'DELETE FROM mappings WHERE src = ?',
+            (src_id,))
+        if not cursor.rowcount:
+            raise KeyError(src_id)
+
+    def get_hash(self, src_id):
+        """ Get the content hash recorded for a mapping.
+
+        Args:
+            src_id: The source task ID.
+
+        Returns:
+            str: The content hash, or None if no hash has been recorded.
+        """
+        return self.__scalar(
+            'SELECT hash FROM mappings WHERE src = ?',
+            (src_id,))
+
+    def set_hash(self, src_id, content_hash):
+        """ Record the content hash for a mapping.
+
+        Args:
+            src_id: The source task ID.
+            content_hash (str): The content hash, or None to clear it.
+
+        Raises:
+            KeyError: if the source ID has no mapping.
+        """
+        cursor = self.__db.execute(
+            'UPDATE mappings SET hash = ? WHERE src = ?',
+            (content_hash or None, src_id))
+        if not cursor.rowcount:
+            raise KeyError(src_id)
+
+    def get_dst_id(self, _id):
+        """ Get the mapped destination task ID for a source task.
+
+        Args:
+            _id: The source task ID.
+
+        Returns:
+            If a mapping exists, the destination task ID.
+
+        Raises:
+            KeyError: if the input ID has no mapping.
+        """
+        dst = self.try_get_dst_id(_id)
+        if dst is False:
+            raise KeyError(_id)
+        return dst
+
+    def get_src_id(self, _id):
+        """ Get the mapped source task ID for a destination task.
+
+        Args:
+            _id: The destination task.
+
+        Returns:
+            If a mapping exists, the source task ID.
+
+        Raises:
+            KeyError: if the input ID has no mapping.
+        """
+        src = self.try_get_src_id(_id)
+        if src is False:
+            raise KeyError(_id)
+        return src
+
+    def try_get_dst_id(self, _id):
+        """ Get the mapped destination task ID for a source task.
+
+        Args:
+            _id: The source task ID
+
+        Returns:
+            str: If a mapping exists, the destination task ID, otherwise False.
+        """
+        dst = self.__scalar('SELECT dst FROM mappings WHERE src = ?', (_id,))
+        return dst if dst is not None else False
+
+    def try_get_src_id(self, _id):
+        """ Get the mapped source task ID for a destination task.
+
+        Args:
+            _id: The destination task ID
+
+        Returns:
+            str: If a mapping exists, the source task ID, otherwise False.
+        """
+        src = self.__scalar('SELECT src FROM mappings WHERE dst = ?', (_id,))
+        return src if src is not None else False
+
+    def get_all_src_keys(self):
+        """ Gets a list of all source keys.
+
+        Returns:
+            list: all source keys.
+        """
+        return [r[0] for r in self.__db.execute('SELECT src FROM mappings')]
+
+    def get_all_dst_keys(self):
+        """ Gets a list of all destination keys.
+
+        Returns:
+            list: all destination keys.
+        """
+        return [r[0] for r in self.__db.execute('SELECT dst FROM mappings')]
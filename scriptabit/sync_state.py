@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+""" Transactional storage for synchronisation state.
+
+A sync plugin needs its task map, its last sync watermark, and any per-task
+metadata to stay in step. Writing them to separate files means a crash
+between writes can leave them inconsistent, so that the next sync either
+re-syncs everything or creates duplicate tasks. `SyncState` keeps them in one
+store, which is loaded with one read and saved in one atomic operation.
+
+Two storage backends are supported:
+
+    - ``json``: a single versioned JSON document, written to a temporary
+      file, flushed to disk, and renamed over the previous state.
+    - ``sqlite``: a `SqliteTaskMap` database, with the watermark and metadata
+      committed in the same transaction as the mapping changes.
+"""
+# Ensure backwards compatibility with Python 2
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals)
+from builtins import *
+
+import json
+import logging
+import sys
+
+from .atomic_file import atomic_write
+from .dates import parse_date_utc
+from .sqlite_task_map import SqliteTaskMap
+from .task_map import TaskMap
+
+
+class SyncState(object):
+    """ The persistent state of a synchronisation.
+
+    Attributes:
+        task_map (TaskMap or SqliteTaskMap): The task mappings.
+        last_sync (datetime): The last sync time (UTC), or None if no sync
+            has been recorded.
+        metadata (dict): JSON serialisable plugin data, such as per-task
+            metadata keyed by task ID.
+    """
+
+    # The version of the stored state format.
+    VERSION = 1
+
+    # The SqliteTaskMap meta key holding the rest of the state.
+    META_KEY = 'sync_state'
+
+    def __init__(self, task_map=None, last_sync=None, metadata=None):
+        """ Initialises the sync state.
+
+        Args:
+            task_map (TaskMap or SqliteTaskMap): The task mappings. Defaults
+                to an empty `TaskMap`.
+            last_sync (datetime): The last sync time (UTC).
+            metadata (dict): Plugin metadata.
+        """
+        self.task_map = task_map if task_map is not None else TaskMap()
+        self.last_sync = last_sync
+        self.metadata = metadata or {}
+
+    @staticmethod
+    def __check_version(data, filename):
+        """ Checks that stored state can be read by this version.
+
+        Raises:
+            ValueError: The state was saved by a newer, incompatible version.
+        """
+        version = data.get('version', 0)
+        if version > SyncState.VERSION:
+            raise ValueError(
+                'Sync state {0} has version {1}, but only version {2} is '
+                'supported'.format(filename, version, SyncState.VERSION))
+
+    @staticmethod
+    def __parse_last_sync(data):
+        """ Gets the last sync time from stored state. """
+        last_sync = data.get('last_sync', None)
+        return parse_date_utc(last_sync) if last_sync else None
+
+    @staticmethod
+    def load(filename, backend='json', legacy_task_map_file=None):
+        """ Loads the sync state. Missing state loads as an empty state.
+
+        Args:
+            filename (str): The state file name.
+            backend (str): 'json' or 'sqlite'.
+            legacy_task_map_file (str): Optional `TaskMap` JSON file, as
+                saved by `TaskMap.persist`. Its mappings are imported if no
+                state has been saved yet.
+
+        Returns:
+            SyncState: The sync state.
+
+        Raises:
+            ValueError: The state was saved by a newer, incompatible version,
+                or the backend is unknown.
+        """
+        if backend == 'sqlite':
+            task_map = SqliteTaskMap(
+                filename,
+                json_filename=legacy_task_map_file)
+            stored = task_map.get_meta(SyncState.META_KEY)
+            data = json.loads(stored) if stored else {}
+            SyncState.__check_version(data, filename)
+        elif backend == 'json':
+            try:
+                with open(filename, 'r') as f:
+                    data = json.load(f)
+            except (IOError, OSError):
+                data = None
+
+            if data is None:
+                data = {}
+                task_map = TaskMap(legacy_task_map_file)
+                if legacy_task_map_file:
+                    logging.getLogger(__name__).info(
+                        'No sync state in %s. Importing task map from %s',
+                        filename,
+                        legacy_task_map_file)
+            else:
+                SyncState.__check_version(data, filename)
+                task_map = TaskMap()
+                task_map.load_dict(data.get('task_map', {}))
+        else:
+            raise ValueError('Unknown sync state backend: {0}'.format(backend))
+
+        return SyncState(
+            task_map=task_map,
+            last_sync=SyncState.__parse_last_sync(data),
+            metadata=data.get('metadata', {}))
+
+    def __as_dict(self):
+        """ Gets the state, apart from an `SqliteTaskMap`, as a dictionary. """
+        data = {
+            'version': SyncState.VERSION,
+            'last_sync': self.last_sync.isoformat() if self.last_sync else None,
+            'metadata': self.metadata,
+        }
+        if not isinstance(self.task_map, SqliteTaskMap):
+            data['task_map'] = self.task_map.as_dict()
+        return data
+
+    def save(self, filename):
+        """ Saves the sync state in one atomic operation.
+
+        Args:
+            filename (str): The state file name. Ignored for the sqlite
+                backend, which saves to the database it was loaded from.
+        """
+        if sys.version_info < (3, 0):
+            text = json.dumps(
+                self.__as_dict(),
+                encoding='UTF-8',
+                ensure_ascii=False)
+        else:
+            text = json.dumps(self.__as_dict(), ensure_ascii=False)
+
+        if isinstance(self.task_map, SqliteTaskMap):
+            self.task_map.set_meta(SyncState.META_KEY, text)
+            self.task_map.persist()
+        else:
+            atomic_write(filename, text)
+
+    def close(self):
+        """ Releases the task map. """
+        self.task_map.close()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+""" Index of which tasks use each Habitica tag.
+"""
+# Ensure backwards compatibility with Python 2
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals)
+from builtins import *
+
+from .dates import parse_date_utc
+
+
+class TagUsage(object):
+    """ Maps Habitica tags to the tasks that use them.
+
+    The index is built in a single pass over the tasks, so building it is
+    linear in the total number of task tags rather than tags times tasks.
+    Tag IDs found on tasks but missing from the tag list (e.g. deleted tags)
+    are indexed, but not reported.
+    """
+
+    def __init__(self, tags, tasks):
+        """ Builds the index.
+
+        Args:
+            tags (list): The Habitica tags.
+            tasks (list): The Habitica tasks. Include the completed todos,
+                otherwise tags used only by completed todos will be reported
+                as unused.
+        """
+        self.__tags = {t['id']: t for t in tags}
+        self.__task_ids = {}
+        self.__last_used = {}
+
+        for task in tasks:
+            task_id = task.get('id', None) or task.get('_id', None)
+            used = self.__get_last_used(task)
+            for tag_id in set(task.get('tags', None) or []):
+                self.__task_ids.setdefault(tag_id, []).append(task_id)
+                if used and (tag_id not in self.__last_used or
+                             used > self.__last_used[tag_id]):
+                    self.__last_used[tag_id] = used
+
+    @staticmethod
+    def __get_last_used(task):
+        """ Gets the latest of a task's update and completion dates.
+
+        Returns:
+            datetime: The date, or None if the task has neither.
+        """
+        dates = [
+            parse_date_utc(task[k])
+            for k in ('updatedAt', 'dateCompleted')
+            if task.get(k, None)]
+        return max(dates) if dates else None
+
+    def count(self, tag_id):
+        """ Gets the number of tasks using a tag.
+
+        Args:
+            tag_id (str): The tag ID.
+
+        Returns:
+            int: The number of tasks.
+        """
+        return len(self.__task_ids.get(tag_id, []))
+
+    def task_ids(self, tag_id):
+        """ Gets the IDs of the tasks using a tag.
+
+        Args:
+            tag_id (str): The tag ID.
+
+        Returns:
+            list: The task IDs.
+        """
+        return list(self.__task_ids.get(tag_id, []))
+
+    def last_used(self, tag_id):
+        """ Gets the last time a task using the tag was updated or completed.
+
+        Args:
+            tag_id (str): The tag ID.
+
+        Returns:
+            datetime: The date in UTC, or None if the tag is unused or the
+            task dates are unknown.
+        """
+        return self.__last_used.get(tag_id, None)
+
+    def unused(self):
+        """ Gets the tags that no task uses.
+
+        Returns:
+            dict: The unused tags, keyed by tag ID.
+        """
+        return {
+            tag_id: tag for tag_id, tag in self.__tags.items()
+            if tag_id not in self.__task_ids}
+
+    def report(self):
+        """ Summarises the usage of every tag.
+
+        Returns:
+            list: A dictionary per tag, with the tag ``id`` and ``name``, the
+            ``count`` of tasks using it, and the ``last_used`` date. Sorted by
+            descending count, then name.
+        """
+        rows = [
+            {
+                'id': tag_id,
+                'name': tag['name'],
+                'count': self.count(tag_id),
+                'last_used': self.last_used(tag_id),
+            }
+            for tag_id, tag in self.__tags.items()]
+        return sorted(rows, key=lambda r: (-r['count'], r['name']))
@@ -8,6 +8,8 @@ from __future__ import (
     print_function,
     unicode_literals)
 from builtins import *
+import hashlib
+import json
 from enum import Enum
 from datetime import datetime
 
@@ -225,4 +227,34 @@ class Task(object):
         # the task services
         # self.last_modified = src.last_modified
         return self
+
+    def content_hash(self, include_description=True):
+        """ Gets a hash of the fields copied by `copy_fields`.
+
+        Two tasks with the same synchronised content have the same hash,
+        regardless of their IDs, status, or last modified dates.
+
+        Args:
+            include_description (bool): Whether the description is part of
+                the hash.
+
+        Returns:
+            str: The hex digest.
+        """
+        due_date = self.due_date
+        content = [
+            self.name,
+            (self.description or '') if include_description else None,
+            bool(self.completed),
+            self.difficulty.value,
+            self.attribute.value,
+            due_date.isoformat() if due_date else None,
+            [[i.name, bool(i.checked)] for i in self.checklist or []],
+        ]
+        canonical = json.dumps(
+            content,
+            sort_keys=True,
+            ensure_ascii=True,
+            default=str)
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
 # pylint: enable=no-self-use
@@ -13,9 +13,15 @@ import sys
 import json
 from bidict import bidict, DuplicationPolicy
 
+from .atomic_file import atomic_write
+
 
 class TaskMap(object):
     """ Persistent 1-1 task mapping.
+
+    Each mapping can also hold a content hash of the source task as it was
+    last written to the destination (see `Task.content_hash`), so that
+    unchanged tasks need not be written again.
     """
     def __init__(self, filename=None):
         """ Initialise the TaskMap instance.
@@ -27,12 +33,43 @@ class TaskMap(object):
 
         # try to load from the file, defaulting to empty bidict if the load
         # fails for any reason
+        self.__bidict = bidict()
+        self.__hashes = {}
         try:
-            self.__bidict = bidict()
             with open(filename, 'r') as f:
-                self.__bidict = bidict(json.load(f))
+                self.load_dict(json.load(f))
         except:
             self.__bidict = bidict()
+            self.__hashes = {}
+
+    def load_dict(self, data):
+        """ Replaces the mappings with those in a dictionary created by
+        `as_dict`.
+
+        Args:
+            data (dict): The mapping data. A flat dictionary of source to
+                destination IDs, as saved by older versions, is also accepted.
+        """
+        if isinstance(data.get('mappings', None), dict):
+            self.__bidict = bidict(data['mappings'])
+            self.__hashes = {
+                k: v for k, v in data.get('hashes', {}).items()
+                if k in self.__bidict}
+        else:
+            # original format: a flat dictionary of mappings
+            self.__bidict = bidict(data)
+            self.__hashes = {}
+
+    def as_dict(self):
+        """ Gets the mappings as a JSON serialisable dictionary.
+
+        Returns:
+            dict: The mappings and content hashes.
+        """
+        return {
+            'mappings': dict(self.__bidict),
+            'hashes': dict(self.__hashes),
+        }
 
     def __map(self, a, b):
         """ Associate two ID strings """
@@ -46,19 +83,27 @@ class TaskMap(object):
     def persist(self, filename):
         """ Persist the TaskMap instance to a file.
 
+        The file is replaced atomically, so an interrupted write leaves the
+        previous mappings intact.
+
         Args:
             filename (str): The destination file name.
         """
-        with open(filename, 'w') as f:
-            if sys.version_info < (3, 0):
-                x = json.dumps(dict(self.__bidict),
-                               encoding='UTF-8',
-                               ensure_ascii=False)
-            else:
-                x = json.dumps(dict(self.__bidict),
-                               ensure_ascii=False)
-
-            f.write(x)
+        if sys.version_info < (3, 0):
+            x = json.dumps(self.as_dict(),
+                           encoding='UTF-8',
+                           ensure_ascii=False)
+        else:
+            x = json.dumps(self.as_dict(),
+                           ensure_ascii=False)
+
+        atomic_write(filename, x)
+
+    def close(self):
+        """ Releases the map. Nothing is held open by a `TaskMap`, but other
+        map implementations need this.
+        """
+        pass
 
     def map(self, src, dst):
         """ Create a mapping between a source and destination task.
@@ -76,6 +121,35 @@ class TaskMap(object):
             src_id: The source id to unmap.
         """
         self.__bidict.pop(src_id)
+        self.__hashes.pop(src_id, None)
+
+    def get_hash(self, src_id):
+        """ Get the content hash recorded for a mapping.
+
+        Args:
+            src_id: The source task ID.
+
+        Returns:
+            str: The content hash, or None if no hash has been recorded.
+        """
+        return self.__hashes.get(src_id, None)
+
+    def set_hash(self, src_id, content_hash):
+        """ Record the content hash for a mapping.
+
+        Args:
+            src_id: The source task ID.
+            content_hash (str): The content hash, or None to clear it.
+
+        Raises:
+            KeyError: if the source ID has no mapping.
+        """
+        if src_id not in self.__bidict:
+            raise KeyError(src_id)
+        if content_hash:
+            self.__hashes[src_id] = content_hash
+        else:
+            self.__hashes.pop(src_id, None)
 
     def get_dst_id(self, _id):
         """ Get the mapped destination task ID for a source task.
@@ -29,11 +29,61 @@ class TaskService(object):
         """
         raise NotImplementedError
 
+    @property
+    def partial(self):
+        """ Indicates that the last `get_all_tasks` call returned only the
+        tasks changed since the previous sync, rather than all tasks.
+
+        A missing task then does not mean that it was deleted. Only the tasks
+        reported by `get_removed_task_ids` have been removed.
+
+        Returns:
+            bool: False, unless overridden.
+        """
+        return False
+
+    def get_removed_task_ids(self):
+        """ Gets the IDs of the tasks known to have been removed since the
+        previous sync. Only used when `partial` is True.
+
+        Returns:
+            list: The removed task IDs.
+        """
+        return []
+
+    @property
+    def fetch_timings(self):
+        """ Gets a breakdown of the time taken by the last `get_all_tasks`
+        call, such as the time spent on each board or project.
+
+        Returns:
+            dict: Seconds, keyed by a description of each part of the fetch.
+            Empty, unless overridden.
+        """
+        return {}
+
+    @property
+    def latencies(self):
+        """ Gets the recorder of the latencies of the API calls made by this
+        service.
+
+        Returns:
+            LatencyRecorder: The recorder, or None unless overridden.
+        """
+        return None
+
     def persist_tasks(self, tasks):
         """ Persists the tasks.
 
+        Services may persist the tasks independently, reporting the tasks that
+        could not be persisted rather than raising.
+
         Args:
             tasks (list): The collection of tasks to persist.
+
+        Returns:
+            list: Optional (task, exception) tuples for the tasks that could
+            not be persisted. None or an empty list if all succeeded.
         """
         raise NotImplementedError
 
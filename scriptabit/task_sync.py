@@ -11,7 +11,8 @@ Basic algorithm
 
     - Mapping exists, destination task found:
 
-        - update destination
+        - update destination, unless the content hash of the source task
+          matches the hash recorded when it was last written
 
     - Mapping exists, destination task not found:
 
@@ -27,10 +28,12 @@ Basic algorithm
 - Check all destination tasks for which mapped source tasks can't be found:
 
     - assume deleted and flag destination as 'deleted'
+    - if the source service only returned changed tasks (a partial fetch),
+      only the tasks it reports as removed are deleted
 
 - Check for orphan mappings: both source and destination not found
 
-    - delete mapping
+    - delete mapping (not for partial fetches)
 
 - **Not implemented**: persist source tasks
 - Persist destination tasks
@@ -44,7 +47,10 @@ from __future__ import (
     print_function,
     unicode_literals)
 from builtins import *
+import json
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from datetime import datetime
 
 import pytz
@@ -59,29 +65,105 @@ class TaskSync(object):
     """
 
     class Stats(object):
-        """ Simple sync stats """
+        """ Sync stats.
+
+        Besides the task counters, the stats hold the wall-clock time of each
+        phase of the sync (see `PHASES`), and a latency summary of the API
+        calls made by each service.
+        """
+
+        # The sync phases, in order. Callers may add phases of their own,
+        # such as the time taken to save the task map.
+        PHASES = ('src_fetch', 'dst_fetch', 'diff', 'persist')
+
         def __init__(self):
             """ Initialise the stats """
             self.skipped = 0
+            self.touched = 0
             self.created = 0
             self.updated = 0
             self.completed = 0
             self.deleted = 0
             self.errors = 0
+            self.src_tasks = 0
+            self.dst_tasks = 0
+            self.finished = None
             self.duration = None
+            self.src_fetch_timings = {}
+            self.phases = {}
+            self.src_latency = None
+            self.dst_latency = None
+
+        @property
+        def src_fetch_duration(self):
+            """ Seconds taken to fetch the source tasks. """
+            return self.phases.get('src_fetch', None)
+
+        @property
+        def dst_fetch_duration(self):
+            """ Seconds taken to fetch the destination tasks. """
+            return self.phases.get('dst_fetch', None)
+
+        @property
+        def tasks_per_second(self):
+            """ Source tasks processed per second of sync time. """
+            if not self.duration:
+                return None
+            seconds = self.duration.total_seconds()
+            return self.src_tasks / seconds if seconds > 0 else None
+
+        @staticmethod
+        def __format_latency(name, latency):
+            """ Formats a latency summary as a line of the stats string. """
+            if not latency or not latency['count']:
+                return ''
+            return (
+                '\t{0} API calls: {1}, p50 {2:.3f}s, p90 {3:.3f}s, '
+                'p99 {4:.3f}s\n').format(
+                    name, latency['count'], latency['p50'], latency['p90'],
+                    latency['p99'])
 
         def __str__(self):
             """ Get a nicely formatted stats string """
+            timings = ''.join(
+                '\t\t{0}: {1:.2f}s\n'.format(k, v)
+                for k, v in sorted(self.src_fetch_timings.items()))
+            phases = ''.join(
+                '\t\t{0}: {1:.2f}s\n'.format(k, v)
+                for k, v in self.__ordered_phases())
             return (
                 '\tTasks skipped: {0}\n' +
+                '\tTasks touched but unchanged: {7}\n' +
                 '\tTasks created: {1}\n' +
                 '\tTasks updated: {2}\n' +
                 '\tTasks deleted: {3}\n' +
                 '\tTasks completed: {4}\n' +
                 '\tTasks errored: {6}\n' +
-                '\tSync duration: {5}\n').format(
+                '\tSource fetch: {8:.2f}s\n' +
+                '{10}' +
+                '\tDestination fetch: {9:.2f}s\n' +
+                '\tSync duration: {5}\n' +
+                '{11}' +
+                '\tTasks per second: {12:.1f}\n' +
+                '{13}{14}').format(
                     self.skipped, self.created, self.updated, self.deleted,
-                    self.completed, self.duration, self.errors)
+                    self.completed, self.duration, self.errors, self.touched,
+                    self.src_fetch_duration or 0,
+                    self.dst_fetch_duration or 0,
+                    timings,
+                    phases,
+                    self.tasks_per_second or 0,
+                    self.__format_latency('Source', self.src_latency),
+                    self.__format_latency('Destination', self.dst_latency))
+
+        def __ordered_phases(self):
+            """ Gets the phase timings, in phase order. """
+            known = [(p, self.phases[p]) for p in self.PHASES
+                     if p in self.phases]
+            extra = sorted(
+                (p, t) for p, t in self.phases.items()
+                if p not in self.PHASES)
+            return known + extra
 
         @property
         def total_changed(self):
@@ -91,13 +173,53 @@ class TaskSync(object):
                 self.completed +\
                 self.deleted
 
+        def as_dict(self):
+            """ Gets the stats as a JSON serialisable dictionary.
+
+            Returns:
+                dict: The stats. Times are in seconds.
+            """
+            return {
+                'finished': self.finished.isoformat()
+                            if self.finished else None,
+                'duration': self.duration.total_seconds()
+                            if self.duration else None,
+                'skipped': self.skipped,
+                'touched': self.touched,
+                'created': self.created,
+                'updated': self.updated,
+                'completed': self.completed,
+                'deleted': self.deleted,
+                'errors': self.errors,
+                'src_tasks': self.src_tasks,
+                'dst_tasks': self.dst_tasks,
+                'tasks_per_second': self.tasks_per_second,
+                'phases': dict(self.phases),
+                'src_fetch_timings': dict(self.src_fetch_timings),
+                'src_latency': self.src_latency,
+                'dst_latency': self.dst_latency,
+            }
+
+        def append_to_history(self, filename):
+            """ Appends the stats to a JSON lines history file, so that
+            performance can be compared across runs.
+
+            Args:
+                filename (str): The history file name.
+            """
+            with open(filename, 'a') as f:
+                f.write(json.dumps(self.as_dict(), sort_keys=True))
+                f.write('\n')
+
     def __init__(
             self,
             src_service,
             dst_service,
             task_map,
             last_sync=None,
-            sync_description=True):
+            sync_description=True,
+            fetch_timeout=None,
+            retry_ids=None):
         """ Initialise the TaskSync instance.
 
         Args:
@@ -107,6 +229,11 @@ class TaskSync(object):
             last_sync (datetime): The last known synchronisation datetime (UTC).
             sync_description (bool): Controls whether the task description will
                 be synchronised.
+            fetch_timeout (float): The maximum number of seconds to wait for
+                each service to return its tasks. None waits indefinitely.
+            retry_ids (iterable): The IDs of source tasks whose changes an
+                earlier sync failed to write. These tasks are synchronised even
+                if they are unchanged since `last_sync`.
         """
         self.__src_service = src_service
         self.__dst_service = dst_service
@@ -117,7 +244,14 @@ class TaskSync(object):
         self.__src_index = None
         self.__dst_index = None
         self.__sync_description = sync_description
+        self.__fetch_timeout = fetch_timeout
         self.__stats = TaskSync.Stats()
+        self.__pending_hashes = {}
+        self.__retry_ids = set(retry_ids or ())
+
+    def __content_hash(self, src):
+        """ Gets the content hash of the synchronised fields of a task. """
+        return src.content_hash(include_description=self.__sync_description)
 
     def __create_new_dst(self, src):
         """ Creates and maps a new destination task.
@@ -133,6 +267,7 @@ class TaskSync(object):
         if not self.__sync_description:
             dst.description = ''
         self.__map.map(src, dst)
+        self.__pending_hashes[src.id] = self.__content_hash(src)
         return dst
 
     def __get_src_by_id(self, _id):
@@ -143,16 +278,73 @@ class TaskSync(object):
         """ Looks up a cached destination task by ID """
         return self.__dst_index.get(_id, None)
 
+    @staticmethod
+    def __timed_fetch(service):
+        """ Gets all tasks from a service.
+
+        Returns:
+            tuple: The tasks, and the fetch duration in seconds.
+        """
+        start = time.time()
+        tasks = service.get_all_tasks()
+        return tasks, time.time() - start
+
     def __get_task_data(self):
         """ Gets, caches, and indexes task data from the source and destination
         services.
+
+        The two services are independent, so both are fetched at the same time.
+
+        Raises:
+            concurrent.futures.TimeoutError: a service did not return its tasks
+                within the fetch timeout.
         """
-        logging.getLogger(__name__).debug('Fetching source tasks')
-        self.__src_tasks = self.__src_service.get_all_tasks()
+        logging.getLogger(__name__).debug(
+            'Fetching source and destination tasks')
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            src_future = executor.submit(
+                self.__timed_fetch,
+                self.__src_service)
+            dst_future = executor.submit(
+                self.__timed_fetch,
+                self.__dst_service)
+
+            deadline = None
+            if self.__fetch_timeout is not None:
+                deadline = time.time() + self.__fetch_timeout
+
+            def remaining():
+                """ Seconds left before the fetch deadline. """
+                if deadline is None:
+                    return None
+                return max(0, deadline - time.time())
+
+            try:
+                self.__src_tasks, self.__stats.phases['src_fetch'] = \
+                    src_future.result(timeout=remaining())
+                self.__dst_tasks, self.__stats.phases['dst_fetch'] = \
+                    dst_future.result(timeout=remaining())
+            except TimeoutError:
+                logging.getLogger(__name__).warning(
+                    'Task fetch timed out after %ss. The fetch cannot be '
+                    'cancelled, and is still running in the background',
+                    self.__fetch_timeout)
+                raise
+        finally:
+            # don't block on a fetch that has timed out
+            executor.shutdown(wait=False)
 
-        logging.getLogger(__name__).debug('Fetching destination tasks')
-        self.__dst_tasks = self.__dst_service.get_all_tasks()
+        self.__stats.src_fetch_timings = dict(
+            self.__src_service.fetch_timings)
 
+        logging.getLogger(__name__).debug(
+            'Fetched tasks: source %.2fs, destination %.2fs',
+            self.__stats.src_fetch_duration,
+            self.__stats.dst_fetch_duration)
+
+        self.__stats.src_tasks = len(self.__src_tasks)
+        self.__stats.dst_tasks = len(self.__dst_tasks)
         self.__src_index = {s.id:s for s in self.__src_tasks}
         self.__dst_index = {d.id:d for d in self.__dst_tasks}
 
@@ -163,7 +355,8 @@ class TaskSync(object):
             src (Task): the source task
             dst (Task): the destination task
         """
-        if src.last_modified < self.__last_sync:
+        if src.last_modified < self.__last_sync and \
+                src.id not in self.__retry_ids:
             # It seems that I don't care about unchanged messages even with
             # debug level logging enabled.
             # logging.getLogger(__name__).debug(
@@ -171,6 +364,14 @@ class TaskSync(object):
             self.__stats.skipped += 1
             return
 
+        content_hash = self.__content_hash(src)
+        if content_hash == self.__map.get_hash(src.id):
+            # modified (e.g. commented or moved), but nothing we sync changed
+            logging.getLogger(__name__).debug(
+                'Touched but unchanged: %s', src.name)
+            self.__stats.touched += 1
+            return
+
         if src.completed:
             logging.getLogger(__name__).info(
                 'Completing: %s', src.name)
@@ -182,6 +383,7 @@ class TaskSync(object):
         dst.copy_fields(src, status=SyncStatus.updated)
         if not self.__sync_description:
             dst.description = ''
+        self.__pending_hashes[src.id] = content_hash
 
     def __handle_destination_missing(self, src):
         """ Handle the case where a mapped destination task cannot be found.
@@ -264,21 +466,30 @@ class TaskSync(object):
 
         Args:
             clean_orphans (bool): If True, mappings for tasks that exist in
-                neither the source or destination are deleted.
+                neither the source or destination are deleted. Ignored for
+                partial fetches.
 
         Returns:
             TaskSync.Stats: Summary statistics of the sync.
         """
         start_sync = datetime.now(tz=pytz.utc)
 
+        # reset the stats
+        self.__stats = TaskSync.Stats()
+        self.__pending_hashes = {}
+        for service in (self.__src_service, self.__dst_service):
+            if service.latencies is not None:
+                service.latencies.reset()
+
         self.__get_task_data()
+        phase_start = time.time()
 
         logging.getLogger(__name__).info(
             'Starting sync. Last sync at %s',
             self.last_sync.astimezone(get_localzone()))
 
-        # reset the stats
-        self.__stats = TaskSync.Stats()
+        # IDs of the source tasks whose changes were not written
+        failed = set()
 
         # source task checks
         for src in self.__src_tasks:
@@ -294,19 +505,31 @@ class TaskSync(object):
                     self.__handle_new_task(src)
             except Exception as e:
                 self.__stats.errors += 1
+                failed.add(src.id)
                 logging.getLogger(__name__).warning(
                     "Error syncing task '%s':\n%s",
                     src.name,
                     e,
                     exc_info=True)
 
+        # A partial fetch only returns the changed source tasks, so a missing
+        # source task has only been deleted if the service says so.
+        partial = self.__src_service.partial
+        if partial:
+            removed = set(self.__src_service.get_removed_task_ids())
+            logging.getLogger(__name__).info(
+                'Partial sync: %d changed, %d removed source tasks',
+                len(self.__src_tasks),
+                len(removed))
+
         # destination task checks. Only need to look for cases involving missing
         # source tasks. All other sync conditions can be handled during the
         # source task loop (above).
         for dst in self.__dst_tasks:
             try:
                 src_id = self.__map.try_get_src_id(dst.id)
-                if src_id and not self.__get_src_by_id(src_id):
+                if src_id and not self.__get_src_by_id(src_id) and \
+                        (not partial or src_id in removed):
                     self.__handle_deleted_source_task(src_id, dst)
             except Exception as e:
                 self.__stats.errors += 1
@@ -317,19 +540,54 @@ class TaskSync(object):
                     exc_info=True)
 
         # check for orphans: mappings that have neither a src or dst task
-        if clean_orphans:
+        if clean_orphans and not partial:
             self.__clean_orphan_task_mappings()
 
+        self.__stats.phases['diff'] = time.time() - phase_start
+        phase_start = time.time()
+
         try:
-            self.__dst_service.persist_tasks(self.__dst_tasks)
+            failures = self.__dst_service.persist_tasks(self.__dst_tasks) or []
+            self.__stats.errors += len(failures)
+
+            # only record hashes once the changes have been written, and
+            # forget the hashes of failed tasks so they don't look unchanged
+            # when they are retried
+            for dst, _ in failures:
+                src_id = self.__map.try_get_src_id(dst.id)
+                if src_id:
+                    failed.add(src_id)
+                    self.__pending_hashes.pop(src_id, None)
+                    self.__map.set_hash(src_id, None)
+            for src_id, content_hash in self.__pending_hashes.items():
+                if self.__map.try_get_dst_id(src_id):
+                    self.__map.set_hash(src_id, content_hash)
         except Exception as e:
             self.__stats.errors += 1
+            failed.update(self.__pending_hashes)
             logging.getLogger(__name__).warning(
                 'Error writing task changes.\n%s',
                 e,
                 exc_info=True)
 
+        self.__stats.phases['persist'] = time.time() - phase_start
+
+        # Failed tasks are retried by the next sync, even though last_sync
+        # moves past them. A partial fetch may not include the earlier
+        # failures, so those are kept until they are fetched.
+        if partial:
+            self.__retry_ids -= set(self.__src_index)
+            self.__retry_ids -= removed
+        else:
+            self.__retry_ids = set()
+        self.__retry_ids |= failed
+        if self.__src_service.latencies is not None:
+            self.__stats.src_latency = self.__src_service.latencies.summary()
+        if self.__dst_service.latencies is not None:
+            self.__stats.dst_latency = self.__dst_service.latencies.summary()
+
         end_sync = datetime.now(tz=pytz.utc)
+        self.__stats.finished = end_sync
         self.__stats.duration = end_sync - start_sync
         self.__last_sync = end_sync
 
@@ -346,4 +604,14 @@ class TaskSync(object):
             datetime: The last synchronisation time.
         """
         return self.__last_sync
+
+    @property
+    def retry_ids(self):
+        """ Gets the IDs of the source tasks whose changes could not be
+        written. Pass them to the next sync so they are retried.
+
+        Returns:
+            list: The source task IDs.
+        """
+        return sorted(self.__retry_ids)
 # pylint: enable=too-few-public-methods
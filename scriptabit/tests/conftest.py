@@ -1,8 +1,15 @@
 # -*- coding: utf-8 -*-
 """ PyTest configuration """
 
+import sys
+
 import pytest
 
+# async syntax is a SyntaxError before Python 3.5
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.append('test_async_habitica_service.py')
+
 def pytest_addoption(parser):
     # creates a command line option to run slow tests
     parser.addoption("--runslow", action="store_true", help="run slow tests")
@@ -0,0 +1,769 @@
+# -*- coding: utf-8 -*-
+""" A local stand-in for the Habitica API, for benchmarks and soak tests.
+
+The server implements the subset of the v3 API used by scriptabit (tasks,
+checklists, tags, the user document and stats, pets, the armoire, and
+spells), keeping its state in memory. It can add latency to each response,
+drawn from a configurable distribution, and can reject requests with 429
+(Too Many Requests) responses, either at random or when a Habitica style
+request quota is exhausted.
+
+The server speaks HTTP/1.1, so clients that reuse connections can keep them
+alive between requests. Run it directly to get a long running server::
+
+    python -m scriptabit.tests.fake_habitica_server --port 8080 \\
+        --latency lognormal:0.1,0.5 --quota 30 --window 60
+
+Latency specifications are ``<seconds>``, ``uniform:<low>,<high>``,
+``normal:<mean>,<sd>`` or ``lognormal:<median>,<sigma>``.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+import argparse
+import copy
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = '/api/v3/'
+
+# The task types accepted by GET tasks/user, and the task type they select.
+TASK_TYPES = {
+    'habits': 'habit',
+    'dailys': 'daily',
+    'todos': 'todo',
+    'rewards': 'reward',
+}
+
+# Fields that are always lists when form-encoded.
+LIST_FIELDS = frozenset(['tags'])
+
+# The mana cost of each spell. Unknown spells cost 10.
+SPELL_COSTS = {
+    'fireball': 10,
+    'mpHeal': 30,
+    'earth': 35,
+    'frost': 40,
+    'smash': 10,
+    'defensiveStance': 25,
+    'valorousPresence': 20,
+    'intimidate': 15,
+    'pickPocket': 10,
+    'backStab': 15,
+    'toolsOfTrade': 25,
+    'stealth': 45,
+    'heal': 15,
+    'protectAura': 30,
+    'brightness': 15,
+    'healAll': 25,
+}
+
+
+def parse_latency(spec):
+    """ Parses a latency specification.
+
+    Args:
+        spec (str): ``<seconds>``, ``uniform:<low>,<high>``,
+            ``normal:<mean>,<sd>`` or ``lognormal:<median>,<sigma>``.
+
+    Returns:
+        callable: A function returning a latency in seconds, or None if the
+        specification is empty.
+
+    Raises:
+        ValueError: The specification is invalid.
+    """
+    if not spec:
+        return None
+    name, _, args = spec.partition(':')
+    if not args:
+        seconds = float(name)
+        return lambda: seconds
+
+    values = [float(a) for a in args.split(',')]
+    if len(values) != 2:
+        raise ValueError('Invalid latency: {0}'.format(spec))
+    a, b = values
+    if name == 'uniform':
+        return lambda: random.uniform(a, b)
+    if name == 'normal':
+        return lambda: max(0, random.gauss(a, b))
+    if name == 'lognormal':
+        return lambda: random.lognormvariate(math.log(a), b)
+    raise ValueError('Invalid latency: {0}'.format(spec))
+
+
+class NotFound(Exception):
+    """ The requested resource does not exist. """
+    pass
+
+
+class BadRequest(Exception):
+    """ The request is invalid. """
+    pass
+
+
+def default_user():
+    """ Creates a new user document. """
+    return {
+        'id': str(uuid.uuid4()),
+        'profile': {'name': 'Fake User'},
+        'stats': {
+            'hp': 50, 'maxHealth': 50,
+            'mp': 30, 'maxMP': 30,
+            'exp': 0, 'toNextLevel': 150,
+            'lvl': 10, 'gp': 100,
+            'class': 'wizard',
+        },
+        'items': {
+            'pets': {'Wolf-Base': 5},
+            'mounts': {},
+            'eggs': {'Wolf': 1},
+            'hatchingPotions': {'Base': 1},
+            'food': {'Meat': 5},
+        },
+        'party': {},
+        'preferences': {},
+    }
+
+
+class FakeHabiticaState(object):
+    """ The in-memory state of the fake Habitica API.
+
+    All methods are thread safe, and return copies of the stored data.
+    """
+
+    def __init__(self, user=None):
+        """ Initialises the state.
+
+        Args:
+            user (dict): The initial user document. A default user is created
+                if not given.
+        """
+        self.__lock = threading.RLock()
+        self.user = user or default_user()
+        self.tasks = {}
+        self.tags = []
+
+    @staticmethod
+    def __now():
+        return datetime.utcnow().isoformat() + 'Z'
+
+    def __find_task(self, key):
+        """ Finds a task by ID or alias. """
+        if key in self.tasks:
+            return self.tasks[key]
+        for task in self.tasks.values():
+            if task.get('alias', None) == key:
+                return task
+        raise NotFound('Task {0} not found'.format(key))
+
+    @staticmethod
+    def __find_item(task, item_id):
+        """ Finds a checklist item. """
+        for item in task['checklist']:
+            if item['id'] == item_id:
+                return item
+        raise NotFound('Checklist item {0} not found'.format(item_id))
+
+    def get_user(self, fields=None):
+        """ Gets the user document, or the selected top-level fields or
+        dotted paths of it. """
+        with self.__lock:
+            if not fields:
+                return copy.deepcopy(self.user)
+            result = {'id': self.user['id']}
+            for field in fields.split(','):
+                source, target = self.user, result
+                parts = field.strip().split('.')
+                for part in parts[:-1]:
+                    source = source.get(part, {})
+                    target = target.setdefault(part, {})
+                if parts[-1] in source:
+                    target[parts[-1]] = copy.deepcopy(source[parts[-1]])
+            return result
+
+    def update_user(self, changes):
+        """ Applies dotted path changes (such as ``stats.hp``) to the user. """
+        with self.__lock:
+            for path, value in changes.items():
+                target = self.user
+                parts = path.split('.')
+                for part in parts[:-1]:
+                    target = target.setdefault(part, {})
+                target[parts[-1]] = value
+            return copy.deepcopy(self.user)
+
+    def get_tasks(self, task_type=None):
+        """ Gets the tasks. Completed todos are only returned when
+        ``completedTodos`` is requested. """
+        with self.__lock:
+            tasks = list(self.tasks.values())
+        if task_type == 'completedTodos':
+            tasks = [t for t in tasks if t['type'] == 'todo' and t['completed']]
+        else:
+            if task_type:
+                if task_type not in TASK_TYPES:
+                    raise BadRequest('Invalid task type {0}'.format(task_type))
+                tasks = [t for t in tasks if t['type'] == TASK_TYPES[task_type]]
+            tasks = [t for t in tasks
+                     if not (t['type'] == 'todo' and t['completed'])]
+        return copy.deepcopy(tasks)
+
+    def create_task(self, task):
+        """ Creates a task. """
+        if not task.get('text', None):
+            raise BadRequest('Task text is required')
+        task = copy.deepcopy(task)
+        task.setdefault('_id', str(uuid.uuid4()))
+        task['id'] = task['_id']
+        task.setdefault('type', 'todo')
+        task.setdefault('notes', '')
+        task.setdefault('priority', 1)
+        task.setdefault('attribute', 'str')
+        task.setdefault('completed', False)
+        task.setdefault('tags', [])
+        task['checklist'] = [
+            dict(item, id=item.get('id', str(uuid.uuid4())))
+            for item in task.get('checklist', [])]
+        task['createdAt'] = task['updatedAt'] = self.__now()
+        with self.__lock:
+            if task['_id'] in self.tasks:
+                raise BadRequest('Task {0} exists'.format(task['_id']))
+            self.tasks[task['_id']] = task
+            return copy.deepcopy(task)
+
+    def get_task(self, key):
+        """ Gets a task by ID or alias. """
+        with self.__lock:
+            return copy.deepcopy(self.__find_task(key))
+
+    def update_task(self, key, changes):
+        """ Updates a task. The ID, type and checklist can't be changed. """
+        with self.__lock:
+            task = self.__find_task(key)
+            for k, v in changes.items():
+                if k not in ('_id', 'id', 'type', 'checklist'):
+                    task[k] = v
+            task['updatedAt'] = self.__now()
+            return copy.deepcopy(task)
+
+    def delete_task(self, key):
+        """ Deletes a task. """
+        with self.__lock:
+            del self.tasks[self.__find_task(key)['_id']]
+
+    def score_task(self, key, direction):
+        """ Scores a task, completing todos and dailies on an up score. """
+        if direction not in ('up', 'down'):
+            raise BadRequest('Invalid direction {0}'.format(direction))
+        with self.__lock:
+            task = self.__find_task(key)
+            stats = self.user['stats']
+            if direction == 'up':
+                if task['type'] in ('todo', 'daily'):
+                    task['completed'] = True
+                stats['exp'] += 10
+                stats['gp'] += 1
+            else:
+                if task['type'] in ('todo', 'daily'):
+                    task['completed'] = False
+                stats['hp'] = max(0, stats['hp'] - 1)
+            task['updatedAt'] = self.__now()
+            return dict(copy.deepcopy(stats), delta=1)
+
+    def add_checklist_item(self, key, item):
+        """ Adds a checklist item to a task. """
+        with self.__lock:
+            task = self.__find_task(key)
+            task['checklist'].append({
+                'id': str(uuid.uuid4()),
+                'text': item.get('text', ''),
+                'completed': bool(item.get('completed', False)),
+            })
+            return copy.deepcopy(task)
+
+    def update_checklist_item(self, key, item_id, changes):
+        """ Updates a checklist item. """
+        with self.__lock:
+            task = self.__find_task(key)
+            item = self.__find_item(task, item_id)
+            for k in ('text', 'completed'):
+                if k in changes:
+                    item[k] = changes[k]
+            return copy.deepcopy(task)
+
+    def score_checklist_item(self, key, item_id):
+        """ Toggles a checklist item. """
+        with self.__lock:
+            task = self.__find_task(key)
+            item = self.__find_item(task, item_id)
+            item['completed'] = not item['completed']
+            return copy.deepcopy(task)
+
+    def delete_checklist_item(self, key, item_id):
+        """ Deletes a checklist item. """
+        with self.__lock:
+            task = self.__find_task(key)
+            task['checklist'].remove(self.__find_item(task, item_id))
+            return copy.deepcopy(task)
+
+    def get_tags(self):
+        """ Gets the tags. """
+        with self.__lock:
+            return copy.deepcopy(self.tags)
+
+    def create_tag(self, name):
+        """ Creates a tag. """
+        if not name:
+            raise BadRequest('Tag name is required')
+        tag = {'id': str(uuid.uuid4()), 'name': name}
+        with self.__lock:
+            self.tags.append(tag)
+        return dict(tag)
+
+    def delete_tag(self, tag_id):
+        """ Deletes a tag, removing it from all tasks. """
+        with self.__lock:
+            tags = [t for t in self.tags if t['id'] != tag_id]
+            if len(tags) == len(self.tags):
+                raise NotFound('Tag {0} not found'.format(tag_id))
+            self.tags = tags
+            for task in self.tasks.values():
+                if tag_id in task['tags']:
+                    task['tags'].remove(tag_id)
+
+    def feed_pet(self, pet, food):
+        """ Feeds a pet, returning its new feeding level. """
+        with self.__lock:
+            items = self.user['items']
+            if items['pets'].get(pet, 0) <= 0:
+                raise NotFound('Pet {0} not found'.format(pet))
+            if items['food'].get(food, 0) <= 0:
+                raise NotFound('Food {0} not found'.format(food))
+            items['food'][food] -= 1
+            items['pets'][pet] += 5
+            if items['pets'][pet] >= 50:
+                items['pets'][pet] = -1
+                items['mounts'][pet] = True
+            return items['pets'][pet]
+
+    def hatch_pet(self, egg, potion):
+        """ Hatches a pet, returning the user's items. """
+        with self.__lock:
+            items = self.user['items']
+            if items['eggs'].get(egg, 0) <= 0:
+                raise NotFound('Egg {0} not found'.format(egg))
+            if items['hatchingPotions'].get(potion, 0) <= 0:
+                raise NotFound('Potion {0} not found'.format(potion))
+            pet = '{0}-{1}'.format(egg, potion)
+            if items['pets'].get(pet, 0):
+                raise BadRequest('Pet {0} already hatched'.format(pet))
+            items['eggs'][egg] -= 1
+            items['hatchingPotions'][potion] -= 1
+            items['pets'][pet] = 5
+            return copy.deepcopy(items)
+
+    def buy_armoire(self):
+        """ Buys an armoire item for 100 gold. """
+        with self.__lock:
+            stats = self.user['stats']
+            if stats['gp'] < 100:
+                raise BadRequest('Not enough gold')
+            stats['gp'] -= 100
+            return {'armoire': {'type': 'experience', 'value': 10}}
+
+    def cast(self, spell, target=None):
+        """ Casts a spell, spending its mana cost. """
+        with self.__lock:
+            stats = self.user['stats']
+            cost = SPELL_COSTS.get(spell, 10)
+            if stats['mp'] < cost:
+                raise BadRequest('Not enough mana')
+            stats['mp'] -= cost
+            return {'user': {'stats': copy.deepcopy(stats)}}
+
+
+class FakeHabiticaHandler(BaseHTTPRequestHandler):
+    """ Request handler for the fake Habitica API. """
+
+    protocol_version = 'HTTP/1.1'
+
+    # Headers and body are written separately, so without this keep-alive
+    # connections stall on delayed ACKs.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        """ Silence the default per-request logging to stderr. """
+        pass
+
+    def __send_json(self, status, data, headers=None):
+        """ Sends a JSON response body. """
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __read_body(self):
+        """ Reads the JSON request body, or None if there is no body. """
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        if not length:
+            return None
+        body = self.rfile.read(length).decode('utf-8')
+        content_type = self.headers.get('Content-Type', '')
+        if 'application/x-www-form-urlencoded' in content_type:
+            # requests form-encodes plain dictionaries, repeating the key for
+            # each item of a list
+            return {
+                k: [json_value(i) for i in v]
+                if len(v) > 1 or k in LIST_FIELDS else json_value(v[0])
+                for k, v in parse_qs(body, keep_blank_values=True).items()}
+        return json.loads(body)
+
+    def __handle(self, method):
+        """ Dispatches a request of any method. """
+        server = self.server
+        body = self.__read_body()
+        url = urlparse(self.path)
+        if not url.path.startswith(API_PREFIX):
+            self.__send_json(404, {'success': False, 'error': 'NotFound'})
+            return
+
+        command = url.path[len(API_PREFIX):].strip('/')
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        delay = server.latency() if server.latency else 0
+        if delay > 0:
+            time.sleep(delay)
+
+        allowed, headers = server.admit()
+        if not allowed:
+            self.__send_json(429, {
+                'success': False,
+                'error': 'TooManyRequests',
+                'message': 'Too many requests',
+            }, headers)
+            return
+
+        route, handler = route_request(method, command)
+        server.count(method, route)
+        try:
+            data = handler(server.state, body, query)
+        except NotFound as e:
+            self.__send_json(
+                404,
+                {'success': False, 'error': 'NotFound', 'message': str(e)},
+                headers)
+        except (BadRequest, KeyError, TypeError, ValueError) as e:
+            self.__send_json(
+                400,
+                {'success': False, 'error': 'BadRequest', 'message': str(e)},
+                headers)
+        else:
+            self.__send_json(200, {'success': True, 'data': data}, headers)
+
+    def do_GET(self):
+        """ HTTP GET """
+        self.__handle('GET')
+
+    def do_PUT(self):
+        """ HTTP PUT """
+        self.__handle('PUT')
+
+    def do_POST(self):
+        """ HTTP POST """
+        self.__handle('POST')
+
+    def do_DELETE(self):
+        """ HTTP DELETE """
+        self.__handle('DELETE')
+
+
+def json_value(value):
+    """ Decodes a form value that holds JSON, such as a number, or a Python
+    boolean as written by requests. """
+    if value in ('True', 'False'):
+        return value == 'True'
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def _not_found(state, body, query):
+    raise NotFound('Unknown API route')
+
+
+def _create_tasks(state, body, query):
+    if isinstance(body, list):
+        return [state.create_task(t) for t in body]
+    return state.create_task(body or {})
+
+
+# (method, route pattern, handler). Route segments in braces are parameters,
+# passed to the handler in order after the state, body and query.
+ROUTES = [
+    ('GET', 'status', lambda s, b, q: {'status': 'up'}),
+    ('GET', 'user', lambda s, b, q: s.get_user(q.get('userFields', None))),
+    ('PUT', 'user', lambda s, b, q: s.update_user(b or {})),
+    ('POST', 'user/feed/{pet}/{food}',
+     lambda s, b, q, pet, food: s.feed_pet(pet, food)),
+    ('POST', 'user/hatch/{egg}/{potion}',
+     lambda s, b, q, egg, potion: s.hatch_pet(egg, potion)),
+    ('POST', 'user/buy-armoire', lambda s, b, q: s.buy_armoire()),
+    ('POST', 'user/class/cast/{spell}',
+     lambda s, b, q, spell: s.cast(spell, q.get('targetId', None))),
+    ('GET', 'tasks/user', lambda s, b, q: s.get_tasks(q.get('type', None))),
+    ('POST', 'tasks/user', _create_tasks),
+    ('GET', 'tasks/{task}', lambda s, b, q, task: s.get_task(task)),
+    ('PUT', 'tasks/{task}',
+     lambda s, b, q, task: s.update_task(task, b or {})),
+    ('DELETE', 'tasks/{task}',
+     lambda s, b, q, task: s.delete_task(task) or {}),
+    ('POST', 'tasks/{task}/score/{direction}',
+     lambda s, b, q, task, direction: s.score_task(task, direction)),
+    ('POST', 'tasks/{task}/checklist',
+     lambda s, b, q, task: s.add_checklist_item(task, b or {})),
+    ('PUT', 'tasks/{task}/checklist/{item}',
+     lambda s, b, q, task, item: s.update_checklist_item(task, item, b or {})),
+    ('DELETE', 'tasks/{task}/checklist/{item}',
+     lambda s, b, q, task, item: s.delete_checklist_item(task, item)),
+    ('POST', 'tasks/{task}/checklist/{item}/score',
+     lambda s, b, q, task, item: s.score_checklist_item(task, item)),
+    ('GET', 'tags', lambda s, b, q: s.get_tags()),
+    ('POST', 'tags', lambda s, b, q: s.create_tag((b or {}).get('name'))),
+    ('DELETE', 'tags/{tag}', lambda s, b, q, tag: s.delete_tag(tag) or {}),
+]
+
+
+def route_request(method, command):
+    """ Finds the handler for a request.
+
+    Returns:
+        tuple: The matched route pattern, and a handler taking the state, body
+        and query.
+    """
+    segments = command.split('/')
+    for route_method, pattern, handler in ROUTES:
+        parts = pattern.split('/')
+        if route_method != method or len(parts) != len(segments):
+            continue
+        args = []
+        for part, segment in zip(parts, segments):
+            if part.startswith('{'):
+                args.append(segment)
+            elif part != segment:
+                break
+        else:
+            return pattern, \
+                lambda s, b, q, h=handler, a=args: h(s, b, q, *a)
+    return None, _not_found
+
+
+class FakeHabiticaServer(ThreadingMixIn, HTTPServer):
+    """ Threaded fake Habitica API server.
+
+    Attributes:
+        state (FakeHabiticaState): The in-memory API state.
+        latency (callable): Returns the latency to add to a response, in
+            seconds, or None for no added latency.
+        connection_count (int): The number of connections accepted.
+        requests (collections.Counter): The number of requests handled, keyed
+            by (method, route pattern).
+    """
+
+    daemon_threads = True
+
+    def __init__(
+            self,
+            host='127.0.0.1',
+            port=0,
+            state=None,
+            latency=None,
+            quota=None,
+            window=60,
+            reject_rate=0,
+            retry_after=1):
+        """ Initialises the server.
+
+        Args:
+            host (str): The interface to bind to.
+            port (int): The port to listen on. Zero picks a free port.
+            state (FakeHabiticaState): The API state. A new state is created
+                if not given.
+            latency (callable or str): The response latency. Either a
+                function returning seconds, or a specification accepted by
+                `parse_latency`.
+            quota (int): If set, the number of requests allowed in each
+                window. Responses then carry the ``X-RateLimit-*`` headers,
+                and requests over the quota are rejected with a 429.
+            window (float): The quota window in seconds.
+            reject_rate (float): The probability of rejecting any request
+                with a 429, from 0 to 1.
+            retry_after (float): The Retry-After seconds sent with randomly
+                rejected requests.
+        """
+        HTTPServer.__init__(self, (host, port), FakeHabiticaHandler)
+        self.__thread = None
+        self.__lock = threading.Lock()
+        self.state = state or FakeHabiticaState()
+        if latency is None or callable(latency):
+            self.latency = latency
+        else:
+            self.latency = parse_latency(latency)
+        self.quota = quota
+        self.window = window
+        self.reject_rate = reject_rate
+        self.retry_after = retry_after
+        self.connection_count = 0
+        self.requests = Counter()
+        self.rejected = 0
+        self.__window_start = time.time()
+        self.__window_count = 0
+
+    def process_request(self, request, client_address):
+        """ Counts accepted connections before handing them to a thread. """
+        self.connection_count += 1
+        ThreadingMixIn.process_request(self, request, client_address)
+
+    def count(self, method, route):
+        """ Counts a handled request. """
+        with self.__lock:
+            self.requests[(method, route)] += 1
+
+    def admit(self):
+        """ Applies the quota and random rejections to a request.
+
+        Returns:
+            tuple: True if the request is allowed, and the rate limit headers
+            for the response.
+        """
+        with self.__lock:
+            headers = {}
+            allowed = True
+            if self.quota:
+                now = time.time()
+                if now - self.__window_start >= self.window:
+                    self.__window_start = now
+                    self.__window_count = 0
+                reset = self.__window_start + self.window
+                if self.__window_count < self.quota:
+                    self.__window_count += 1
+                else:
+                    allowed = False
+                    headers['Retry-After'] = str(
+                        int(math.ceil(max(0, reset - now))))
+                headers['X-RateLimit-Limit'] = str(self.quota)
+                headers['X-RateLimit-Remaining'] = str(
+                    self.quota - self.__window_count)
+                headers['X-RateLimit-Reset'] = str(int(reset * 1000))
+
+            if allowed and self.reject_rate and \
+                    random.random() < self.reject_rate:
+                allowed = False
+                headers['Retry-After'] = str(self.retry_after)
+
+            if not allowed:
+                self.rejected += 1
+            return allowed, headers
+
+    @property
+    def base_url(self):
+        """ The API base URL, suitable for `HabiticaService`. """
+        return 'http://{0}:{1}{2}'.format(
+            self.server_address[0],
+            self.server_address[1],
+            API_PREFIX)
+
+    def start(self):
+        """ Serves requests on a background thread.
+
+        Returns:
+            FakeHabiticaServer: self
+        """
+        self.__thread = threading.Thread(target=self.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        """ Stops the background thread and closes the socket. """
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    """ Runs the fake server in the foreground. """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument(
+        '--latency',
+        default='',
+        help='Response latency specification')
+    parser.add_argument(
+        '--quota',
+        type=int,
+        default=None,
+        help='Requests allowed per window')
+    parser.add_argument(
+        '--window',
+        type=float,
+        default=60,
+        help='Quota window in seconds')
+    parser.add_argument(
+        '--reject-rate',
+        type=float,
+        default=0,
+        help='Probability of rejecting a request with a 429')
+    parser.add_argument(
+        '--tasks',
+        type=int,
+        default=0,
+        help='Number of todos to create at startup')
+    args = parser.parse_args()
+
+    server = FakeHabiticaServer(
+        args.host,
+        args.port,
+        latency=args.latency,
+        quota=args.quota,
+        window=args.window,
+        reject_rate=args.reject_rate)
+    for i in range(args.tasks):
+        server.state.create_task({'text': 'Todo {0}'.format(i)})
+
+    print('Fake Habitica API at {0}'.format(server.base_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for (method, route), count in sorted(server.requests.items()):
+            print('{0:>6} {1}: {2}'.format(method, route, count))
+        print('Rejected: {0}'.format(server.rejected))
+
+
+if __name__ == '__main__':
+    main()
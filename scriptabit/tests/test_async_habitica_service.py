@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+
+import asyncio
+
+from scriptabit.async_habitica_service import AsyncHabiticaService
+from scriptabit.errors import ArgumentOutOfRangeError
+from scriptabit.rate_limiter import RateLimiter
+
+from .fake_habitica_server import FakeHabiticaServer
+
+
+def run(coroutine):
+    """ Runs a coroutine to completion on a fresh event loop. """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class TestAsyncHabiticaService(object):
+
+    server = None
+
+    @classmethod
+    def setup_class(cls):
+        cls.server = FakeHabiticaServer().start()
+        for i in range(20):
+            cls.server.state.create_task(
+                {'_id': str(i), 'text': 'Task {0}'.format(i)})
+
+    @classmethod
+    def teardown_class(cls):
+        cls.server.stop()
+
+    def service(self, **kwargs):
+        return AsyncHabiticaService({}, self.server.base_url, **kwargs)
+
+    def test_server_status_up(self):
+        async def check():
+            async with self.service() as ahs:
+                return await ahs.is_server_up()
+
+        assert run(check()) is True
+
+    def test_concurrent_requests(self):
+        limiter = RateLimiter(rate=0.001, capacity=100)
+
+        async def score():
+            async with self.service(rate_limiter=limiter) as ahs:
+                return await asyncio.gather(
+                    *[ahs.score_task({'_id': str(i)}) for i in range(20)])
+
+        results = run(score())
+        assert len(results) == 20
+        assert limiter.tokens == pytest.approx(80, abs=1)
+
+    def test_connections_are_limited(self):
+        before = self.server.connection_count
+
+        async def fetch():
+            async with self.service(limit=2, limit_per_host=2) as ahs:
+                return await asyncio.gather(
+                    *[ahs.get_task(str(i)) for i in range(10)])
+
+        tasks = run(fetch())
+        assert [t['_id'] for t in tasks] == [str(i) for i in range(10)]
+        assert self.server.connection_count - before <= 2
+
+    def test_get_task_requires_key(self):
+        with pytest.raises(ValueError):
+            run(self.service().get_task())
+
+    def test_update_task_requires_key(self):
+        with pytest.raises(ValueError):
+            run(self.service().update_task({}))
+
+    def test_set_hp_out_of_range(self):
+        with pytest.raises(ArgumentOutOfRangeError):
+            run(self.service().set_hp(51))
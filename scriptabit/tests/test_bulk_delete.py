@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+import json
+import os
+import threading
+
+import pytest
+
+from scriptabit import BulkDelete, HabiticaService, RateLimiter
+
+from .fake_habitica_server import FakeHabiticaServer
+
+
+@pytest.fixture
+def server():
+    server = FakeHabiticaServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def hs(server):
+    return HabiticaService(
+        {},
+        server.base_url,
+        rate_limiter=RateLimiter(rate=1000, capacity=1000))
+
+
+def make_tasks(server, count):
+    return [
+        server.state.create_task({'text': 'Task {0}'.format(i)})
+        for i in range(count)]
+
+
+def test_deletes_tasks_and_tags(server, hs):
+    tasks = make_tasks(server, 20)
+    tags = [server.state.create_tag(n) for n in ('a', 'b')]
+    progress = []
+
+    engine = BulkDelete(
+        hs,
+        max_workers=4,
+        progress=lambda done, total: progress.append((done, total)))
+    result = engine.run(tasks, tags)
+
+    assert result == {'deleted': 22, 'skipped': 0, 'failed': []}
+    assert server.state.tasks == {}
+    assert server.state.tags == []
+    assert sorted(progress) == [(i, 22) for i in range(1, 23)]
+
+
+def test_deletions_are_concurrent(server, hs):
+    tasks = make_tasks(server, 8)
+    server.latency = lambda: 0.1
+    threads = set()
+    original = hs.delete_task
+
+    def delete_task(task):
+        threads.add(threading.current_thread().name)
+        original(task)
+
+    hs.delete_task = delete_task
+    BulkDelete(hs, max_workers=4).run(tasks)
+    assert len(threads) == 4
+
+
+def test_missing_items_count_as_deleted(server, hs):
+    tasks = make_tasks(server, 2)
+    server.state.delete_task(tasks[0]['_id'])
+    result = BulkDelete(hs).run(tasks)
+    assert result['deleted'] == 2
+    assert result['failed'] == []
+
+
+def test_missing_tags_leave_the_tag_cache(server):
+    hs = HabiticaService(
+        {},
+        server.base_url,
+        rate_limiter=RateLimiter(rate=1000, capacity=1000),
+        tag_cache_ttl=300)
+    tag = hs.create_tags(['a'])[0]
+    server.state.delete_tag(tag['id'])
+
+    assert BulkDelete(hs).run(tags=[tag])['deleted'] == 1
+    new_tag = hs.create_tags(['a'])[0]
+    assert new_tag['id'] != tag['id']
+    assert [t['id'] for t in server.state.tags] == [new_tag['id']]
+
+
+def test_failures_are_checkpointed_and_resumed(server, hs, tmpdir):
+    checkpoint = str(tmpdir.join('checkpoint.json'))
+    tasks = make_tasks(server, 10)
+    original = hs.delete_task
+
+    def delete_task(task):
+        if task is tasks[3]:
+            raise IOError('connection lost')
+        original(task)
+
+    hs.delete_task = delete_task
+    result = BulkDelete(hs, checkpoint=checkpoint).run(tasks[:4])
+    assert result['deleted'] == 3
+    assert [item for item, _ in result['failed']] == [tasks[3]]
+    hs.delete_task = original
+    with open(checkpoint) as f:
+        assert sorted(json.load(f)['deleted']) == \
+            sorted(t['_id'] for t in tasks[:3])
+
+    engine = BulkDelete(hs, checkpoint=checkpoint)
+    assert engine.estimate(tasks)['skipped'] == 3
+    before = server.requests[('DELETE', 'tasks/{task}')]
+    result = engine.run(tasks)
+    assert result == {'deleted': 7, 'skipped': 3, 'failed': []}
+    assert server.requests[('DELETE', 'tasks/{task}')] - before == 7
+    assert not os.path.exists(checkpoint)
+
+
+def test_estimate_does_not_delete(server, hs):
+    tasks = make_tasks(server, 5)
+    hs = HabiticaService(
+        {},
+        server.base_url,
+        rate_limiter=RateLimiter(rate=0.5, capacity=2))
+    estimate = BulkDelete(hs).estimate(tasks, [{'id': 'x', 'name': 'x'}])
+    assert estimate['tasks'] == 5
+    assert estimate['tags'] == 1
+    assert estimate['seconds'] == pytest.approx(8, abs=0.1)
+    assert len(server.state.tasks) == 5
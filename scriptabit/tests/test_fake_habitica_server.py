@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+import time
+
+import pytest
+import requests
+
+from scriptabit.habitica_service import HabiticaService, SpellIDs
+from scriptabit.rate_limiter import RateLimiter
+
+from .fake_habitica_server import (
+    FakeHabiticaServer,
+    parse_latency,
+    route_request,
+)
+
+
+@pytest.fixture
+def server():
+    server = FakeHabiticaServer().start()
+    yield server
+    server.stop()
+
+
+def service(server, **kwargs):
+    return HabiticaService({}, server.base_url, **kwargs)
+
+
+def test_parse_latency():
+    assert parse_latency('') is None
+    assert parse_latency('0.25')() == 0.25
+    assert 1 <= parse_latency('uniform:1,2')() <= 2
+    assert parse_latency('normal:1,0.1')() >= 0
+    assert parse_latency('lognormal:0.1,0.5')() > 0
+    with pytest.raises(ValueError):
+        parse_latency('uniform:1')
+    with pytest.raises(ValueError):
+        parse_latency('pareto:1,2')
+
+
+def test_route_request():
+    assert route_request('GET', 'tasks/user')[0] == 'tasks/user'
+    assert route_request('GET', 'tasks/abc')[0] == 'tasks/{task}'
+    assert route_request('POST', 'tasks/abc/score/up')[0] == \
+        'tasks/{task}/score/{direction}'
+    assert route_request('PATCH', 'tasks/abc')[0] is None
+
+
+def test_task_lifecycle(server):
+    hs = service(server)
+    task = hs.create_task({'text': 'A todo', 'alias': 'todo1'})
+    assert task['type'] == 'todo'
+    assert hs.get_task(task['_id'])['text'] == 'A todo'
+    assert hs.get_task(alias='todo1')['_id'] == task['_id']
+
+    task['text'] = 'Renamed'
+    assert hs.update_task(task)['text'] == 'Renamed'
+    assert [t['text'] for t in hs.get_tasks()] == ['Renamed']
+
+    hs.score_task(task)
+    assert hs.get_tasks() == []
+    assert hs.get_task(task['_id'])['completed'] is True
+
+    hs.delete_task(task)
+    assert hs.get_task(task['_id']) is None
+
+
+def test_unknown_task_is_not_found(server):
+    hs = service(server)
+    assert hs.get_task('missing') is None
+    with pytest.raises(requests.HTTPError):
+        hs.score_task({'_id': 'missing'})
+
+
+def test_create_tasks_in_bulk(server):
+    hs = service(server)
+    hs.create_tasks([
+        {'text': 'habit', 'type': 'habit'},
+        {'text': 'daily', 'type': 'daily'},
+    ])
+    assert [t['text'] for t in hs.get_tasks()] == ['habit', 'daily']
+    assert server.requests[('POST', 'tasks/user')] == 1
+
+
+def test_checklist(server):
+    hs = service(server)
+    _id = hs.create_task({'text': 'With checklist'})['_id']
+    hs.create_checklist_item(_id, {'text': 'item'})
+    item = hs.get_task(_id)['checklist'][0]
+    hs.update_checklist_item(_id, item['id'], {'text': 'renamed'})
+    hs.score_checklist_item(_id, item['id'])
+    assert hs.get_task(_id)['checklist'] == [
+        {'id': item['id'], 'text': 'renamed', 'completed': True}]
+    hs.delete_checklist_item(_id, item['id'])
+    assert hs.get_task(_id)['checklist'] == []
+
+
+def test_tags(server):
+    hs = service(server)
+    tags = hs.create_tags(['a', 'b'])
+    assert sorted(t['name'] for t in hs.get_tags()) == ['a', 'b']
+
+    task = hs.create_task({'text': 'Tagged', 'tags': [tags[0]['id']]})
+    hs.delete_tags([tags[0]])
+    assert [t['name'] for t in hs.get_tags()] == ['b']
+    assert hs.get_task(task['_id'])['tags'] == []
+
+
+def test_stats(server):
+    hs = service(server)
+    assert hs.set_hp(20) == 20
+    assert hs.set_gp(500) == 500
+    assert hs.get_stats()['hp'] == 20
+    assert hs.get_user(fields='stats.gp') == {
+        'id': server.state.user['id'],
+        'stats': {'gp': 500},
+    }
+
+
+def test_spells_cost_mana(server):
+    hs = service(server)
+    hs.set_mp(30)
+    hs.cast_skill_by_raw_spell_id('fireball')
+    assert hs.get_stats()['mp'] == 20
+
+
+def test_ethereal_surge_costs_30_mana(server):
+    hs = service(server)
+    hs.set_mp(50)
+    hs.cast_skill(SpellIDs.ethereal_surge)
+    assert hs.get_stats()['mp'] == 20
+
+
+def test_quota_headers_and_retry(server):
+    server.quota = 2
+    server.window = 1
+    limiter = RateLimiter(rate=100, capacity=100)
+    hs = service(server, rate_limiter=limiter)
+
+    start = time.time()
+    for _ in range(3):
+        assert hs.is_server_up()
+    assert time.time() - start >= 0.5
+    assert limiter.capacity == 2
+
+
+def test_random_rejections_are_retried(server):
+    server.reject_rate = 1
+    server.retry_after = 0
+    hs = service(
+        server,
+        rate_limiter=RateLimiter(rate=100, capacity=100),
+        max_retries=2)
+    assert hs.is_server_up() is False
+    assert server.rejected == 3
+    assert server.requests[('GET', 'status')] == 0
+
+
+def test_latency(server):
+    server.latency = parse_latency('0.05')
+    hs = service(server)
+    assert hs.is_server_up()
+    assert hs.latencies.summary()['max'] >= 0.05
@@ -6,6 +6,9 @@ from __future__ import (
     unicode_literals,
 )
 from builtins import *
+import json
+import time
+
 import pytest
 import requests
 import requests_mock
@@ -13,8 +16,10 @@ from pkg_resources import resource_filename
 
 from scriptabit.errors import *
 from scriptabit.habitica_service import HabiticaService
+from scriptabit.rate_limiter import RateLimiter
 
 from .fake_data import *
+from .fake_habitica_server import FakeHabiticaServer
 
 
 class TestHabiticaService(object):
@@ -33,6 +38,46 @@ class TestHabiticaService(object):
                   text='{"data": {"status": "up"}}')
             assert self.hs.is_server_up() is True
 
+    def test_connections_are_reused(self):
+        server = FakeHabiticaServer().start()
+        try:
+            hs = HabiticaService({}, server.base_url)
+            for _ in range(5):
+                assert hs.is_server_up()
+            hs.close()
+            assert server.connection_count == 1
+        finally:
+            server.stop()
+
+    def test_too_many_requests_is_retried(self):
+        slept = []
+        hs = HabiticaService(
+            {},
+            'https://habitica.com/api/v3/',
+            rate_limiter=RateLimiter(sleep=slept.append))
+        with requests_mock.mock() as m:
+            m.get('https://habitica.com/api/v3/status', [
+                {'status_code': 429, 'headers': {'Retry-After': '5'}},
+                {'text': '{"data": {"status": "up"}}'}])
+            assert hs.is_server_up() is True
+            assert len(m.request_history) == 2
+            assert slept == [pytest.approx(5, abs=0.1)]
+            assert len(hs.latencies) == 2
+
+    def test_too_many_requests_retry_limit(self):
+        hs = HabiticaService(
+            {},
+            'https://habitica.com/api/v3/',
+            rate_limiter=RateLimiter(sleep=lambda s: None),
+            max_retries=2)
+        with requests_mock.mock() as m:
+            m.get('https://habitica.com/api/v3/user',
+                  status_code=429,
+                  headers={'Retry-After': '1'})
+            with pytest.raises(requests.HTTPError):
+                hs.get_user()
+            assert len(m.request_history) == 3
+
     def test_server_status_down(self):
         with requests_mock.mock() as m:
             m.get('https://habitica.com/api/v3/status',
@@ -68,6 +113,80 @@ class TestHabiticaService(object):
             assert stats['exp'] == 34
             assert stats['toNextLevel'] == 180
 
+    def test_user_is_cached(self):
+        hs = HabiticaService(
+            {},
+            'https://habitica.com/api/v3/',
+            user_cache_ttl=60)
+        with requests_mock.mock() as m:
+            m.get('https://habitica.com/api/v3/user', text=get_fake_stats()[1])
+            assert hs.get_stats()['hp'] == 47.21
+            assert hs.get_stats()['hp'] == 47.21
+            assert len(m.request_history) == 1
+
+    def test_user_cache_is_invalidated_by_changes(self):
+        hs = HabiticaService(
+            {},
+            'https://habitica.com/api/v3/',
+            user_cache_ttl=60)
+        with requests_mock.mock() as m:
+            m.get('https://habitica.com/api/v3/user', text=get_fake_stats()[1])
+            m.put('https://habitica.com/api/v3/user', text=get_fake_stats()[1])
+            hs.get_stats()
+            hs.set_hp(39)
+            hs.get_stats()
+            hs.get_stats()
+            assert [r.method for r in m.request_history] == \
+                ['GET', 'PUT', 'GET']
+
+            hs.invalidate_user_cache()
+            hs.get_stats()
+            assert len(m.request_history) == 4
+
+    def test_get_stats_only_fetches_stats(self):
+        with requests_mock.mock() as m:
+            m.get('https://habitica.com/api/v3/user', text=get_fake_stats()[1])
+            self.hs.get_stats()
+            assert m.last_request.qs == {'userfields': ['stats']}
+
+    def test_get_user_fields(self):
+        with requests_mock.mock() as m:
+            m.get('https://habitica.com/api/v3/user', text=get_fake_stats()[1])
+            self.hs.get_user(fields=['items.pets', 'items.food'])
+            assert m.last_request.qs == {
+                'userfields': ['items.food,items.pets']}
+            self.hs.get_user()
+            assert m.last_request.qs == {}
+
+    def test_cached_user_answers_projections(self):
+        hs = HabiticaService(
+            {},
+            'https://habitica.com/api/v3/',
+            user_cache_ttl=60)
+        with requests_mock.mock() as m:
+            m.get('https://habitica.com/api/v3/user', text=get_fake_stats()[1])
+            user = hs.get_user()
+            stats = hs.get_user(fields='stats')
+            assert stats['stats'] == user['stats']
+            assert 'profile' not in stats
+            assert len(m.request_history) == 1
+
+            # a projection can't answer a request for the full document
+            hs.invalidate_user_cache()
+            hs.get_stats()
+            hs.get_user()
+            assert len(m.request_history) == 3
+
+    def test_user_cache_returns_copies(self):
+        hs = HabiticaService(
+            {},
+            'https://habitica.com/api/v3/',
+            user_cache_ttl=60)
+        with requests_mock.mock() as m:
+            m.get('https://habitica.com/api/v3/user', text=get_fake_stats()[1])
+            hs.get_stats()['hp'] = 0
+            assert hs.get_stats()['hp'] == 47.21
+
     def test_set_hp(self):
         with requests_mock.mock() as m:
             m.put('https://habitica.com/api/v3/user',
@@ -130,6 +249,34 @@ class TestHabiticaService(object):
             new_gp = self.hs.set_gp(0)
             assert new_gp == 0
 
+    def test_set_stats(self):
+        with requests_mock.mock() as m:
+            m.put('https://habitica.com/api/v3/user',
+                  text=get_fake_stats(hp=20, gp=15)[1])
+            stats = self.hs.set_stats({'hp': 20, 'gp': 15})
+            assert stats['hp'] == 20
+            assert stats['gp'] == 15
+            assert len(m.request_history) == 1
+            assert sorted(m.request_history[0].text.split('&')) == \
+                ['stats.gp=15', 'stats.hp=20']
+
+    def test_set_stats_level_resets_exp(self):
+        with requests_mock.mock() as m:
+            m.put('https://habitica.com/api/v3/user',
+                  text=get_fake_stats(lvl=12, exp=0)[1])
+            self.hs.set_stats({'lvl': 12})
+            assert sorted(m.request_history[0].text.split('&')) == \
+                ['stats.exp=0', 'stats.lvl=12']
+
+    def test_set_stats_validates_all_values_first(self):
+        with requests_mock.mock() as m:
+            with pytest.raises(ArgumentOutOfRangeError):
+                self.hs.set_stats({'gp': 10, 'hp': 51})
+            with pytest.raises(ValueError):
+                self.hs.set_stats({'str': 10})
+            assert self.hs.set_stats({}) == {}
+            assert len(m.request_history) == 0
+
     def test_upsert_without_id_or_alias(self):
         with (pytest.raises(ValueError)):
             self.hs.upsert_task({})
@@ -138,14 +285,14 @@ class TestHabiticaService(object):
         # Don't test the data, just that the expected API functions are called
         task = get_fake_task(alias='alias')
         with requests_mock.mock() as m:
-            m.get('https://habitica.com/api/v3/tasks/alias',
+            m.put('https://habitica.com/api/v3/tasks/alias',
                   status_code=requests.codes.not_found)
             m.post('https://habitica.com/api/v3/tasks/user',
                   text=task[1])
             self.hs.upsert_task(task[0])
 
             history = m.request_history
-            assert history[0].method == 'GET'
+            assert history[0].method == 'PUT'
             assert history[0].url == 'https://habitica.com/api/v3/tasks/alias'
             assert history[1].method == 'POST'
             assert history[1].url == 'https://habitica.com/api/v3/tasks/user'
@@ -154,31 +301,29 @@ class TestHabiticaService(object):
         # Don't test the data, just that the expected API functions are called
         task = get_fake_task(alias='alias')
         with requests_mock.mock() as m:
-            m.get('https://habitica.com/api/v3/tasks/alias',
-                  text=task[1])
             m.put('https://habitica.com/api/v3/tasks/alias',
                   text=task[1])
-            self.hs.upsert_task(task[0])
+            HabiticaService({}, 'https://habitica.com/api/v3/').upsert_task(
+                task[0])
 
             history = m.request_history
-            assert history[0].method == 'GET'
+            assert len(history) == 1
+            assert history[0].method == 'PUT'
             assert history[0].url == 'https://habitica.com/api/v3/tasks/alias'
-            assert history[1].method == 'PUT'
-            assert history[1].url == 'https://habitica.com/api/v3/tasks/alias'
 
     def test_upsert_new_task_created_id(self):
         # Don't test the data, just that the expected API functions are called
         _id = '0934b3fa'
         task = get_fake_task(_id=_id)
         with requests_mock.mock() as m:
-            m.get('https://habitica.com/api/v3/tasks/'+_id,
+            m.put('https://habitica.com/api/v3/tasks/'+_id,
                   status_code=requests.codes.not_found)
             m.post('https://habitica.com/api/v3/tasks/user',
                   text=task[1])
             self.hs.upsert_task(task[0])
 
             history = m.request_history
-            assert history[0].method == 'GET'
+            assert history[0].method == 'PUT'
             assert history[0].url == 'https://habitica.com/api/v3/tasks/'+_id
             assert history[1].method == 'POST'
             assert history[1].url == 'https://habitica.com/api/v3/tasks/user'
@@ -188,14 +333,112 @@ class TestHabiticaService(object):
         _id = '0934b3fa'
         task = get_fake_task(_id=_id)
         with requests_mock.mock() as m:
-            m.get('https://habitica.com/api/v3/tasks/'+_id,
-                  text=task[1])
             m.put('https://habitica.com/api/v3/tasks/'+_id,
                   text=task[1])
             self.hs.upsert_task(task[0])
 
             history = m.request_history
-            assert history[0].method == 'GET'
+            assert len(history) == 1
+            assert history[0].method == 'PUT'
             assert history[0].url == 'https://habitica.com/api/v3/tasks/'+_id
-            assert history[1].method == 'PUT'
-            assert history[1].url == 'https://habitica.com/api/v3/tasks/'+_id
+
+    def test_upsert_remembers_alias_ids(self):
+        hs = HabiticaService({}, 'https://habitica.com/api/v3/')
+        with requests_mock.mock() as m:
+            m.put('https://habitica.com/api/v3/tasks/alias',
+                  status_code=requests.codes.not_found)
+            m.post('https://habitica.com/api/v3/tasks/user',
+                  text=get_fake_task(_id='abc', alias='alias')[1])
+            m.put('https://habitica.com/api/v3/tasks/abc',
+                  text=get_fake_task(_id='abc', alias='alias')[1])
+            hs.upsert_task({'alias': 'alias', 'text': 'first'})
+            hs.upsert_task({'alias': 'alias', 'text': 'second'})
+
+            history = m.request_history
+            assert [(r.method, r.path) for r in history] == [
+                ('PUT', '/api/v3/tasks/alias'),
+                ('POST', '/api/v3/tasks/user'),
+                ('PUT', '/api/v3/tasks/abc'),
+            ]
+
+    def test_upsert_recreates_deleted_task(self):
+        hs = HabiticaService({}, 'https://habitica.com/api/v3/')
+        with requests_mock.mock() as m:
+            m.get('https://habitica.com/api/v3/tasks/alias',
+                  text=get_fake_task(_id='abc', alias='alias')[1])
+            m.put('https://habitica.com/api/v3/tasks/abc',
+                  status_code=requests.codes.not_found)
+            m.post('https://habitica.com/api/v3/tasks/user',
+                  text=get_fake_task(_id='def', alias='alias')[1])
+            hs.get_task(alias='alias')
+            assert hs.upsert_task({'alias': 'alias'})['_id'] == 'def'
+            assert [r.method for r in m.request_history] == \
+                ['GET', 'PUT', 'POST']
+
+
+class TestTagCache(object):
+
+    url = 'https://habitica.com/api/v3/'
+
+    @staticmethod
+    def tags(*names):
+        return json.dumps({'data': [
+            {'id': 'id-' + n, 'name': n} for n in names]})
+
+    def test_create_tags_reuses_the_tag_list(self):
+        hs = HabiticaService({}, self.url, tag_cache_ttl=60)
+        with requests_mock.mock() as m:
+            m.get(self.url + 'tags', text=self.tags('a', 'b'))
+            assert [t['id'] for t in hs.create_tags(['a'])] == ['id-a']
+            assert [t['id'] for t in hs.create_tags(['b', 'a'])] == \
+                ['id-a', 'id-b']
+            assert len(m.request_history) == 1
+
+    def test_unknown_name_refreshes_then_creates(self):
+        hs = HabiticaService({}, self.url, tag_cache_ttl=60)
+        with requests_mock.mock() as m:
+            m.get(self.url + 'tags', text=self.tags('a'))
+            m.post(self.url + 'tags',
+                   text=json.dumps({'data': {'id': 'id-c', 'name': 'c'}}))
+            hs.create_tags(['a'])
+            assert [t['id'] for t in hs.create_tags(['a', 'c'])] == \
+                ['id-a', 'id-c']
+            assert [r.method for r in m.request_history] == \
+                ['GET', 'GET', 'POST']
+
+            # the created tag is added to the cache
+            hs.create_tags(['c'])
+            assert len(m.request_history) == 3
+
+    def test_deleted_tags_are_removed_from_the_cache(self):
+        hs = HabiticaService({}, self.url, tag_cache_ttl=60)
+        with requests_mock.mock() as m:
+            m.get(self.url + 'tags', text=self.tags('a', 'b'))
+            m.delete(self.url + 'tags/id-a', text='{}')
+            tags = hs.create_tags(['a', 'b'])
+            hs.delete_tags([tags[0]])
+            m.get(self.url + 'tags', text=self.tags('b'))
+            m.post(self.url + 'tags',
+                   text=json.dumps({'data': {'id': 'id-a2', 'name': 'a'}}))
+            assert [t['id'] for t in hs.create_tags(['a'])] == ['id-a2']
+
+    def test_expired_cache_is_refreshed(self, monkeypatch):
+        hs = HabiticaService({}, self.url, tag_cache_ttl=60)
+        with requests_mock.mock() as m:
+            m.get(self.url + 'tags', text=self.tags('a'))
+            hs.create_tags(['a'])
+            later = time.time() + 61
+            monkeypatch.setattr(time, 'time', lambda: later)
+            hs.create_tags(['a'])
+            hs.create_tags(['a'])
+            hs.invalidate_tag_cache()
+            hs.create_tags(['a'])
+            assert len(m.request_history) == 3
+
+    def test_cache_disabled_by_default(self):
+        hs = HabiticaService({}, self.url)
+        with requests_mock.mock() as m:
+            m.get(self.url + 'tags', text=self.tags('a'))
+            hs.create_tags(['a'])
+            hs.create_tags(['a'])
+            assert len(m.request_history) == 2
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+import pytest
+import requests_mock
+
+from scriptabit import (
+    HabiticaService,
+    HabiticaTask,
+    HabiticaTaskService,
+    SyncStatus)
+
+from .fake_data import get_fake_task
+
+
+def existing_items(*texts):
+    return [
+        {'id': 'id{0}'.format(i), 'text': t, 'completed': False}
+        for i, t in enumerate(texts)]
+
+
+def new_items(*texts):
+    return [{'text': t, 'completed': False} for t in texts]
+
+
+def test_diff_unchanged_checklist():
+    diff = HabiticaTaskService.diff_checklist(
+        existing_items('a', 'b', 'c'),
+        new_items('a', 'b', 'c'))
+    assert diff == []
+
+
+def test_diff_empty_checklists():
+    assert HabiticaTaskService.diff_checklist([], []) == []
+
+
+def test_diff_added_item():
+    diff = HabiticaTaskService.diff_checklist(
+        existing_items('a', 'b'),
+        new_items('a', 'b', 'c'))
+    assert diff == [('create', None, {'text': 'c', 'completed': False})]
+
+
+def test_diff_removed_item():
+    diff = HabiticaTaskService.diff_checklist(
+        existing_items('a', 'b', 'c'),
+        new_items('a', 'c'))
+    assert diff == [('delete', 'id1', None)]
+
+
+def test_diff_renamed_item():
+    diff = HabiticaTaskService.diff_checklist(
+        existing_items('a', 'b', 'c'),
+        new_items('a', 'B', 'c'))
+    assert diff == [('update', 'id1', {'text': 'B'})]
+
+
+def test_diff_checked_item():
+    new = new_items('a', 'b')
+    new[1]['completed'] = True
+    diff = HabiticaTaskService.diff_checklist(existing_items('a', 'b'), new)
+    assert diff == [('score', 'id1', None)]
+
+
+def test_diff_reordered_items():
+    diff = HabiticaTaskService.diff_checklist(
+        existing_items('a', 'b', 'c'),
+        new_items('c', 'a', 'b'))
+    assert diff == []
+
+
+def test_diff_duplicate_text_prefers_position():
+    existing = existing_items('x', 'x')
+    existing[1]['completed'] = True
+    new = new_items('x', 'x')
+    new[1]['completed'] = True
+    assert HabiticaTaskService.diff_checklist(existing, new) == []
+
+
+def test_diff_cleared_checklist():
+    diff = HabiticaTaskService.diff_checklist(existing_items('a', 'b'), [])
+    assert diff == [('delete', 'id0', None), ('delete', 'id1', None)]
+
+
+def test_update_only_sends_changes():
+    url = 'https://habitica.com/api/v3/'
+    hs = HabiticaService({}, url)
+    hts = HabiticaTaskService(hs)
+
+    d = get_fake_task(_id='t1')[0]
+    d['checklist'] = existing_items('a', 'b', 'c')
+    task = HabiticaTask(d)
+    task.new_checklist_items = new_items('a', 'B', 'c', 'd')
+    task.status = SyncStatus.updated
+
+    with requests_mock.mock() as m:
+        m.put(url + 'tasks/t1/checklist/id1', text='{"data": {}}')
+        m.post(url + 'tasks/t1/checklist', text='{"data": {}}')
+        m.put(url + 'tasks/t1', text='{"data": {}}')
+        hts.persist_tasks([task])
+
+        assert [(r.method, r.path) for r in m.request_history] == [
+            ('PUT', '/api/v3/tasks/t1/checklist/id1'),
+            ('POST', '/api/v3/tasks/t1/checklist'),
+            ('PUT', '/api/v3/tasks/t1')]
+
+
+def test_persist_collects_failures():
+    url = 'https://habitica.com/api/v3/'
+    hts = HabiticaTaskService(HabiticaService({}, url), max_workers=3)
+
+    tasks = []
+    for i in range(6):
+        task = HabiticaTask(get_fake_task(_id='t{0}'.format(i))[0])
+        task.status = SyncStatus.updated
+        tasks.append(task)
+    tasks[2].completed = True
+
+    with requests_mock.mock() as m:
+        m.put(requests_mock.ANY, text='{"data": {}}')
+        m.put(url + 'tasks/t4', status_code=500)
+        m.post(url + 'tasks/t2/score/up', text='{"data": {}}')
+        failures = hts.persist_tasks(tasks)
+
+        assert [t.id for t, _ in failures] == ['t4']
+        assert len(m.request_history) == 7
+
+        # the completed task is updated before it is scored
+        t2 = [r.method for r in m.request_history if '/t2' in r.path]
+        assert t2 == ['PUT', 'POST']
+
+
+def test_persist_dry_run():
+    hts = HabiticaTaskService(
+        HabiticaService({}, 'https://habitica.com/api/v3/'),
+        dry_run=True)
+    task = HabiticaTask(get_fake_task(_id='t1')[0])
+    task.status = SyncStatus.updated
+    with requests_mock.mock() as m:
+        assert hts.persist_tasks([task]) == []
+        assert not m.called
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+""" Unit tests for the API latency recorder """
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+import random
+
+from scriptabit import LatencyRecorder
+
+
+def test_empty():
+    recorder = LatencyRecorder()
+    assert len(recorder) == 0
+    assert recorder.percentile(50) is None
+    assert recorder.summary() == {
+        'count': 0, 'total': 0, 'p50': None, 'p90': None, 'p99': None,
+        'max': None}
+
+
+def test_percentiles():
+    recorder = LatencyRecorder()
+    for i in range(100, 0, -1):
+        recorder.record(i / 100)
+
+    assert len(recorder) == 100
+    assert recorder.percentile(0) == 0.01
+    assert recorder.percentile(50) == 0.5
+    assert recorder.percentile(100) == 1
+
+    summary = recorder.summary()
+    assert summary['count'] == 100
+    assert summary['p90'] == 0.9
+    assert summary['p99'] == 0.99
+    assert summary['max'] == 1
+
+
+def test_reset():
+    recorder = LatencyRecorder()
+    recorder.record(1)
+    recorder.reset()
+    assert len(recorder) == 0
+
+
+def test_sample_is_bounded():
+    recorder = LatencyRecorder(capacity=100, rng=random.Random(1))
+    for i in range(1, 10001):
+        recorder.record(i / 10000)
+
+    assert len(recorder) == 10000
+    summary = recorder.summary()
+    assert summary['count'] == 10000
+    assert summary['total'] == sum(i / 10000 for i in range(1, 10001))
+    assert summary['max'] == 1
+    assert abs(summary['p50'] - 0.5) < 0.15
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+import pytest
+
+from scriptabit.rate_limiter import RateLimiter, parse_reset_time
+
+
+class FakeClock(object):
+    """ A manually advanced clock, which also acts as the sleep function. """
+    def __init__(self, now=1000000000.0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def limiter(rate=1.0, capacity=3):
+    clock = FakeClock()
+    return RateLimiter(
+        rate=rate,
+        capacity=capacity,
+        clock=clock,
+        sleep=clock.sleep), clock
+
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        RateLimiter(rate=0)
+
+
+def test_invalid_capacity():
+    with pytest.raises(ValueError):
+        RateLimiter(capacity=0)
+
+
+def test_burst_does_not_wait():
+    rl, clock = limiter(capacity=3)
+    for _ in range(3):
+        assert rl.acquire() == 0
+    assert not clock.slept
+
+
+def test_waits_when_bucket_empty():
+    rl, clock = limiter(rate=2.0, capacity=1)
+    rl.acquire()
+    rl.update({})
+    assert rl.acquire() == pytest.approx(0.5)
+    assert clock.slept == [pytest.approx(0.5)]
+
+
+def test_reservations_queue_up():
+    rl, _ = limiter(rate=1.0, capacity=1)
+    assert rl.reserve() == 0
+    assert rl.reserve() == pytest.approx(1)
+    assert rl.reserve() == pytest.approx(2)
+
+
+def test_refill_is_capped_at_capacity():
+    rl, clock = limiter(rate=1.0, capacity=2)
+    clock.now += 100
+    assert rl.tokens == 2
+
+
+def test_server_remaining_replaces_local_estimate():
+    rl, _ = limiter(rate=0.1, capacity=30)
+    for _ in range(20):
+        rl.reserve()
+        rl.update({})
+    rl.reserve()
+    rl.update({'X-RateLimit-Remaining': '25'})
+    assert rl.tokens == 25
+
+
+def test_server_limit_sets_capacity():
+    rl, _ = limiter(capacity=3)
+    rl.reserve()
+    rl.update({'X-RateLimit-Limit': '60', 'X-RateLimit-Remaining': '59'})
+    assert rl.capacity == 60
+    assert rl.tokens == 59
+
+
+def test_in_flight_requests_are_not_double_counted():
+    rl, _ = limiter(capacity=10)
+    rl.reserve()
+    rl.reserve()
+    rl.update({'X-RateLimit-Remaining': '5'})
+    # one request is still in flight, and the server hasn't seen it yet
+    assert rl.tokens == 4
+
+
+def test_waits_for_server_reset_when_quota_exhausted():
+    rl, clock = limiter(rate=10.0, capacity=30)
+    rl.reserve()
+    rl.update({
+        'X-RateLimit-Remaining': '0',
+        'X-RateLimit-Reset': str(clock.now + 42)})
+    assert rl.reserve() == pytest.approx(42)
+
+
+def test_bucket_refills_at_server_reset():
+    rl, clock = limiter(rate=0.01, capacity=30)
+    rl.reserve()
+    rl.update({
+        'X-RateLimit-Remaining': '0',
+        'X-RateLimit-Reset': str(clock.now + 10)})
+    clock.now += 11
+    assert rl.tokens == 30
+
+
+def test_back_off_uses_retry_after():
+    rl, clock = limiter(capacity=30)
+    assert rl.back_off({'Retry-After': '7'}) == pytest.approx(7)
+    assert rl.acquire() == pytest.approx(7)
+
+
+def test_back_off_without_hints_waits_for_one_token():
+    rl, _ = limiter(rate=0.5, capacity=30)
+    assert rl.back_off({}) == pytest.approx(2)
+
+
+def test_estimate_duration():
+    rl, _ = limiter(rate=0.5, capacity=10)
+    assert rl.estimate_duration(10) == 0
+    assert rl.estimate_duration(20) == pytest.approx(20)
+
+
+def test_parse_reset_delay_seconds():
+    assert parse_reset_time('30', 1000.0) == 1030.0
+
+
+def test_parse_reset_epoch_seconds():
+    assert parse_reset_time('1500000000', 1000.0) == 1500000000
+
+
+def test_parse_reset_epoch_milliseconds():
+    assert parse_reset_time('1500000000000', 1000.0) == 1500000000
+
+
+def test_parse_reset_http_date():
+    assert parse_reset_time('Fri, 14 Jul 2017 02:40:00 GMT', 0) == 1500000000
+
+
+def test_parse_reset_javascript_date():
+    value = 'Fri Jul 14 2017 12:40:00 GMT+1000 (AEST)'
+    assert parse_reset_time(value, 0) == 1500000000
+
+
+def test_parse_reset_garbage():
+    assert parse_reset_time('soon', 0) is None
+    assert parse_reset_time(None, 0) is None
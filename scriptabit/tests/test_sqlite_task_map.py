@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+import os
+import pytest
+
+from bidict import (
+    KeyDuplicationError,
+    ValueDuplicationError,
+    KeyAndValueDuplicationError)
+from tempfile import mkdtemp
+from scriptabit import SqliteTaskMap, TaskMap
+
+from .task_implementations import MockTask
+
+
+@pytest.fixture
+def tmpdir_name():
+    return mkdtemp()
+
+
+def test_map_both_directions():
+    tm = SqliteTaskMap()
+    tm.map(MockTask(_id='1'), MockTask(_id='a'))
+    assert tm.get_dst_id('1') == 'a'
+    assert tm.get_src_id('a') == '1'
+    assert tm.try_get_dst_id('2') is False
+    assert tm.try_get_src_id('b') is False
+    assert tm.get_all_src_keys() == ['1']
+    assert tm.get_all_dst_keys() == ['a']
+    with pytest.raises(KeyError):
+        tm.get_dst_id('2')
+    with pytest.raises(KeyError):
+        tm.get_src_id('b')
+
+
+def test_duplicates():
+    tm = SqliteTaskMap()
+    tm.map(MockTask(_id='1'), MockTask(_id='a'))
+    tm.map(MockTask(_id='2'), MockTask(_id='b'))
+    with pytest.raises(KeyDuplicationError):
+        tm.map(MockTask(_id='1'), MockTask(_id='c'))
+    with pytest.raises(ValueDuplicationError):
+        tm.map(MockTask(_id='3'), MockTask(_id='a'))
+    with pytest.raises(KeyAndValueDuplicationError):
+        tm.map(MockTask(_id='1'), MockTask(_id='b'))
+
+
+def test_unmap():
+    tm = SqliteTaskMap()
+    tm.map(MockTask(_id='1'), MockTask(_id='a'))
+    tm.set_hash('1', 'abc')
+    tm.unmap('1')
+    assert tm.try_get_dst_id('1') is False
+    assert tm.get_hash('1') is None
+    with pytest.raises(KeyError):
+        tm.unmap('1')
+
+
+def test_persist_commits_changes(tmpdir_name):
+    filename = os.path.join(tmpdir_name, 'map.db')
+    tm = SqliteTaskMap(filename)
+    tm.map(MockTask(_id='1'), MockTask(_id='a'))
+    tm.set_hash('1', 'abc')
+    tm.persist()
+    tm.map(MockTask(_id='2'), MockTask(_id='b'))
+    tm.close()
+
+    # only the persisted changes survive
+    actual = SqliteTaskMap(filename)
+    assert actual.get_dst_id('1') == 'a'
+    assert actual.get_hash('1') == 'abc'
+    assert actual.try_get_dst_id('2') is False
+    actual.close()
+
+
+def test_migrate_from_json(tmpdir_name):
+    json_filename = os.path.join(tmpdir_name, 'map')
+    old = TaskMap()
+    old.map(MockTask(_id='1'), MockTask(_id='a'))
+    old.set_hash('1', 'abc')
+    old.persist(json_filename)
+
+    filename = os.path.join(tmpdir_name, 'map.db')
+    tm = SqliteTaskMap(filename, json_filename=json_filename)
+    assert tm.get_dst_id('1') == 'a'
+    assert tm.get_hash('1') == 'abc'
+    tm.unmap('1')
+    tm.persist()
+    tm.close()
+
+    # the migration only happens once
+    tm = SqliteTaskMap(filename, json_filename=json_filename)
+    assert tm.try_get_dst_id('1') is False
+    tm.close()
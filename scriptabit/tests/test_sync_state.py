@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+import json
+import os
+import pytest
+import pytz
+
+from datetime import datetime
+from tempfile import mkdtemp
+from scriptabit import SyncState, TaskMap, SqliteTaskMap
+from scriptabit.atomic_file import atomic_write
+
+from .task_implementations import MockTask
+
+
+@pytest.fixture
+def tmpdir_name():
+    return mkdtemp()
+
+
+def test_atomic_write(tmpdir_name):
+    filename = os.path.join(tmpdir_name, 'data')
+    atomic_write(filename, 'one')
+    atomic_write(filename, 'two')
+    with open(filename) as f:
+        assert f.read() == 'two'
+    assert os.listdir(tmpdir_name) == ['data']
+
+
+def test_atomic_write_failure_keeps_original(tmpdir_name):
+    filename = os.path.join(tmpdir_name, 'data')
+    atomic_write(filename, 'one')
+    with pytest.raises(TypeError):
+        atomic_write(filename, 42)
+    with open(filename) as f:
+        assert f.read() == 'one'
+    assert os.listdir(tmpdir_name) == ['data']
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_round_trip(tmpdir_name, backend):
+    filename = os.path.join(tmpdir_name, 'state')
+    last_sync = datetime(2016, 8, 15, 10, 30, tzinfo=pytz.utc)
+
+    state = SyncState.load(filename, backend=backend)
+    assert state.last_sync is None
+    state.task_map.map(MockTask(_id='1'), MockTask(_id='a'))
+    state.task_map.set_hash('1', 'abc')
+    state.last_sync = last_sync
+    state.metadata['1'] = {'board': 'x'}
+    state.save(filename)
+    state.close()
+
+    actual = SyncState.load(filename, backend=backend)
+    assert actual.task_map.get_dst_id('1') == 'a'
+    assert actual.task_map.get_hash('1') == 'abc'
+    assert actual.last_sync == last_sync
+    assert actual.metadata == {'1': {'board': 'x'}}
+    actual.close()
+
+
+def test_json_state_is_versioned(tmpdir_name):
+    filename = os.path.join(tmpdir_name, 'state')
+    SyncState().save(filename)
+    with open(filename) as f:
+        assert json.load(f)['version'] == SyncState.VERSION
+
+
+def test_newer_version_is_rejected(tmpdir_name):
+    filename = os.path.join(tmpdir_name, 'state')
+    with open(filename, 'w') as f:
+        json.dump({'version': SyncState.VERSION + 1}, f)
+    with pytest.raises(ValueError):
+        SyncState.load(filename)
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_legacy_task_map_is_imported(tmpdir_name, backend):
+    legacy = os.path.join(tmpdir_name, 'map')
+    old = TaskMap()
+    old.map(MockTask(_id='1'), MockTask(_id='a'))
+    old.persist(legacy)
+
+    state = SyncState.load(
+        os.path.join(tmpdir_name, 'state'),
+        backend=backend,
+        legacy_task_map_file=legacy)
+    assert state.task_map.get_dst_id('1') == 'a'
+    state.close()
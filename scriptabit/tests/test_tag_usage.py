@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import (
+    absolute_import,
+    division,
+    print_function,
+    unicode_literals,
+)
+from builtins import *
+from datetime import datetime
+
+import pytz
+
+from scriptabit import TagUsage
+
+TAGS = [
+    {'id': 'a', 'name': 'alpha'},
+    {'id': 'b', 'name': 'beta'},
+    {'id': 'c', 'name': 'gamma'},
+]
+
+TASKS = [
+    {'id': '1', 'tags': ['a', 'b'], 'updatedAt': '2016-08-01T00:00:00.000Z'},
+    {'id': '2', 'tags': ['a'], 'updatedAt': '2016-08-03T00:00:00.000Z'},
+    {
+        'id': '3',
+        'tags': ['b', 'deleted'],
+        'updatedAt': '2016-08-02T00:00:00.000Z',
+        'dateCompleted': '2016-08-05T00:00:00.000Z',
+    },
+    {'id': '4', 'tags': []},
+]
+
+
+def test_counts_and_task_ids():
+    usage = TagUsage(TAGS, TASKS)
+    assert usage.count('a') == 2
+    assert usage.count('c') == 0
+    assert usage.task_ids('b') == ['1', '3']
+    assert usage.task_ids('deleted') == ['3']
+
+
+def test_unused():
+    assert TagUsage(TAGS, TASKS).unused() == {'c': TAGS[2]}
+    assert TagUsage(TAGS, []).unused() == {t['id']: t for t in TAGS}
+
+
+def test_last_used_includes_completion():
+    usage = TagUsage(TAGS, TASKS)
+    assert usage.last_used('a') == datetime(2016, 8, 3, tzinfo=pytz.utc)
+    assert usage.last_used('b') == datetime(2016, 8, 5, tzinfo=pytz.utc)
+    assert usage.last_used('c') is None
+
+
+def test_report():
+    report = TagUsage(TAGS, TASKS).report()
+    assert [(r['name'], r['count']) for r in report] == \
+        [('alpha', 2), ('beta', 2), ('gamma', 0)]
+    assert report[2]['last_used'] is None
+
+
+def test_duplicate_tags_on_a_task_are_counted_once():
+    usage = TagUsage(TAGS, [{'id': '1', 'tags': ['a', 'a']}])
+    assert usage.count('a') == 1
@@ -135,3 +135,23 @@ def test_copy_fields():
     assert a.status == b.status
     assert a.due_date == b.due_date
     assert a.checklist == b.checklist
+
+def test_content_hash():
+    due_date = datetime(2016, 7, 27, 6, 41, 34, 391000, tzinfo=pytz.utc)
+    a = MockTask('111', name='a task', description='something',
+                 due_date=due_date)
+    a.checklist = [ChecklistItem('item 1', False)]
+    b = MockTask('222', status=SyncStatus.updated).copy_fields(a)
+
+    assert a.content_hash() == b.content_hash()
+
+    b.checklist = [ChecklistItem('item 1', True)]
+    assert a.content_hash() != b.content_hash()
+
+def test_content_hash_description():
+    a = MockTask('111', name='a task', description='something')
+    b = MockTask('222', name='a task', description='something else')
+
+    assert a.content_hash() != b.content_hash()
+    assert a.content_hash(include_description=False) == \
+        b.content_hash(include_description=False)
@@ -6,6 +6,7 @@ from __future__ import (
     unicode_literals,
 )
 from builtins import *
+import os
 import sys
 import json
 import pytest
@@ -135,3 +136,36 @@ class TestTaskMap(object):
         self.tm.unmap(self.src.id)
         assert not self.tm.try_get_dst_id(self.src.id)
         assert not self.tm.try_get_src_id(self.dst.id)
+
+
+def test_persist_content_hashes():
+    expected = TaskMap()
+    expected.map(MockTask(_id='aaa'), MockTask(_id='bbb'))
+    expected.set_hash('aaa', '1234')
+    filename = NamedTemporaryFile(suffix='.tm')
+    expected.persist(filename.name)
+    actual = TaskMap(filename.name)
+
+    assert actual.get_dst_id('aaa') == 'bbb'
+    assert actual.get_hash('aaa') == '1234'
+
+
+def test_load_original_format():
+    with NamedTemporaryFile(mode='w', suffix='.tm', delete=False) as f:
+        json.dump({'aaa': 'bbb'}, f)
+    tm = TaskMap(f.name)
+    os.remove(f.name)
+
+    assert tm.get_dst_id('aaa') == 'bbb'
+    assert tm.get_hash('aaa') is None
+
+
+def test_unmap_clears_hash():
+    tm = TaskMap()
+    tm.map(MockTask(_id='aaa'), MockTask(_id='bbb'))
+    tm.set_hash('aaa', '1234')
+    tm.unmap('aaa')
+
+    assert tm.get_hash('aaa') is None
+    with pytest.raises(KeyError):
+        tm.set_hash('aaa', '1234')
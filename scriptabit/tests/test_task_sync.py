@@ -11,12 +11,14 @@ import pytest
 import pytz
 import requests
 import requests_mock
+import time
 import uuid
 
 from datetime import datetime, timedelta
 from pkg_resources import resource_filename
 from random import randint, choice
 
+from concurrent.futures import TimeoutError
 from bidict import (
     KeyDuplicationError,
     ValueDuplicationError,
@@ -28,7 +30,8 @@ from scriptabit import (
     Task,
     TaskMap,
     Difficulty,
-    CharacterAttribute)
+    CharacterAttribute,
+    LatencyRecorder)
 
 from .task_implementations import MockTaskService, MockTask
 
@@ -352,3 +355,214 @@ def test_completion_of_existing_mapped_tasks():
     assert len(dst_svc.tasks) == 1
     assert dst_svc.tasks[0].completed
     assert dst_svc.tasks[0].status == SyncStatus.updated
+
+def test_touched_but_unchanged_tasks_are_not_updated():
+    src = random_task()
+    src_svc = MockTaskService([src])
+    dst = random_task()
+    dst_svc = MockTaskService([dst])
+
+    map = TaskMap()
+    map.map(src, dst)
+    map.set_hash(src.id, src.content_hash())
+
+    stats = TaskSync(src_svc, dst_svc, map).synchronise()
+
+    assert dst.status == SyncStatus.unchanged
+    assert stats.touched == 1
+    assert stats.updated == 0
+
+def test_update_records_content_hash():
+    src = random_task()
+    src_svc = MockTaskService([src])
+    dst = random_task()
+    dst_svc = MockTaskService([dst])
+
+    map = TaskMap()
+    map.map(src, dst)
+    map.set_hash(src.id, 'stale')
+
+    stats = TaskSync(src_svc, dst_svc, map).synchronise()
+
+    assert dst.status == SyncStatus.updated
+    assert stats.updated == 1
+    assert map.get_hash(src.id) == src.content_hash()
+
+def test_new_tasks_record_content_hash():
+    src = random_task()
+    map = TaskMap()
+
+    TaskSync(MockTaskService([src]), MockTaskService([]), map).synchronise()
+
+    assert map.get_hash(src.id) == src.content_hash()
+
+class SlowTaskService(MockTaskService):
+    def __init__(self, tasks, delay):
+        super().__init__(tasks)
+        self.delay = delay
+
+    def get_all_tasks(self):
+        time.sleep(self.delay)
+        return self.tasks
+
+def test_services_are_fetched_concurrently():
+    src_svc = SlowTaskService([random_task()], 0.3)
+    dst_svc = SlowTaskService([], 0.3)
+
+    start = time.time()
+    stats = TaskSync(src_svc, dst_svc, TaskMap()).synchronise()
+
+    assert time.time() - start < 0.55
+    assert stats.created == 1
+    assert stats.src_fetch_duration >= 0.3
+    assert stats.dst_fetch_duration >= 0.3
+
+def test_fetch_timeout(caplog):
+    src_svc = SlowTaskService([], 0)
+    dst_svc = SlowTaskService([], 0.5)
+
+    with pytest.raises(TimeoutError):
+        TaskSync(src_svc, dst_svc, TaskMap(), fetch_timeout=0.1).synchronise()
+    assert 'still running in the background' in caplog.text
+
+class FailingTaskService(MockTaskService):
+    def persist_tasks(self, tasks):
+        super().persist_tasks(tasks)
+        return [(t, Exception('failed')) for t in tasks]
+
+def test_persist_failures_are_counted_and_retried():
+    src = random_task()
+    dst = random_task()
+    dst_svc = FailingTaskService([dst])
+
+    map = TaskMap()
+    map.map(src, dst)
+    map.set_hash(src.id, 'stale')
+
+    sync = TaskSync(MockTaskService([src]), dst_svc, map)
+    stats = sync.synchronise()
+
+    assert stats.errors == 1
+    assert map.get_hash(src.id) is None
+    assert sync.retry_ids == [src.id]
+
+    # the next sync retries the task, although it hasn't changed since the
+    # last sync
+    dst.status = SyncStatus.unchanged
+    dst_svc = MockTaskService([dst])
+    sync = TaskSync(
+        MockTaskService([src]),
+        dst_svc,
+        map,
+        last_sync=sync.last_sync,
+        retry_ids=sync.retry_ids)
+    stats = sync.synchronise()
+
+    assert stats.updated == 1
+    assert dst.status == SyncStatus.updated
+    assert dst_svc.persisted_tasks == [dst]
+    assert map.get_hash(src.id) == src.content_hash()
+    assert sync.retry_ids == []
+
+def test_partial_sync_keeps_unfetched_retries():
+    retry_id = uuid.uuid4()
+    src_svc = PartialTaskService([], [])
+
+    sync = TaskSync(
+        src_svc,
+        MockTaskService([]),
+        TaskMap(),
+        retry_ids=[retry_id])
+    sync.synchronise()
+
+    assert sync.retry_ids == [retry_id]
+
+class PartialTaskService(MockTaskService):
+    def __init__(self, tasks, removed):
+        super().__init__(tasks)
+        self.removed = removed
+
+    @property
+    def partial(self):
+        return True
+
+    def get_removed_task_ids(self):
+        return self.removed
+
+def test_partial_sync_only_deletes_removed_tasks():
+    srcs = [random_task() for _ in range(3)]
+    dsts = [random_task() for _ in range(3)]
+    map = TaskMap()
+    for src, dst in zip(srcs, dsts):
+        map.map(src, dst)
+
+    # only the first task changed, and the second was removed
+    src_svc = PartialTaskService([srcs[0]], [srcs[1].id])
+    dst_svc = MockTaskService(dsts)
+
+    stats = TaskSync(src_svc, dst_svc, map).synchronise(clean_orphans=True)
+
+    assert stats.updated == 1
+    assert stats.deleted == 1
+    assert dsts[0].status == SyncStatus.updated
+    assert dsts[1].status == SyncStatus.deleted
+    assert dsts[2].status == SyncStatus.unchanged
+    assert map.try_get_dst_id(srcs[2].id) == dsts[2].id
+
+def test_source_fetch_timings_are_reported():
+    class TimedTaskService(MockTaskService):
+        @property
+        def fetch_timings(self):
+            return {'board one': 1.5}
+
+    src = TimedTaskService([random_task()])
+    dst = MockTaskService([])
+    stats = TaskSync(src, dst, TaskMap()).synchronise()
+
+    assert stats.src_fetch_timings == {'board one': 1.5}
+    assert 'board one: 1.50s' in str(stats)
+
+def test_phase_timings_and_latencies():
+    class RecordingTaskService(MockTaskService):
+        def __init__(self, tasks):
+            super().__init__(tasks)
+            self.recorder = LatencyRecorder()
+            self.recorder.record(99)  # from before the sync
+
+        @property
+        def latencies(self):
+            return self.recorder
+
+        def get_all_tasks(self):
+            self.recorder.record(0.25)
+            return super().get_all_tasks()
+
+    src = RecordingTaskService([random_task() for _ in range(3)])
+    dst = MockTaskService([])
+    stats = TaskSync(src, dst, TaskMap()).synchronise()
+
+    assert list(stats.phases) == list(TaskSync.Stats.PHASES)
+    assert stats.src_fetch_duration == stats.phases['src_fetch']
+    assert stats.src_latency['count'] == 1
+    assert stats.src_latency['p50'] == 0.25
+    assert stats.dst_latency is None
+    assert stats.src_tasks == 3
+    assert stats.tasks_per_second > 0
+    assert 'Source API calls: 1' in str(stats)
+
+def test_stats_history():
+    stats = TaskSync(
+        MockTaskService([random_task()]),
+        MockTaskService([]),
+        TaskMap()).synchronise()
+    stats.phases['state_save'] = 0.5
+
+    with NamedTemporaryFile(mode='r') as f:
+        stats.append_to_history(f.name)
+        stats.append_to_history(f.name)
+        history = [json.loads(line) for line in f]
+
+    assert len(history) == 2
+    assert history[0]['created'] == 1
+    assert history[0]['phases']['state_save'] == 0.5
+    assert history[0]['duration'] == stats.duration.total_seconds()
@@ -218,3 +218,22 @@ class TestUtilityFunctions(object):
             # the put method to set HP should not be called
             assert history[0].method == 'GET'
             assert len(history) == 1
+
+    def test_set_stats_in_one_request(self):
+        with requests_mock.mock() as m:
+            m.get('https://habitica.com/api/v3/user',
+                  text=get_fake_stats(hp=40, gp=10)[1])
+            m.put('https://habitica.com/api/v3/user',
+                  text=get_fake_stats(hp=20, gp=15, mp=5)[1])
+            uf = UtilityFunctions(MockConfig(), self.hs)
+            new = uf.set_stats({
+                'hp': (0.5, False, True),
+                'gp': (5, True, False),
+                'mp': (5, False, False),
+            })
+
+            history = m.request_history
+            assert [r.method for r in history] == ['GET', 'PUT']
+            assert sorted(history[1].text.split('&')) == \
+                ['stats.gp=15', 'stats.hp=20.0', 'stats.mp=5']
+            assert new == {'hp': 20, 'gp': 15, 'mp': 5}
@@ -12,7 +12,6 @@ from builtins import *
 import logging
 from datetime import datetime
 from pprint import pprint
-from time import sleep
 
 import configargparse
 from .dates import parse_date_local
@@ -35,38 +34,38 @@ class UtilityFunctions(object):
         self.__stat_setters = [
             {
                 'name': 'hp',
+                'stat': 'hp',
                 'type': float,
                 'default': -1.0,
                 'help': 'health points',
-                'setter': self.set_health,
             },
             {
                 'name': 'mp',
+                'stat': 'mp',
                 'type': float,
                 'default': -1.0,
                 'help': 'mana points',
-                'setter': self.set_mana,
             },
             {
                 'name': 'xp',
+                'stat': 'exp',
                 'type': int,
                 'default': -1,
                 'help': 'experience points',
-                'setter': self.set_xp,
             },
             {
                 'name': 'gp',
+                'stat': 'gp',
                 'type': float,
                 'default': -1.0,
                 'help': 'gold',
-                'setter': self.set_gold,
             },
             {
                 'name': 'level',
+                'stat': 'lvl',
                 'type': int,
                 'default': -1,
                 'help': 'character level',
-                'setter': self.set_level,
             },
         ]
 
@@ -182,58 +181,57 @@ class UtilityFunctions(object):
 
         config_dict = vars(self.__config)
 
-        # dispatch any setters, incrementers, and scaling args
+        # gather the setters, incrementers, and scaling args, so that all the
+        # stat changes are written in one request
+        changes = {}
         for stat in self.__stat_setters:
             arg = config_dict['set_'+stat['name']]
             inc_arg = config_dict['inc_'+stat['name']]
             scale_arg = config_dict['scale_'+stat['name']]
 
             if arg >= 0:
-                stat['setter'](arg)
+                changes[stat['stat']] = (arg, False, False)
             elif inc_arg != 0:
-                stat['setter'](inc_arg, increment=True)
+                changes[stat['stat']] = (inc_arg, True, False)
             elif scale_arg != 0:
-                stat['setter'](scale_arg, scale=True)
-
-    def __set_stat(
-            self,
-            name,
-            value,
-            hs_func,
-            lower_bound=0,
-            increment=False,
-            scale=False):
-        """Generic stat setter.
+                changes[stat['stat']] = (scale_arg, False, True)
+
+        if changes:
+            self.set_stats(changes)
+
+    def set_stats(self, changes, lower_bound=0):
+        """Sets several stats with a single request.
 
         Args:
-            name (str): The stat name
-            value: the new value
-            hs_func: The HabiticaService method that will set the stat.
-            lower_bound: Lower bound on the set value
-            increment (bool): If true, the value is treated as an increment
-                instead of the new value
-            scale (bool): If true, the current value is scaled by `value`.
+            changes (dict): (value, increment, scale) tuples keyed by stat
+                name. If increment is true, the value is added to the current
+                stat. If scale is true, the current stat is multiplied by the
+                value. Otherwise the value replaces the stat.
+            lower_bound: Lower bound on the set values.
 
         Returns:
-            The new stat value
+            dict: The new stat values, keyed by stat name.
         """
-        old = self.__hs.get_stats()[name]
-
-        if increment:
-            set_value = old + value
-        elif scale:
-            set_value = old * value
-        else:
-            set_value = value
-
-        set_value = max(lower_bound, set_value)
-        new = set_value if self.dry_run else hs_func(set_value)
-        logging.getLogger(__name__).info(
-            '%s changed from %f to %f',
-            name,
-            old,
-            new)
-        return new
+        old = self.__hs.get_stats()
+
+        values = {}
+        for name, (value, increment, scale) in changes.items():
+            if increment:
+                set_value = old[name] + value
+            elif scale:
+                set_value = old[name] * value
+            else:
+                set_value = value
+            values[name] = max(lower_bound, set_value)
+
+        new = values if self.dry_run else self.__hs.set_stats(values)
+        for name in sorted(values):
+            logging.getLogger(__name__).info(
+                '%s changed from %f to %f',
+                name,
+                old[name],
+                new[name])
+        return {name: new[name] for name in values}
 
     def set_health(self, hp, increment=False, scale=False):
         """Sets the user health to the specified value
@@ -241,12 +239,7 @@ class UtilityFunctions(object):
         Returns:
             float: The new health points.
         """
-        return self.__set_stat(
-            'hp',
-            hp,
-            self.__hs.set_hp,
-            increment=increment,
-            scale=scale)
+        return self.set_stats({'hp': (hp, increment, scale)})['hp']
 
     def set_xp(self, xp, increment=False, scale=False):
         """Sets the user experience points to the specified value.
@@ -254,12 +247,7 @@ class UtilityFunctions(object):
         Returns:
             int: The new experience points.
         """
-        return self.__set_stat(
-            'exp',
-            xp,
-            self.__hs.set_exp,
-            increment=increment,
-            scale=scale)
+        return self.set_stats({'exp': (xp, increment, scale)})['exp']
 
     def set_mana(self, mp, increment=False, scale=False):
         """Sets the user mana to the specified value
@@ -267,12 +255,7 @@ class UtilityFunctions(object):
         Returns:
             float: The new mana points.
         """
-        return self.__set_stat(
-            'mp',
-            mp,
-            self.__hs.set_mp,
-            increment=increment,
-            scale=scale)
+        return self.set_stats({'mp': (mp, increment, scale)})['mp']
 
     def set_gold(self, gp, increment=False, scale=False):
         """Sets the user gold to the specified value
@@ -280,12 +263,7 @@ class UtilityFunctions(object):
         Returns:
             float: The new gold points.
         """
-        return self.__set_stat(
-            'gp',
-            gp,
-            self.__hs.set_gp,
-            increment=increment,
-            scale=scale)
+        return self.set_stats({'gp': (gp, increment, scale)})['gp']
 
     def set_level(self, level, increment=False, scale=False):
         """Sets the user level to the specified value
@@ -293,12 +271,7 @@ class UtilityFunctions(object):
         Returns:
             float: The new gold points.
         """
-        return self.__set_stat(
-            'lvl',
-            level,
-            self.__hs.set_lvl,
-            increment=increment,
-            scale=scale)
+        return self.set_stats({'lvl': (level, increment, scale)})['lvl']
 
     def show_user_data(self):
         """Shows the user data"""
@@ -372,7 +345,6 @@ class UtilityFunctions(object):
             else:
                 data = {'message': "Dry run"}
             print(data['message'])
-            sleep(2)
 
     def __test(self):
         """A test function. Could do anything depending on what I am testing."""
@@ -102,6 +102,7 @@ setup(
         'configparser',
         'enum34',
         'future',
+        'futures; python_version < "3"',
         'iso8601',
         'pytz',
         'py-trello',
@@ -115,6 +116,9 @@ setup(
     # You can install these using the following syntax, for example:
     # $ pip install -e .[dev,test]
     extras_require={
+        'async': [
+            'aiohttp; python_version >= "3.5"',
+        ],
         'dev': [
             'bumpversion',
             'check-manifest',